@@ -0,0 +1,78 @@
+'''
+Microbenchmark of the chunk export path: pydub versus the NumPy codec.
+
+Usage: python -m AudioOps.benchmark [--seconds 60] [--chunk 10] [--repeat 50]
+'''
+import argparse
+import io
+import os
+import timeit
+import wave
+import numpy as np
+from AudioOps.codec import WavWriter, decode_mulaw
+
+# audioop was removed in Python 3.13 and pydub needs it, without them only the codec is timed
+try:
+    import audioop
+    from pydub import AudioSegment
+except ImportError:
+    audioop = None
+
+def pydub_chunks(recording, chunk_ms):
+    # The path the codec replaced: load the recording with pydub, then export every chunk
+    audio = AudioSegment.from_file(io.BytesIO(recording), format="wav")
+
+    chunks = []
+    for i, chunk_start in enumerate(range(0, len(audio), chunk_ms)):
+        buffer = io.BytesIO()
+        buffer.name = f"chunk_{i+1}.wav"
+        audio[chunk_start:chunk_start + chunk_ms].export(buffer, format="wav")
+        buffer.seek(0)
+        chunks.append(buffer.getvalue())
+
+    return chunks
+
+def codec_chunks(recording, chunk_ms, writer):
+    with wave.open(io.BytesIO(recording), 'rb') as wav:
+        sample_rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+
+    size = sample_rate * chunk_ms // 1000
+    return [writer.write(samples[start:start + size], sample_rate).getvalue() for start in range(0, len(samples), size)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=int, default=60, help='length of the recording')
+    parser.add_argument('--chunk', type=int, default=10, help='length of the chunks (in seconds)')
+    parser.add_argument('--repeat', type=int, default=50, help='number of times the recording is chunked')
+    args = parser.parse_args()
+
+    window = os.urandom(8000 * args.seconds)
+    samples = decode_mulaw(window)
+    writer = WavWriter()
+    recording = WavWriter().write(samples, 8000).getvalue()
+    chunk_ms = args.chunk * 1000
+
+    decode_time = timeit.timeit(lambda: decode_mulaw(window, out=samples), number=args.repeat)
+    codec_time = timeit.timeit(lambda: codec_chunks(recording, chunk_ms, writer), number=args.repeat)
+
+    print(f"{args.repeat} x {args.seconds}s recordings, {args.chunk}s chunks")
+    print(f"mu-law decode, codec: {decode_time / args.repeat * 1e3:.3f} ms/recording")
+    print(f"chunk export, codec: {codec_time / args.repeat * 1e3:.3f} ms/recording")
+
+    if audioop is None:
+        print("pydub: skipped, audioop is not available (removed in Python 3.13)")
+        return
+
+    # Both paths must produce the same samples and the same WAV files
+    assert np.array_equal(np.frombuffer(audioop.ulaw2lin(window, 2), dtype='<i2'), decode_mulaw(window))
+    assert pydub_chunks(recording, chunk_ms) == codec_chunks(recording, chunk_ms, writer)
+
+    audioop_time = timeit.timeit(lambda: audioop.ulaw2lin(window, 2), number=args.repeat)
+    pydub_time = timeit.timeit(lambda: pydub_chunks(recording, chunk_ms), number=args.repeat)
+
+    print(f"mu-law decode, audioop: {audioop_time / args.repeat * 1e3:.3f} ms/recording ({audioop_time / decode_time:.1f}x)")
+    print(f"chunk export, pydub: {pydub_time / args.repeat * 1e3:.3f} ms/recording ({pydub_time / codec_time:.1f}x)")
+
+if __name__ == '__main__':
+    main()
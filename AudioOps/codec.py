@@ -0,0 +1,126 @@
+import io
+import struct
+import numpy as np
+
+def _build_mulaw_table():
+    '''
+    This function builds the G.711 mu-law to PCM16 lookup table.
+
+    Returns:
+    - np.ndarray: 256 int16 samples, indexed by the mu-law byte
+    '''
+    encoded = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = encoded & 0x80
+    exponent = (encoded >> 4) & 0x07
+    mantissa = encoded & 0x0F
+
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+
+    return np.where(sign, -magnitude, magnitude).astype(np.int16)
+
+MULAW_TABLE = _build_mulaw_table()
+
+def decode_mulaw(data, out=None):
+    '''
+    This function decodes mu-law bytes to PCM16 samples with a table lookup.
+
+    Parameters:
+    - data: The mu-law bytes (bytes, bytearray, memoryview or uint8 array)
+    - out: A preallocated int16 array to decode into, it must hold at least len(data) samples
+        default: None (a new array is allocated)
+
+    Returns:
+    - np.ndarray: The int16 samples
+    '''
+    encoded = np.frombuffer(data, dtype=np.uint8)
+
+    if out is None:
+        out = np.empty(len(encoded), dtype=np.int16)
+    else:
+        out = out[:len(encoded)]
+
+    return np.take(MULAW_TABLE, encoded, out=out)
+
+def resample(samples, source_rate, target_rate):
+    '''
+    This function resamples int16 samples with linear interpolation.
+
+    Parameters:
+    - samples: The int16 samples
+    - source_rate: The sample rate of the input
+    - target_rate: The sample rate of the output
+
+    Returns:
+    - np.ndarray: The resampled int16 samples
+    '''
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+
+    length = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(length) * (source_rate / target_rate)
+    resampled = np.interp(positions, np.arange(len(samples)), samples)
+
+    return resampled.astype(np.int16)
+
+class WavWriter:
+    '''
+    This class frames PCM16 samples as a WAV file in a reusable in-memory buffer.
+    '''
+    header = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+    def __init__(self, sample_rate=8000, channels=1, name='chunk.wav'):
+        '''
+        Parameters:
+        - sample_rate: The default sample rate of the written audio
+            default: 8000
+        - channels: The default number of channels of the written audio
+            default: 1
+        - name: The file name reported by the buffer (used by the STT upload)
+            default: chunk.wav
+        '''
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.buffer = io.BytesIO()
+        self.buffer.name = name
+
+    def write(self, samples, sample_rate=None, channels=None, name=None):
+        '''
+        This method writes the samples to the buffer as a WAV file, overwriting the previous one.
+
+        Parameters:
+        - samples: int16 array or raw little endian PCM16 bytes
+        - sample_rate: The sample rate of the samples
+            default: the writer's sample rate
+        - channels: The number of interleaved channels in the samples
+            default: the writer's number of channels
+        - name: The file name reported by the buffer
+            default: unchanged
+
+        Returns:
+        - io.BytesIO: The buffer, rewound to the start of the WAV file
+        '''
+        sample_rate = sample_rate or self.sample_rate
+        channels = channels or self.channels
+
+        if isinstance(samples, np.ndarray):
+            data = samples.astype('<i2', copy=False).data
+        else:
+            data = memoryview(samples)
+
+        size = data.nbytes
+        block_align = channels * 2
+
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.buffer.write(self.header.pack(
+            b'RIFF', 36 + size, b'WAVE',
+            b'fmt ', 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16,
+            b'data', size
+        ))
+        self.buffer.write(data)
+        self.buffer.seek(0)
+
+        if name:
+            self.buffer.name = name
+
+        return self.buffer
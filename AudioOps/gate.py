@@ -0,0 +1,109 @@
+import logging
+import threading
+import numpy as np
+from AudioOps.vad import VADSegmenter
+
+class SpeechGate:
+    '''
+    This class decides, before any STT request is made, whether a chunk contains enough speech to transcribe.
+    '''
+
+    def __init__(self, sample_rate=8000, enabled=True, min_rms_db=-45.0, min_speech_ratio=0.3, vad=None):
+        '''
+        Parameters:
+        - sample_rate: The sample rate of the chunks
+            default: 8000
+        - enabled: Whether chunks are gated at all, a disabled gate passes everything but still counts
+            default: True
+        - min_rms_db: Chunks quieter than this are skipped (in dBFS)
+            default: -45.0
+        - min_speech_ratio: Chunks with a lower fraction of speech frames are skipped
+            default: 0.3
+        - vad: The segmenter used to classify frames
+            default: None (a VADSegmenter with default thresholds)
+        '''
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.min_rms_db = min_rms_db
+        self.min_speech_ratio = min_speech_ratio
+        self.vad = vad or VADSegmenter(sample_rate=sample_rate)
+
+        self.passed = 0
+        self.skipped = 0
+        self.passed_seconds = 0.0
+        self.skipped_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def measure(self, samples):
+        '''
+        This method computes the loudness and speech content of a chunk.
+
+        Parameters:
+        - samples: int16 samples
+
+        Returns:
+        - float: RMS level of the chunk (in dBFS)
+        - float: Fraction of frames classified as speech
+        '''
+        if len(samples) == 0:
+            return -np.inf, 0.0
+
+        values = samples.astype(np.float32)
+        rms = np.sqrt(np.mean(values * values))
+        rms_db = 20 * np.log10(max(rms, 1.0) / 32768.0)
+
+        frame_size = self.vad.frame_size
+        n_frames = len(samples) // frame_size
+        if n_frames == 0:
+            return rms_db, 0.0
+
+        frames = samples[:n_frames * frame_size].reshape(n_frames, frame_size)
+        speech_ratio = np.count_nonzero(self.vad.speech_frames(frames)) / n_frames
+
+        return rms_db, speech_ratio
+
+    def check(self, samples):
+        '''
+        This method decides whether a chunk should be sent to the STT provider and records the decision.
+
+        Parameters:
+        - samples: int16 samples
+
+        Returns:
+        - bool: True if the chunk should be transcribed
+        '''
+        duration = len(samples) / self.sample_rate
+
+        if self.enabled:
+            rms_db, speech_ratio = self.measure(samples)
+            allowed = rms_db >= self.min_rms_db and speech_ratio >= self.min_speech_ratio
+        else:
+            allowed = True
+
+        with self._lock:
+            if allowed:
+                self.passed += 1
+                self.passed_seconds += duration
+            else:
+                self.skipped += 1
+                self.skipped_seconds += duration
+
+        if not allowed:
+            logging.info(f'Speech gate skipped {duration:.1f}s chunk (rms: {rms_db:.1f} dBFS, speech ratio: {speech_ratio:.2f})')
+
+        return allowed
+
+    def metrics(self):
+        '''
+        This method returns the gate counters.
+
+        Returns:
+        - dict: Passed and skipped chunk counts and durations
+        '''
+        with self._lock:
+            return {
+                'passed': self.passed,
+                'skipped': self.skipped,
+                'passed_seconds': round(self.passed_seconds, 2),
+                'skipped_seconds': round(self.skipped_seconds, 2),
+            }
@@ -0,0 +1,132 @@
+import subprocess
+import tempfile
+import wave
+import numpy as np
+
+class AudioReader:
+    '''
+    This class reads a recording as a stream of mono PCM16 blocks, so memory use does not grow with its length.
+    PCM WAV files are read directly, every other format is decoded incrementally by an ffmpeg subprocess.
+    '''
+
+    def __init__(self, path, block_ms=500, sample_rate=16000, ffmpeg='ffmpeg'):
+        '''
+        Parameters:
+        - path: The path of the recording
+        - block_ms: The length of the blocks yielded (in milliseconds)
+            default: 500
+        - sample_rate: The sample rate ffmpeg decodes to, WAV files keep their own sample rate
+            default: 16000
+        - ffmpeg: The ffmpeg executable
+            default: ffmpeg
+        '''
+        self.path = path
+        self.block_ms = block_ms
+        self.sample_rate = sample_rate
+        self.ffmpeg = ffmpeg
+
+        self._wav = None
+        self._process = None
+        self._stderr = None
+        self._open()
+
+    def _open(self):
+        try:
+            self._wav = wave.open(self.path, 'rb')
+            self.sample_rate = self._wav.getframerate()
+            self.channels = self._wav.getnchannels()
+            self.sample_width = self._wav.getsampwidth()
+            return
+        except (wave.Error, EOFError):
+            # Not a PCM WAV file (compressed audio, or a WAV with another codec)
+            if self._wav:
+                self._wav.close()
+            self._wav = None
+
+        self.channels = 1
+        self.sample_width = 2
+
+        # The errors go to a file, a pipe nobody reads until the end could fill up and block ffmpeg
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._process = subprocess.Popen(
+                [self.ffmpeg, '-nostdin', '-loglevel', 'error', '-i', self.path,
+                 '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(self.sample_rate), '-'],
+                stdout=subprocess.PIPE,
+                stderr=self._stderr,
+            )
+        except OSError:
+            self._stderr.close()
+            raise
+
+    def __iter__(self):
+        frames = self.sample_rate * self.block_ms // 1000
+
+        while True:
+            if self._wav:
+                data = self._wav.readframes(frames)
+            else:
+                data = self._process.stdout.read(frames * self.sample_width)
+
+            if not data:
+                break
+
+            yield self._to_mono_pcm16(data)
+
+        # ffmpeg may still be exiting after closing its output
+        if self._process:
+            self._process.wait()
+
+        self.close()
+
+    def _to_mono_pcm16(self, data):
+        if self.sample_width == 1:
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8
+        elif self.sample_width == 3:
+            # 24 bit samples keep their two most significant bytes
+            raw = np.frombuffer(data[:len(data) - len(data) % 3], dtype=np.uint8).reshape(-1, 3)
+            samples = raw[:, 1:].copy().view('<i2').reshape(-1)
+        elif self.sample_width == 4:
+            samples = (np.frombuffer(data, dtype='<i4') >> 16).astype(np.int16)
+        else:
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype='<i2')
+
+        if self.channels > 1:
+            usable = len(samples) - len(samples) % self.channels
+            samples = samples[:usable].reshape(-1, self.channels).mean(axis=1).astype(np.int16)
+
+        return samples
+
+    def close(self):
+        '''
+        This method releases the file or the ffmpeg process.
+        Raises RuntimeError if ffmpeg exited with an error after decoding the whole recording.
+        '''
+        if self._wav:
+            self._wav.close()
+            self._wav = None
+
+        if self._process:
+            # Stopped before the end of the recording
+            if self._process.poll() is None:
+                self._process.terminate()
+                finished = False
+            else:
+                finished = True
+
+            self._process.stdout.close()
+            returncode = self._process.wait()
+            self._stderr.seek(0)
+            error = self._stderr.read().decode(errors='replace')
+            self._stderr.close()
+            self._stderr = None
+            self._process = None
+
+            if finished and returncode:
+                raise RuntimeError(f'ffmpeg failed to decode {self.path}: {error.strip()}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
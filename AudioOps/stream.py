@@ -0,0 +1,130 @@
+import base64
+import logging
+
+class MulawRingBuffer:
+    '''
+    This class buffers the mu-law media frames of a single call in a preallocated ring
+    and hands out fixed size windows as soon as enough audio has arrived.
+    '''
+
+    def __init__(self, window_ms=10 * 1000, sample_rate=8000, capacity_ms=None):
+        '''
+        Parameters:
+        - window_ms: The length of a window handed out for transcription (in milliseconds)
+            default: 10000
+        - sample_rate: The sample rate of the media stream (Twilio sends 8 kHz mu-law)
+            default: 8000
+        - capacity_ms: The amount of audio the ring can hold before the oldest audio is dropped
+            default: twice the window length
+        '''
+        self.sample_rate = sample_rate
+        self.window_size = sample_rate * window_ms // 1000
+
+        if capacity_ms is None:
+            self.capacity = 2 * self.window_size
+        else:
+            self.capacity = max(sample_rate * capacity_ms // 1000, self.window_size)
+
+        self._buffer = bytearray(self.capacity)
+        self._view = memoryview(self._buffer)
+
+        # Monotonic byte counters, the ring position is the counter modulo capacity
+        self._written = 0
+        self._read = 0
+
+        self.dropped = 0
+
+    def __len__(self):
+        return self._written - self._read
+
+    def ingest(self, payload):
+        '''
+        This method decodes a base64 media payload (as sent by Twilio) into the ring.
+
+        Parameters:
+        - payload: The base64 encoded mu-law payload
+        '''
+        self.write(base64.b64decode(payload))
+
+    def write(self, data):
+        '''
+        This method copies raw mu-law bytes into the ring, dropping the oldest audio on overflow.
+
+        Parameters:
+        - data: The raw mu-law bytes
+        '''
+        size = len(data)
+        if size == 0:
+            return
+
+        # Only the tail of an oversized write can ever be read back
+        if size > self.capacity:
+            self.dropped += size - self.capacity
+            data = memoryview(data)[size - self.capacity:]
+            size = self.capacity
+
+        overflow = len(self) + size - self.capacity
+        if overflow > 0:
+            self._drop(overflow)
+
+        start = self._written % self.capacity
+        first = min(size, self.capacity - start)
+        self._view[start:start + first] = data[:first]
+        if first < size:
+            self._view[:size - first] = data[first:]
+
+        self._written += size
+
+    def _drop(self, amount):
+        self._read += amount
+        self.dropped += amount
+        logging.warning(f'Audio ring buffer overflow, dropped {amount} bytes')
+
+    def pop(self, size):
+        '''
+        This method removes and returns the oldest `size` bytes from the ring.
+
+        Parameters:
+        - size: The number of bytes to read
+
+        Returns:
+        - bytes: The mu-law audio
+        '''
+        size = min(size, len(self))
+        start = self._read % self.capacity
+        first = min(size, self.capacity - start)
+
+        if first == size:
+            data = bytes(self._view[start:start + size])
+        else:
+            data = bytes(self._view[start:]) + bytes(self._view[:size - first])
+
+        self._read += size
+        return data
+
+    def windows(self):
+        '''
+        This method yields every complete window currently held in the ring.
+
+        Returns:
+        - generator: mu-law windows of `window_size` bytes
+        '''
+        while len(self) >= self.window_size:
+            yield self.pop(self.window_size)
+
+    def flush(self, min_ms=0):
+        '''
+        This method returns whatever audio is left in the ring, for example when the call ends.
+
+        Parameters:
+        - min_ms: Discard the remainder if it is shorter than this (in milliseconds)
+            default: 0
+
+        Returns:
+        - bytes: The remaining mu-law audio, or None if there is not enough left
+        '''
+        if len(self) == 0 or len(self) < self.sample_rate * min_ms // 1000:
+            self._read = self._written
+            return None
+
+        return self.pop(len(self))
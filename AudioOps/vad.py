@@ -0,0 +1,211 @@
+from collections import deque
+import numpy as np
+
+class VADSegmenter:
+    '''
+    This class splits PCM16 audio into utterance aligned segments using frame energy and zero crossing rate.
+    It can be fed incrementally (live calls) or run over a whole recording.
+    '''
+
+    def __init__(self, sample_rate=8000, frame_ms=30, energy_threshold=-40.0, zcr_threshold=0.25,
+                 min_segment_ms=1000, max_segment_ms=15 * 1000, silence_ms=600, padding_ms=200):
+        '''
+        Parameters:
+        - sample_rate: The sample rate of the audio
+            default: 8000
+        - frame_ms: The analysis frame length (in milliseconds)
+            default: 30
+        - energy_threshold: Frames quieter than this are silence (in dBFS)
+            default: -40.0
+        - zcr_threshold: Frames near the energy threshold with a higher zero crossing rate are treated as noise
+            default: 0.25
+        - min_segment_ms: Utterances shorter than this are carried over into the next segment, or dropped
+            when no speech follows them within silence_ms
+            default: 1000
+        - max_segment_ms: Segments are cut once they reach this length
+            default: 15000
+        - silence_ms: The amount of silence that ends an utterance
+            default: 600
+        - padding_ms: The amount of audio kept before and after each utterance
+            default: 200
+        '''
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.energy_threshold = energy_threshold
+        self.zcr_threshold = zcr_threshold
+
+        self.min_frames = max(1, min_segment_ms // frame_ms)
+        self.max_frames = max(self.min_frames, max_segment_ms // frame_ms)
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.padding_frames = padding_ms // frame_ms
+
+        self.reset()
+
+    def reset(self):
+        '''
+        This method clears all streaming state.
+        '''
+        self._pending = np.empty(0, dtype=np.int16)
+        self._preroll = deque(maxlen=self.padding_frames)
+        self._frames = []
+        self._speech = 0
+        self._silence = 0
+        self._carried = False
+
+    def frame_features(self, frames):
+        '''
+        This method computes the energy and zero crossing rate of every frame.
+
+        Parameters:
+        - frames: int16 array of shape (n_frames, frame_size)
+
+        Returns:
+        - np.ndarray: Frame energy (in dBFS)
+        - np.ndarray: Frame zero crossing rate (crossings per sample)
+        '''
+        samples = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        energy = 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / self.frame_size
+
+        return energy, zcr
+
+    def speech_frames(self, frames):
+        '''
+        This method classifies every frame as speech or not.
+
+        Parameters:
+        - frames: int16 array of shape (n_frames, frame_size)
+
+        Returns:
+        - np.ndarray: Boolean speech flag per frame
+        '''
+        energy, zcr = self.frame_features(frames)
+
+        # Quiet noise has a high crossing rate, loud frames are speech regardless
+        loud = energy > self.energy_threshold + 10
+        voiced = (energy > self.energy_threshold) & (zcr < self.zcr_threshold)
+
+        return loud | voiced
+
+    def push(self, samples):
+        '''
+        This method feeds audio to the segmenter.
+
+        Parameters:
+        - samples: int16 samples
+
+        Returns:
+        - list: The segments (int16 arrays) completed by this audio
+        '''
+        samples = np.concatenate((self._pending, samples)) if len(self._pending) else np.asarray(samples, dtype=np.int16)
+
+        n_frames = len(samples) // self.frame_size
+        self._pending = samples[n_frames * self.frame_size:].copy()
+        if n_frames == 0:
+            return []
+
+        frames = samples[:n_frames * self.frame_size].reshape(n_frames, self.frame_size)
+        flags = self.speech_frames(frames)
+
+        segments = []
+        for frame, is_speech in zip(frames, flags):
+            if is_speech:
+                if not self._frames:
+                    self._frames.extend(self._preroll)
+                    self._preroll.clear()
+                self._frames.append(frame)
+                self._speech += 1
+                self._silence = 0
+                self._carried = False
+            elif self._frames:
+                self._frames.append(frame)
+                self._silence += 1
+                if self._silence >= self.silence_frames:
+                    segments.extend(self._end_utterance())
+            elif self.padding_frames:
+                self._preroll.append(frame)
+
+            if len(self._frames) >= self.max_frames:
+                # A segment cut at max_frames is only sent when it holds enough speech
+                if self._speech >= self.min_frames:
+                    segments.append(self._emit())
+                else:
+                    self._drop()
+
+        return segments
+
+    def flush(self):
+        '''
+        This method ends the stream and returns the final segment, if it is long enough.
+
+        Returns:
+        - list: The remaining segment (int16 arrays)
+        '''
+        segments = []
+        if self._frames and self._speech >= self.min_frames:
+            self._trim_silence()
+            segments.append(self._emit())
+
+        self.reset()
+        return segments
+
+    def segment(self, samples):
+        '''
+        This method splits a whole recording into segments.
+
+        Parameters:
+        - samples: int16 samples
+
+        Returns:
+        - list: The segments (int16 arrays)
+        '''
+        self.reset()
+        return self.push(samples) + self.flush()
+
+    def stream(self, blocks):
+        '''
+        This method segments audio that arrives as a sequence of blocks.
+
+        Parameters:
+        - blocks: An iterable of int16 sample blocks
+
+        Returns:
+        - generator: The segments (int16 arrays), each yielded as soon as it is complete
+        '''
+        self.reset()
+        for block in blocks:
+            yield from self.push(block)
+        yield from self.flush()
+
+    def _end_utterance(self):
+        self._trim_silence()
+
+        # Too short to be worth a transcription, keep it for one more pause in case the next utterance follows
+        if self._speech < self.min_frames:
+            if self._carried:
+                self._drop()
+            else:
+                self._carried = True
+            return []
+
+        return [self._emit()]
+
+    def _trim_silence(self):
+        excess = self._silence - self.padding_frames
+        if excess > 0:
+            del self._frames[-excess:]
+        self._silence = 0
+
+    def _emit(self):
+        segment = np.concatenate(self._frames)
+        self._drop()
+        return segment
+
+    def _drop(self):
+        self._frames = []
+        self._speech = 0
+        self._silence = 0
+        self._carried = False
@@ -0,0 +1,199 @@
+import logging
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+FULL = 'full'
+DEGRADED = 'degraded'
+KEYWORD = 'keyword'
+REJECTED = 'rejected'
+
+class AdmissionController:
+    '''
+    This class decides how much analysis a new call gets, based on the calls already running
+    and the requests waiting on the STT/LLM providers.
+    - full: the normal pipeline
+    - degraded: longer chunks (fewer provider requests) analysed by a cheaper model
+    - keyword: no STT/LLM requests, the streaming transcripts are screened for fraud keywords
+    - rejected: the call is not analysed at all
+    Calls keep the mode they were admitted with, only new calls are degraded.
+    '''
+
+    def __init__(self, degrade_calls=10, keyword_calls=25, max_calls=0, degrade_inflight=8, keyword_inflight=16,
+                 chunk_factor=2.0, degraded_model=None):
+        '''
+        Parameters:
+        - degrade_calls: Active calls from which new calls are degraded (0 disables the threshold)
+            default: 10
+        - keyword_calls: Active calls from which new calls only get keyword screening (0 disables the threshold)
+            default: 25
+        - max_calls: Active calls from which new calls are rejected
+            default: 0 (never)
+        - degrade_inflight: In-flight provider requests from which new calls are degraded (0 disables the threshold)
+            default: 8
+        - keyword_inflight: In-flight provider requests from which new calls only get keyword screening (0 disables the threshold)
+            default: 16
+        - chunk_factor: How much longer the chunks of degraded calls are
+            default: 2.0
+        - degraded_model: The LLM used for degraded calls
+            default: None (the normal model)
+        '''
+        self.degrade_calls = degrade_calls
+        self.keyword_calls = keyword_calls
+        self.max_calls = max_calls
+        self.degrade_inflight = degrade_inflight
+        self.keyword_inflight = keyword_inflight
+        self.chunk_factor = chunk_factor
+        self.degraded_model = degraded_model
+
+        self._calls = {}
+        self._inflight = Counter()
+        self._requests = Counter()
+        self._decisions = Counter()
+        self._peak_inflight = 0
+        self._lock = threading.Lock()
+
+    def admit(self, call_id):
+        '''
+        This method decides the mode of a new call and counts it as active unless it is rejected.
+
+        Parameters:
+        - call_id: The id of the call
+
+        Returns:
+        - str: full, degraded, keyword or rejected
+        '''
+        with self._lock:
+            active = len(self._calls)
+            inflight = sum(self._inflight.values())
+
+            if self.max_calls and active >= self.max_calls:
+                mode = REJECTED
+            elif self._over(active, self.keyword_calls) or self._over(inflight, self.keyword_inflight):
+                mode = KEYWORD
+            elif self._over(active, self.degrade_calls) or self._over(inflight, self.degrade_inflight):
+                mode = DEGRADED
+            else:
+                mode = FULL
+
+            self._decisions[mode] += 1
+            if mode != REJECTED:
+                self._calls[call_id] = mode
+
+        if mode != FULL:
+            logging.warning(f'Call {call_id} admitted as {mode} ({active} active calls, {inflight} in-flight requests)')
+
+        return mode
+
+    def release(self, call_id):
+        '''
+        This method stops counting a finished call.
+
+        Parameters:
+        - call_id: The id of the call
+        '''
+        with self._lock:
+            self._calls.pop(call_id, None)
+
+    def settings(self, mode, vad_settings, model):
+        '''
+        This method adapts the analysis settings to the mode of a call.
+
+        Parameters:
+        - mode: The mode returned by admit
+        - vad_settings: The normal VADSegmenter settings (dict)
+        - model: The normal LLM
+
+        Returns:
+        - dict: The VADSegmenter settings of the call
+        - str: The LLM of the call
+        '''
+        if mode != DEGRADED:
+            return vad_settings, model
+
+        # Longer chunks mean fewer STT and LLM requests per call
+        vad_settings = dict(vad_settings)
+        for key in ('min_segment_ms', 'max_segment_ms'):
+            if key in vad_settings:
+                vad_settings[key] = int(vad_settings[key] * self.chunk_factor)
+
+        return vad_settings, self.degraded_model or model
+
+    @contextmanager
+    def provider_request(self, provider):
+        '''
+        This context manager counts a request to a provider while it is in flight, it can be used from any thread.
+
+        Parameters:
+        - provider: The name of the provider (e.g. stt, llm)
+        '''
+        with self._lock:
+            self._inflight[provider] += 1
+            self._requests[provider] += 1
+            self._peak_inflight = max(self._peak_inflight, sum(self._inflight.values()))
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight[provider] -= 1
+
+    def metrics(self):
+        '''
+        This method returns the admission counters.
+
+        Returns:
+        - dict: Active calls per mode, in-flight and total provider requests and the decisions taken so far
+        '''
+        with self._lock:
+            return {
+                'active_calls': dict(Counter(self._calls.values())),
+                'inflight': {provider: count for provider, count in self._inflight.items() if count},
+                'peak_inflight': self._peak_inflight,
+                'requests': dict(self._requests),
+                'decisions': dict(self._decisions),
+            }
+
+    @staticmethod
+    def _over(value, threshold):
+        return bool(threshold) and value >= threshold
+
+def keyword_verdict(transcript, keywords, heard=None, min_hits=2):
+    '''
+    This function screens a transcript for fraud keywords, it is the verdict of calls in keyword mode.
+    One generic keyword (e.g. "pin") is common in honest calls, so the call is only flagged as fraud once
+    min_hits different keywords have been heard, until then the verdict is need_more_time.
+
+    Parameters:
+    - transcript: The transcript
+    - keywords: The keywords or phrases (lowercase)
+    - heard: The set of keywords heard earlier in the call, updated with the new ones
+        default: None (only this transcript is screened)
+    - min_hits: The number of different keywords that make the call fraud
+        default: 2
+
+    Returns:
+    - str: A verdict in the format of the LLM responses, or None if no new keyword was heard
+    '''
+    text = transcript.lower()
+    hits = [keyword for keyword in keywords if re.search(rf'\b{re.escape(keyword)}\b', text)]
+
+    heard = heard if heard is not None else set()
+    new = [keyword for keyword in hits if keyword not in heard]
+    if not new:
+        return None
+    heard.update(new)
+
+    mentioned = ", ".join(sorted(heard))
+    if len(heard) < min_hits:
+        return (
+            'Decision: need_more_time\n'
+            f'Reasoning: The caller mentioned {mentioned} (keyword screening only, the call was not fully analysed)\n'
+            'Action: Be careful, do not share any OTP, PIN or account details on this call.'
+        )
+
+    return (
+        'Decision: fraud\n'
+        f'Reasoning: The caller mentioned {mentioned} (keyword screening only, the call was not fully analysed)\n'
+        'Action: Fraud! Do not share any personal or financial details and hang up.'
+    )
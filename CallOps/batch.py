@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+class BatchAnalyzer:
+    '''
+    This class analyses a batch of recorded calls concurrently and writes one verdict file per call.
+    Finished calls are recorded in a checkpoint file, so an interrupted batch resumes where it stopped.
+    '''
+    audio_extensions = ('.mp3', '.wav', '.m4a', '.ogg', '.flac', '.aac', '.webm')
+
+    def __init__(self, analyse, output_dir, workers=4, checkpoint_path=None):
+        '''
+        Parameters:
+        - analyse: Called with the path of a recording, returns the list of analysed chunks
+            as (chunk_index, transcription, response_message) tuples, an exception marks the call failed
+            so the next run analyses it again
+        - output_dir: The directory the verdict files are written to
+        - workers: The number of calls analysed at the same time
+            default: 4
+        - checkpoint_path: The checkpoint file
+            default: checkpoint.jsonl in the output directory
+        '''
+        self.analyse = analyse
+        self.output_dir = output_dir
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path or os.path.join(output_dir, 'checkpoint.jsonl')
+        self._lock = threading.Lock()
+
+        os.makedirs(output_dir, exist_ok=True)
+
+    def discover(self, source):
+        '''
+        This method lists the recordings of a batch.
+
+        Parameters:
+        - source: A directory (searched recursively) or a manifest file with one path per line,
+            relative paths in a manifest are resolved against the manifest's directory
+
+        Returns:
+        - list: (call_id, path) tuples, the call_id is the relative path (extension included) and a short hash of it
+        '''
+        if os.path.isdir(source):
+            paths = []
+            for root, _, files in os.walk(source):
+                for name in files:
+                    if name.lower().endswith(self.audio_extensions):
+                        paths.append(os.path.join(root, name))
+            base = source
+        else:
+            base = os.path.dirname(os.path.abspath(source))
+            with open(source) as manifest:
+                lines = [line.strip() for line in manifest]
+            paths = [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+        calls = []
+        for path in sorted(paths):
+            # The readable part can collide (a/b.wav and a__b.wav), the hash of the relative path cannot
+            relative = os.path.relpath(path, base).replace(os.sep, '/')
+            digest = hashlib.sha1(relative.encode()).hexdigest()[:8]
+            call_id = f"{relative.replace('/', '__').replace('..', '_')}-{digest}"
+            calls.append((call_id, path))
+
+        return calls
+
+    def completed(self):
+        '''
+        This method reads the checkpoint file.
+
+        Returns:
+        - set: The ids of the calls that were analysed successfully
+        '''
+        if not os.path.exists(self.checkpoint_path):
+            return set()
+
+        done = set()
+        with open(self.checkpoint_path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted run
+                    continue
+                if entry.get('status') == 'done':
+                    done.add(entry['call_id'])
+
+        return done
+
+    def run(self, source):
+        '''
+        This method analyses every recording of the batch that has not been completed yet.
+
+        Parameters:
+        - source: A directory or manifest file (see discover)
+
+        Returns:
+        - dict: Counts of analysed, failed and skipped calls
+        '''
+        calls = self.discover(source)
+        done = self.completed()
+        pending = [(call_id, path) for call_id, path in calls if call_id not in done]
+
+        logging.info(f'Batch: {len(calls)} calls, {len(calls) - len(pending)} already done, {len(pending)} to analyse')
+
+        summary = {'analysed': 0, 'failed': 0, 'skipped': len(calls) - len(pending)}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.analyse_call, call_id, path): call_id for call_id, path in pending}
+            for future in as_completed(futures):
+                if future.result():
+                    summary['analysed'] += 1
+                else:
+                    summary['failed'] += 1
+
+        return summary
+
+    def analyse_call(self, call_id, path):
+        '''
+        This method analyses one call, writes its verdict file and records it in the checkpoint.
+
+        Parameters:
+        - call_id: The id of the call
+        - path: The path of the recording
+
+        Returns:
+        - bool: True if the call was analysed successfully
+        '''
+        started = time.time()
+        try:
+            chunks = self.analyse(path)
+        except Exception as e:
+            logging.error(f'Error analysing call {call_id}: {str(e)}')
+            self._checkpoint({'call_id': call_id, 'path': path, 'status': 'failed', 'error': str(e)})
+            return False
+
+        verdict = {
+            'call_id': call_id,
+            'path': path,
+            'verdict': chunks[-1][2] if chunks else None,
+            'chunks': [
+                {'chunk': i, 'transcription': transcription, 'response': response}
+                for i, transcription, response in chunks
+            ],
+            'duration': round(time.time() - started, 2),
+        }
+
+        # Write to a temporary file first so a verdict file is never half written
+        verdict_path = os.path.join(self.output_dir, f'{call_id}.json')
+        with open(verdict_path + '.tmp', 'w') as verdict_file:
+            json.dump(verdict, verdict_file, indent=2)
+        os.replace(verdict_path + '.tmp', verdict_path)
+
+        self._checkpoint({'call_id': call_id, 'path': path, 'status': 'done'})
+        logging.info(f'Call {call_id} analysed in {verdict["duration"]}s')
+
+        return True
+
+    def _checkpoint(self, entry):
+        with self._lock:
+            with open(self.checkpoint_path, 'a') as checkpoint:
+                checkpoint.write(json.dumps(entry) + '\n')
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
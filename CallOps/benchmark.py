@@ -0,0 +1,79 @@
+'''
+Microbenchmark of Twilio media frame handling: json.loads + base64 per frame versus TwilioFrameDecoder.
+
+Usage: python -m CallOps.benchmark [--frames 50000] [--batch 5]
+'''
+import argparse
+import base64
+import json
+import os
+import time
+from AudioOps.stream import MulawRingBuffer
+from CallOps.frames import TwilioFrameDecoder
+
+def make_frames(count):
+    frames = []
+    for i in range(count):
+        frames.append(json.dumps({
+            'event': 'media',
+            'sequenceNumber': str(i + 2),
+            'media': {'track': 'inbound', 'chunk': str(i + 1), 'timestamp': str(i * 20),
+                      'payload': base64.b64encode(os.urandom(160)).decode()},
+            'streamSid': 'MZ18ad3ab5a668481ce02b83e7395059f0',
+        }, separators=(',', ':')))
+    return frames
+
+def baseline(frames, ring):
+    for message in frames:
+        msg = json.loads(message)
+        if msg['event'] == 'media':
+            ring.write(base64.b64decode(msg['media']['payload']))
+            for window in ring.windows():
+                pass
+
+def decoder_path(frames, ring, batch):
+    decoder = TwilioFrameDecoder(batch_frames=batch)
+    for message in frames:
+        event, audio = decoder.feed(message)
+        if audio:
+            ring.write(audio)
+            for window in ring.windows():
+                pass
+
+    # The last batch may be incomplete
+    audio = decoder.flush()
+    if audio:
+        ring.write(audio)
+        for window in ring.windows():
+            pass
+
+def measure(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=50000, help='number of media frames')
+    parser.add_argument('--batch', type=int, default=5, help='frames decoded per batch')
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames)
+
+    # Both paths must produce the same audio, with the batch size that is timed
+    expected, actual = MulawRingBuffer(capacity_ms=args.frames * 20), MulawRingBuffer(capacity_ms=args.frames * 20)
+    expected.window_size = actual.window_size = args.frames * 160 + 1
+    baseline(frames, expected)
+    decoder_path(frames, actual, args.batch)
+    assert expected.pop(len(expected)) == actual.pop(len(actual))
+
+    baseline_time = measure(baseline, frames, MulawRingBuffer(window_ms=500))
+    decoder_time = measure(decoder_path, frames, MulawRingBuffer(window_ms=500), args.batch)
+
+    print(f"{args.frames} media frames (one call is 50 frames/s)")
+    print(f"json + base64: {args.frames / baseline_time:,.0f} frames/s/core ({args.frames / baseline_time / 50:,.0f} calls)")
+    print(f"decoder:       {args.frames / decoder_time:,.0f} frames/s/core ({args.frames / decoder_time / 50:,.0f} calls)")
+    print(f"speedup: {baseline_time / decoder_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
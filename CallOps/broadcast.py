@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+from collections import deque
+
+class Subscriber:
+    '''
+    This class is one outbound connection of the Broadcaster, with its own bounded queue and sender task.
+    '''
+
+    def __init__(self, send, call_id=None, max_queue=32):
+        '''
+        Parameters:
+        - send: Coroutine function that sends a text message to the subscriber
+        - call_id: Only messages of this call are delivered
+            default: None (messages of every call)
+        - max_queue: The number of undelivered messages kept before the oldest (interim first) is dropped
+            default: 32
+        '''
+        self.send = send
+        self.call_id = call_id
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def offer(self, text, coalesce_key=None):
+        '''
+        This method queues a message without waiting for the subscriber.
+
+        Parameters:
+        - text: The serialized message
+        - coalesce_key: If the newest queued message has the same key it is replaced instead of queued behind
+            default: None
+        '''
+        if self.closed:
+            return
+
+        if coalesce_key is not None and self._queue and self._queue[-1][1] == coalesce_key:
+            self._queue[-1] = (text, coalesce_key)
+            self.coalesced += 1
+        else:
+            if len(self._queue) >= self.max_queue:
+                self._drop_oldest()
+            self._queue.append((text, coalesce_key))
+
+        self._wakeup.set()
+
+    def _drop_oldest(self):
+        # Interim messages are superseded anyway, so they are dropped before anything else
+        for index, (_, coalesce_key) in enumerate(self._queue):
+            if coalesce_key is not None:
+                del self._queue[index]
+                break
+        else:
+            self._queue.popleft()
+
+        self.dropped += 1
+
+    async def close(self):
+        '''
+        This method stops the sender task, undelivered messages are discarded.
+        '''
+        self.closed = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._queue:
+                text, _ = self._queue.popleft()
+                try:
+                    await self.send(text)
+                except Exception as e:
+                    logging.info(f'Subscriber disconnected: {str(e)}')
+                    self.closed = True
+                    self._queue.clear()
+                    return
+
+class Broadcaster:
+    '''
+    This class fans call events out to subscribers (dashboards, the app) without ever waiting for them.
+    Every subscriber is served by its own task, so a slow subscriber only delays itself.
+    '''
+
+    def __init__(self, max_queue=32):
+        '''
+        Parameters:
+        - max_queue: The queue length of every subscriber
+            default: 32
+        '''
+        self.max_queue = max_queue
+        self.subscribers = set()
+        self._loop = None
+
+    def subscribe(self, send, call_id=None):
+        '''
+        This method registers a subscriber, it must be called from the event loop.
+
+        Parameters:
+        - send: Coroutine function that sends a text message to the subscriber
+        - call_id: Only messages of this call are delivered
+            default: None (messages of every call)
+
+        Returns:
+        - Subscriber: The subscriber
+        '''
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(send, call_id=call_id, max_queue=self.max_queue)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    async def unsubscribe(self, subscriber):
+        '''
+        This method removes a subscriber and stops its sender task.
+
+        Parameters:
+        - subscriber: The subscriber returned by subscribe
+        '''
+        self.subscribers.discard(subscriber)
+        await subscriber.close()
+
+    def publish(self, call_id, message, coalesce=False):
+        '''
+        This method queues a message for every subscriber of the call, it never blocks.
+
+        Parameters:
+        - call_id: The call the message belongs to
+        - message: The message (dict), the call id is added to it
+        - coalesce: Replace a queued message of the same event and call that was not delivered yet,
+            used for interim transcripts where only the latest matters
+            default: False
+        '''
+        text = json.dumps({**message, 'callId': call_id})
+        coalesce_key = (message.get('event'), call_id) if coalesce else None
+
+        for subscriber in list(self.subscribers):
+            if subscriber.closed:
+                self.subscribers.discard(subscriber)
+            elif subscriber.call_id is None or subscriber.call_id == call_id:
+                subscriber.offer(text, coalesce_key)
+
+    def publish_threadsafe(self, call_id, message, coalesce=False):
+        '''
+        This method publishes a message from a worker thread.
+
+        Parameters:
+        - call_id: The call the message belongs to
+        - message: The message (dict)
+        - coalesce: See publish
+            default: False
+        '''
+        # Nobody has subscribed yet, so there is nobody to deliver to
+        if self._loop is None:
+            return
+
+        self._loop.call_soon_threadsafe(self.publish, call_id, message, coalesce)
+
+    def metrics(self):
+        '''
+        This method returns the broadcaster counters.
+
+        Returns:
+        - dict: Number of subscribers and dropped/coalesced messages
+        '''
+        return {
+            'subscribers': len(self.subscribers),
+            'dropped': sum(subscriber.dropped for subscriber in self.subscribers),
+            'coalesced': sum(subscriber.coalesced for subscriber in self.subscribers),
+        }
@@ -0,0 +1,97 @@
+import binascii
+import json
+
+class TwilioFrameDecoder:
+    '''
+    This class decodes the messages of a Twilio media stream.
+    Media frames (50 per second per call) are recognised from their prefix and their payload is sliced out
+    without parsing the JSON, payloads are then base64 decoded into a buffer of the call that is reused by
+    every batch.
+    The rare connected/start/stop/mark events are fully parsed.
+    '''
+    media_prefix = '{"event":"media"'
+    payload_marker = '"payload":"'
+
+    # Bytes of mu-law audio in a 20 ms media frame
+    frame_bytes = 160
+
+    def __init__(self, batch_frames=5):
+        '''
+        Parameters:
+        - batch_frames: The number of media frames decoded together
+            default: 5 (100 ms of audio)
+        '''
+        self.batch_frames = batch_frames
+        self.frames = 0
+        self.parsed = 0
+
+        self._buffer = bytearray(batch_frames * self.frame_bytes)
+        self._view = memoryview(self._buffer)
+        self._size = 0
+        self._pending = 0
+
+    def feed(self, message):
+        '''
+        This method decodes one websocket message.
+
+        Parameters:
+        - message: The text of the message
+
+        Returns:
+        - str: The event name
+        - The decoded audio of a completed batch for media events (a memoryview of the reused buffer, valid
+            until the next call to feed or flush, or None while the batch is filling up),
+            the parsed message (dict) for every other event
+        '''
+        if message.startswith(self.media_prefix):
+            start = message.find(self.payload_marker)
+            if start != -1:
+                start += len(self.payload_marker)
+                end = message.find('"', start)
+                return 'media', self._add_payload(message[start:end])
+
+        # Not the compact form Twilio sends, fall back to the full parser
+        msg = json.loads(message)
+        self.parsed += 1
+
+        if msg['event'] == 'media':
+            return 'media', self._add_payload(msg['media']['payload'])
+
+        return msg['event'], msg
+
+    def flush(self):
+        '''
+        This method decodes the payloads of an incomplete batch, e.g. when the stream stops.
+
+        Returns:
+        - memoryview: The decoded audio (valid until the next call to feed or flush), or None if no payloads are waiting
+        '''
+        if not self._pending:
+            return None
+
+        audio = self._view[:self._size]
+        self._size = 0
+        self._pending = 0
+
+        return audio
+
+    def _add_payload(self, payload):
+        self.frames += 1
+
+        # Padded payloads cannot be joined before decoding, each one is decoded into its place in the batch
+        audio = binascii.a2b_base64(payload)
+        end = self._size + len(audio)
+        if end > len(self._buffer):
+            # Frames larger than 160 bytes, the buffer is replaced once by a larger one
+            buffer = bytearray(max(end, 2 * len(self._buffer)))
+            buffer[:self._size] = self._view[:self._size]
+            self._buffer, self._view = buffer, memoryview(buffer)
+
+        self._view[self._size:end] = audio
+        self._size = end
+        self._pending += 1
+
+        if self._pending >= self.batch_frames:
+            return self.flush()
+
+        return None
@@ -0,0 +1,179 @@
+import logging
+import queue
+import threading
+
+_DONE = object()
+
+class PipelineError(Exception):
+    '''
+    This exception is raised by ChunkPipeline.close when a stage failed on some of the chunks.
+    '''
+
+    def __init__(self, errors):
+        '''
+        Parameters:
+        - errors: List of (stage_name, sequence, exception) tuples
+        '''
+        self.errors = errors
+        super().__init__(', '.join(f'{name} failed on chunk {sequence}: {str(e)}' for name, sequence, e in errors))
+
+class Stage:
+    '''
+    This class describes one step of a ChunkPipeline.
+    '''
+
+    def __init__(self, name, function, workers=1):
+        '''
+        Parameters:
+        - name: The name of the stage (used in logs and thread names)
+        - function: Called with the output of the previous stage, returning None drops the chunk
+        - workers: The number of threads running this stage, stages with one worker see chunks in order
+            default: 1
+        '''
+        self.name = name
+        self.function = function
+        self.workers = workers
+
+class ChunkPipeline:
+    '''
+    This class runs chunks through a sequence of stages connected by bounded queues.
+    Every stage has its own worker threads, so different chunks are in different stages at the same time,
+    while the output of every stage is released in submission order.
+    '''
+
+    def __init__(self, stages, queue_size=4):
+        '''
+        Parameters:
+        - stages: The list of Stage objects, in order
+        - queue_size: The number of chunks that may wait in front of each stage
+            default: 4
+        '''
+        self.stages = stages
+        self.queue_size = queue_size
+        self.results = []
+        self.errors = []
+
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._threads = []
+        self._aborted = threading.Event()
+        self._submitted = 0
+
+        # Per stage reorder state
+        self._pending = [{} for _ in stages]
+        self._next = [0 for _ in stages]
+        self._running = [stage.workers for stage in stages]
+        self._locks = [threading.Lock() for _ in stages]
+
+        for index, stage in enumerate(stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), name=f'{stage.name}-{worker}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item):
+        '''
+        This method adds a chunk to the pipeline, blocking while the first stage is full.
+
+        Parameters:
+        - item: The input of the first stage
+        '''
+        self._queues[0].put((self._submitted, item))
+        self._submitted += 1
+
+    def close(self, raise_errors=False):
+        '''
+        This method waits until every submitted chunk has left the pipeline.
+        A chunk a stage failed on is dropped and its error is kept in errors.
+
+        Parameters:
+        - raise_errors: Raise PipelineError if a stage failed on any chunk
+            default: False
+
+        Returns:
+        - list: The non-None outputs of the last stage, in submission order
+        '''
+        for _ in range(self.stages[0].workers):
+            self._queues[0].put(_DONE)
+
+        for thread in self._threads:
+            thread.join()
+
+        if raise_errors and self.errors:
+            raise PipelineError(sorted(self.errors, key=lambda error: error[1]))
+
+        return self.results
+
+    def run(self, items, raise_errors=False):
+        '''
+        This method pushes all items through the pipeline.
+
+        Parameters:
+        - items: An iterable of inputs for the first stage
+        - raise_errors: Raise PipelineError if a stage failed on any chunk
+            default: False
+
+        Returns:
+        - list: The non-None outputs of the last stage, in order
+        '''
+        try:
+            for item in items:
+                self.submit(item)
+        except BaseException:
+            # The input failed, the chunks already submitted are dropped and the stage threads stopped
+            self.abort()
+            raise
+
+        return self.close(raise_errors)
+
+    def abort(self):
+        '''
+        This method stops the pipeline: chunks that have not entered a stage yet are dropped instead of
+        processed (no more paid STT or LLM requests), and the stage threads are waited for.
+        '''
+        self._aborted.set()
+        self.close()
+
+    def _work(self, index):
+        stage = self.stages[index]
+        inbox = self._queues[index]
+
+        while True:
+            entry = inbox.get()
+            if entry is _DONE:
+                break
+
+            sequence, item = entry
+            result = None
+            if item is not None and not self._aborted.is_set():
+                try:
+                    result = stage.function(item)
+                except Exception as e:
+                    logging.error(f'Pipeline stage {stage.name} failed on chunk {sequence}: {str(e)}')
+                    with self._locks[index]:
+                        self.errors.append((stage.name, sequence, e))
+
+            self._release(index, sequence, result)
+
+        with self._locks[index]:
+            self._running[index] -= 1
+            finished = self._running[index] == 0
+
+        # The last worker of a stage shuts the next stage down
+        if finished and index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self._queues[index + 1].put(_DONE)
+
+    def _release(self, index, sequence, result):
+        # Dropped chunks travel on as None so the sequence numbers downstream stay contiguous
+        with self._locks[index]:
+            self._pending[index][sequence] = result
+
+            while self._next[index] in self._pending[index]:
+                ready = self._pending[index].pop(self._next[index])
+
+                if index + 1 < len(self.stages):
+                    self._queues[index + 1].put((self._next[index], ready))
+                elif ready is not None:
+                    self.results.append(ready)
+
+                self._next[index] += 1
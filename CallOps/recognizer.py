@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import queue
+import threading
+from google.cloud import speech
+
+_DONE = object()
+
+class StreamingRecognizer:
+    '''
+    This class bridges one Google streaming_recognize call to an asyncio event loop.
+    The blocking gRPC stream runs in a dedicated worker thread: audio written from the loop is queued
+    for the thread, and transcripts are posted back onto the loop.
+    '''
+
+    def __init__(self, client, streaming_config, max_queue=500):
+        '''
+        Parameters:
+        - client: The google.cloud.speech.SpeechClient
+        - streaming_config: The speech.StreamingRecognitionConfig
+        - max_queue: The number of audio writes buffered for the worker thread before the oldest is dropped
+            default: 500 (10 seconds when every write is one 20 ms Twilio media frame, callers writing
+            batches of frames should divide it by the batch size)
+        '''
+        self.client = client
+        self.streaming_config = streaming_config
+
+        self._audio = queue.Queue(maxsize=max_queue)
+        self._transcripts = None
+        self._loop = None
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        '''
+        This method starts the worker thread, it must be called from the event loop.
+        '''
+        self._loop = asyncio.get_running_loop()
+        self._transcripts = asyncio.Queue()
+        self._thread = threading.Thread(target=self._run, name='streaming-recognize', daemon=True)
+        self._thread.start()
+
+    def write(self, audio):
+        '''
+        This method queues raw audio for recognition without blocking the event loop.
+
+        Parameters:
+        - audio: The raw mu-law bytes of a media frame
+        '''
+        if self._closed:
+            return
+
+        try:
+            self._audio.put_nowait(audio)
+        except queue.Full:
+            # The recognizer is falling behind, drop the oldest frame rather than block the loop
+            try:
+                self._audio.get_nowait()
+            except queue.Empty:
+                pass
+            self._audio.put_nowait(audio)
+            logging.warning('Streaming recognizer is behind, dropped an audio frame')
+
+    def close(self):
+        '''
+        This method ends the audio stream, the recognizer finishes the transcripts already in flight.
+        '''
+        if self._closed:
+            return
+
+        self._closed = True
+        while True:
+            try:
+                self._audio.put_nowait(_DONE)
+                break
+            except queue.Full:
+                try:
+                    self._audio.get_nowait()
+                except queue.Empty:
+                    pass
+
+    async def transcripts(self):
+        '''
+        This method yields the transcripts as they arrive, until the stream ends.
+
+        Returns:
+        - async generator: (transcript, is_final) tuples
+        '''
+        while True:
+            item = await self._transcripts.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def _requests(self):
+        while True:
+            audio = self._audio.get()
+            if audio is _DONE:
+                return
+            yield speech.StreamingRecognizeRequest(audio_content=audio)
+
+    def _post(self, item):
+        self._loop.call_soon_threadsafe(self._transcripts.put_nowait, item)
+
+    def _run(self):
+        try:
+            responses = self.client.streaming_recognize(self.streaming_config, self._requests())
+            for response in responses:
+                for result in response.results:
+                    if result.alternatives:
+                        self._post((result.alternatives[0].transcript, result.is_final))
+        except Exception as e:
+            logging.error(f'Streaming recognition failed: {str(e)}')
+        finally:
+            self._post(_DONE)
+
+def mulaw_streaming_config(language_code='en-GB', sample_rate=8000, interim_results=True):
+    '''
+    This function builds the recognition config for a Twilio media stream.
+
+    Parameters:
+    - language_code: The language of the call
+        default: en-GB
+    - sample_rate: The sample rate of the media stream
+        default: 8000
+    - interim_results: Whether interim (non final) transcripts are returned
+        default: True
+
+    Returns:
+    - speech.StreamingRecognitionConfig: The streaming config
+    '''
+    return speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.MULAW,
+            sample_rate_hertz=sample_rate,
+            language_code=language_code,
+        ),
+        interim_results=interim_results,
+    )
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from AudioOps.stream import MulawRingBuffer
+from AudioOps.vad import VADSegmenter
+
+class CallSession:
+    '''
+    This class holds everything that belongs to a single call: its conversation with the LLM,
+    its audio buffers, its analysis pipeline and its latest verdict.
+    '''
+
+    def __init__(self, stream_sid, messages, call_sid=None, window_ms=500, sample_rate=8000, vad_settings=None,
+                 mode='full', model=None):
+        '''
+        Parameters:
+        - stream_sid: The Twilio media stream id
+        - messages: The initial messages of the conversation (usually just the system prompt)
+        - call_sid: The Twilio call id
+            default: None
+        - window_ms: The length of the windows handed from the ring buffer to the VAD (in milliseconds)
+            default: 500
+        - sample_rate: The sample rate of the media stream
+            default: 8000
+        - vad_settings: Keyword arguments for the VADSegmenter
+            default: None
+        - mode: The analysis mode the call was admitted with (see AdmissionController)
+            default: full
+        - model: The LLM analysing the call
+            default: None (the application default)
+        '''
+        self.stream_sid = stream_sid
+        self.call_sid = call_sid
+        self.messages = messages
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.model = model
+
+        self.audio_buffer = MulawRingBuffer(window_ms=window_ms, sample_rate=sample_rate)
+        self.vad = VADSegmenter(sample_rate=sample_rate, **(vad_settings or {}))
+        self.pipeline = None
+        self.recognizer = None
+
+        self.verdict = None
+        self.keywords_heard = set()
+        self.chunk_index = 0
+        self.started_at = time.time()
+
+    @property
+    def call_id(self):
+        return self.call_sid or self.stream_sid
+
+    def next_chunk_index(self):
+        '''
+        This method numbers the next chunk of the call.
+
+        Returns:
+        - int: The chunk number, starting at 1
+        '''
+        self.chunk_index += 1
+        return self.chunk_index
+
+    def firebase_key(self, key='Response'):
+        '''
+        This method returns the Firebase path of a value that belongs to this call.
+
+        Parameters:
+        - key: The name of the value
+            default: Response
+
+        Returns:
+        - str: The Firebase path
+        '''
+        return f'Calls/{self.call_id}/{key}'
+
+class SessionRegistry:
+    '''
+    This class keeps the active call sessions, keyed by stream id and call id.
+    '''
+
+    def __init__(self):
+        self._sessions = {}
+        self._call_index = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions.values()))
+
+    def create(self, stream_sid, messages, call_sid=None, **kwargs):
+        '''
+        This method starts a session for a new media stream.
+
+        Parameters:
+        - stream_sid: The Twilio media stream id
+        - messages: The initial messages of the conversation
+        - call_sid: The Twilio call id
+            default: None
+        - kwargs: Passed on to CallSession
+
+        Returns:
+        - CallSession: The new session
+        '''
+        session = CallSession(stream_sid, messages, call_sid=call_sid, **kwargs)
+
+        with self._lock:
+            if stream_sid in self._sessions:
+                logging.warning(f'Replacing existing session for stream {stream_sid}')
+            self._sessions[stream_sid] = session
+            if call_sid:
+                self._call_index[call_sid] = stream_sid
+
+        return session
+
+    def get(self, sid):
+        '''
+        This method looks a session up.
+
+        Parameters:
+        - sid: The stream id or the call id
+
+        Returns:
+        - CallSession: The session, or None if there is no active session
+        '''
+        with self._lock:
+            stream_sid = self._call_index.get(sid, sid)
+            return self._sessions.get(stream_sid)
+
+    def remove(self, stream_sid):
+        '''
+        This method forgets a finished session.
+
+        Parameters:
+        - stream_sid: The Twilio media stream id
+
+        Returns:
+        - CallSession: The removed session, or None if it was already removed
+        '''
+        with self._lock:
+            session = self._sessions.pop(stream_sid, None)
+            if session and session.call_sid:
+                self._call_index.pop(session.call_sid, None)
+
+        if session:
+            logging.info(f'Call {session.call_id} finished after {time.time() - session.started_at:.1f}s')
+
+        return session
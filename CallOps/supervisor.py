@@ -0,0 +1,191 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import uvicorn
+
+# Set in every worker process before the application is imported
+_worker_index = None
+_active_calls = None
+_total_calls = None
+_pins = None
+
+def worker_index():
+    '''
+    This function returns the index of the current worker.
+
+    Returns:
+    - int: The worker index, or None when the server runs without a supervisor
+    '''
+    return _worker_index
+
+def report_call_started(call_id):
+    '''
+    This function pins a call to the current worker and counts it in the worker's load.
+    The pin is written to the supervisor's manager process, async code should call it with asyncio.to_thread.
+
+    Parameters:
+    - call_id: The id of the call
+    '''
+    if _worker_index is None:
+        return
+
+    with _active_calls.get_lock():
+        _active_calls[_worker_index] += 1
+        _total_calls[_worker_index] += 1
+    _pins[call_id] = _worker_index
+
+def report_call_finished(call_id):
+    '''
+    This function releases a call pinned to the current worker.
+    Like report_call_started it is a round trip to the manager process.
+
+    Parameters:
+    - call_id: The id of the call
+    '''
+    if _worker_index is None:
+        return
+
+    with _active_calls.get_lock():
+        _active_calls[_worker_index] -= 1
+    _pins.pop(call_id, None)
+
+def call_owner(call_id):
+    '''
+    This function looks up the worker a call is pinned to.
+    Like report_call_started it is a round trip to the manager process.
+
+    Parameters:
+    - call_id: The id of the call
+
+    Returns:
+    - int: The worker index, or None if the call is unknown or there is no supervisor
+    '''
+    if _pins is None:
+        return None
+
+    return _pins.get(call_id)
+
+def worker_load():
+    '''
+    This function returns the load of every worker.
+
+    Returns:
+    - list: One dict per worker with its active and total number of calls
+    '''
+    if _active_calls is None:
+        return []
+
+    return [
+        {'worker': index, 'active_calls': _active_calls[index], 'total_calls': _total_calls[index]}
+        for index in range(len(_active_calls))
+    ]
+
+class Supervisor:
+    '''
+    This class runs the ASGI server in several worker processes that share one port through SO_REUSEPORT.
+    The kernel spreads new connections over the workers, and every media stream stays on the worker
+    that accepted it for its whole life, so a call's session never has to move between processes.
+    '''
+
+    def __init__(self, app, host='0.0.0.0', port=8080, workers=None, report_interval=30):
+        '''
+        Parameters:
+        - app: The import string of the ASGI application (e.g. twilio_live:app), imported by every worker
+            after the fork so that its clients (gRPC channels, HTTP pools) are never shared between processes.
+            The process running the supervisor should not create them itself.
+        - host: The address to listen on
+            default: 0.0.0.0
+        - port: The port to listen on
+            default: 8080
+        - workers: The number of worker processes
+            default: None (one per CPU core)
+        - report_interval: Seconds between per-worker load reports
+            default: 30
+        '''
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.report_interval = report_interval
+
+        self._context = multiprocessing.get_context('fork')
+        self._active_calls = self._context.Array('i', self.workers)
+        self._total_calls = self._context.Array('i', self.workers)
+        self._manager = None
+        self._pins = None
+        self._processes = {}
+        self._stopping = False
+
+    def run(self):
+        '''
+        This method starts the workers and supervises them until SIGINT or SIGTERM.
+        '''
+        self._manager = self._context.Manager()
+        self._pins = self._manager.dict()
+
+        for index in range(self.workers):
+            self._spawn(index)
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        last_report = time.time()
+        while not self._stopping:
+            time.sleep(1)
+
+            # Replace workers that died
+            for index, process in list(self._processes.items()):
+                if not process.is_alive() and not self._stopping:
+                    logging.error(f'Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting')
+                    with self._active_calls.get_lock():
+                        self._active_calls[index] = 0
+                    for call_id, owner in list(self._pins.items()):
+                        if owner == index:
+                            self._pins.pop(call_id, None)
+                    self._spawn(index)
+
+            if time.time() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.time()
+
+        for process in self._processes.values():
+            process.join()
+        self._manager.shutdown()
+
+    def report(self):
+        '''
+        This method logs the load of every worker.
+        '''
+        for index, process in sorted(self._processes.items()):
+            logging.warning(f'Worker {index} (pid {process.pid}): {self._active_calls[index]} active calls, {self._total_calls[index]} total')
+
+    def _spawn(self, index):
+        process = self._context.Process(target=self._serve, args=(index,), name=f'callcop-worker-{index}')
+        process.start()
+        self._processes[index] = process
+
+    def _serve(self, index):
+        global _worker_index, _active_calls, _total_calls, _pins
+        _worker_index = index
+        _active_calls = self._active_calls
+        _total_calls = self._total_calls
+        _pins = self._pins
+
+        # Every worker has its own listening socket, the kernel balances connections between them
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+
+        server = uvicorn.Server(uvicorn.Config(self.app, host=self.host, port=self.port))
+        server.run(sockets=[sock])
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
@@ -2,21 +2,34 @@ from email import message
 from pyexpat.errors import messages
 import anthropic
 from datetime import datetime
+from LLMOps.transport import get_http_client, get_async_http_client
+from LLMOps.verdict import DecisionParser, verdict_tool
+from LLMOps.usage import UsageTracker
+from LLMOps.tool_executor import ToolExecutor, failed_call
 import logging
 import json
+import time
 
 class ClaudeLLMHandler:
     '''
     This class handles the interaction with the OpenAI Large Language Model API.
+    Every method has an async variant (send_text_async, ...) that shares the pooled HTTP client of the event loop.
+    System messages are sent in the system parameter, with a cache breakpoint after the static system prompt so it is
+    read from the prompt cache by every chunk of every call. The cached and uncached prompt tokens of every request are in usage.
     '''
-    openai_models = {'claude-3-5-sonnet-20240620' : [0.50, 1.50],
-          'claude-3-opus-20240229' : [30.00, 60.00],
-          'claude-3-haiku-20240307' : [30.00, 60.00],
+    openai_models = {'claude-3-5-sonnet-20240620' : [3.00, 15.00],
+          'claude-3-5-sonnet-20241022' : [3.00, 15.00],
+          'claude-3-opus-20240229' : [15.00, 75.00],
+          'claude-3-haiku-20240307' : [0.25, 1.25],
           }
     
     usd_to_inr = 85.00
+
+    # Prompt cache reads cost a tenth of the input price, cache writes a quarter more than it
+    cache_read_discount = 0.10
+    cache_write_premium = 1.25
     
-    def __init__(self, api_key, preprompt=None, optimize=False, tools=None, functions=None):
+    def __init__(self, api_key, preprompt=None, optimize=False, tools=None, functions=None, compactor=None, cache=None, cache_prompt=True, tool_executor=None, budget=None, structured=False, verdict_max_tokens=200):
         '''
         Parameters:
         - api_key: The OpenAI API key
@@ -30,29 +43,80 @@ class ClaudeLLMHandler:
             default: None
         - functions: The functions available to the model
             default: None
+        - compactor: ConversationCompactor that bounds the messages sent for long conversations
+            default: None (the whole conversation is sent)
+        - cache: ResponseCache of the text responses, keyed by the transcripts sent
+            default: None (every request goes to the model)
+        - cache_prompt: Mark the system prompt as a prompt cache breakpoint
+            default: True
+        - tool_executor: ToolExecutor that runs the functions requested by the model
+            default: None (a ToolExecutor with a 10 second timeout per function)
+        - budget: TokenBudget that checks the tokens and the cost of every request before it is sent,
+            the user_id of a request is the call its cost counts towards
+            default: None (requests are not checked)
+        - structured: Force the verdict tool (see verdict_tool), the verdict is returned as JSON, with at most verdict_max_tokens tokens
+            default: False
+        - verdict_max_tokens: The maximum number of tokens of a structured verdict
+            default: 200
         '''
         self.api_key = api_key
-        self.claude_client = anthropic.Anthropic()
+        self.claude_client = anthropic.Anthropic(api_key=api_key, http_client=get_http_client())
         self.preprompt = preprompt
         self.optimize = optimize
         self.tools = tools
         self.functions = functions
+        self.compactor = compactor
+        self.cache = cache
+        self.tool_executor = tool_executor or ToolExecutor()
+        self.budget = budget
+        self.structured = structured
+        self.verdict_max_tokens = verdict_max_tokens
+        self.cache_prompt = cache_prompt
+        self.usage = UsageTracker()
+
+        self._async_client = None
+        self._async_http_client = None
+
+    @property
+    def async_client(self):
+        '''
+        The AsyncAnthropic client of the running event loop, built on the pooled HTTP client of the loop.
+        '''
+        http_client = get_async_http_client()
+        if self._async_http_client is not http_client:
+            self._async_client = anthropic.AsyncAnthropic(api_key=self.api_key, http_client=http_client)
+            self._async_http_client = http_client
 
-    def estimate_api_cost(self, model, input_tokens, output_tokens):
+        return self._async_client
+
+    def estimate_api_cost(self, model, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0):
         '''
         This function estimates the cost of the API call based on the model, input tokens and output tokens.
 
         Parameters:
         - model (str): Model used for the API call
-        - input_tokens (int): Number of input tokens
+        - input_tokens (int): Number of input tokens, cached or not
         - output_tokens (int): Number of output tokens
+        - cache_read_tokens (int): Number of input tokens read from the prompt cache
+            default: 0
+        - cache_write_tokens (int): Number of input tokens written to the prompt cache
+            default: 0
         
         Returns:
         - float: Cost of the API call (in INR)
         '''
-        
+        if model not in self.openai_models:
+            logging.warning(f'No price for model {model}, its cost is not counted')
+            return 0.0
+
+        input_price, output_price = self.openai_models[model]
+        uncached_tokens = input_tokens - cache_read_tokens - cache_write_tokens
+
         # Estimate the cost
-        cost = ((input_tokens/1e6)*self.openai_models[model][0] + (output_tokens/1e6)*self.openai_models[model][1])*self.usd_to_inr
+        cost = ((uncached_tokens/1e6)*input_price
+                + (cache_read_tokens/1e6)*input_price*self.cache_read_discount
+                + (cache_write_tokens/1e6)*input_price*self.cache_write_premium
+                + (output_tokens/1e6)*output_price)*self.usd_to_inr
         
         return cost
     
@@ -75,64 +139,107 @@ class ClaudeLLMHandler:
         - role: The role of the message
         - model: The model used
         - completion_tokens: The number of tokens generated
-        - prompt_tokens: The number of tokens in the prompt
+        - prompt_tokens: The number of tokens in the prompt (cached and uncached)
+        The cached and uncached prompt tokens of the request are in usage.last, their totals in usage.metrics().
         '''
-        # add preprompt to the last message
-        if self.preprompt:
-            messages[-1]['content'] = self.preprompt + messages[-1]['content']
-        
-        if self.optimize:
-            # iterate through the messages and check if the message has image and remove
-            for i in range(len(messages)):
-                try:
-                    if 'image_url' == messages[i]['content'][1]['type']:
-                        del messages[i]
-                except:
-                    pass
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            return cached
 
         # Send the text to OpenAI LLM
-        response = self.claude_client.messages.create(
-                    model=model,
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    tools=self.tools,
-                    tool_choice={"type": "auto"} if self.tools else None,
-                )
-        
-        if response.stop_reason == "end_turn":
-            response_message = response.content[0].text
-            role = response.role
-            model = response.model
-            completion_tokens = response.usage.input_tokens
-            prompt_tokens = response.usage.output_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
-
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
-        elif response.stop_reason == "tool_use" and self.tools and self.functions:
-            tool_calls = [c for c in response.content if c.type == "tool_use"]
-            role = response.role
-            model = response.model
-            completion_tokens = response.usage.input_tokens
-            prompt_tokens = response.usage.output_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
+        started = time.perf_counter()
+        response = self.claude_client.messages.create(**self._request_args(messages, model, max_tokens))
 
-            messages.append({"role": response.role, "content": response.content})
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, self.call_function(tool_calls, result[3], messages))
+
+        return self._cache_store(key, self._log_result(result, user_id))
 
-            response_message, new_cost, new_completion_tokens, new_prompt_tokens = self.call_function(tool_calls, model, messages)
+    async def send_text_async(self, messages, model='claude-3-5-sonnet-20240620', user_id=None, max_tokens=1000):
+        '''
+        This method is the async variant of send_text, it takes the same parameters and returns the same values.
+        '''
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
 
-            total_cost += new_cost
-            completion_tokens += new_completion_tokens
-            prompt_tokens += new_prompt_tokens
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            return cached
 
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
+        # Send the text to OpenAI LLM
+        started = time.perf_counter()
+        response = await self.async_client.messages.create(**self._request_args(messages, model, max_tokens))
 
-        else:
-            return None, None, None, None, None, None
-        
-        return response_message, total_cost, role, model, completion_tokens, prompt_tokens
-            
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, await self.call_function_async(tool_calls, result[3], messages))
+
+        return self._cache_store(key, self._log_result(result, user_id))
+    
+    def send_text_stream(self, messages, model='claude-3-5-sonnet-20240620', user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method streams the response of the Claude model and calls on_decision as soon as the Decision line is complete.
+        Tools are not offered to the model in streaming mode.
+
+        Parameters:
+        - messages, model, user_id, max_tokens: See send_text
+        - on_decision: Function called with the decision (fraud, not_fraud or need_more_time) while the
+            reasoning and action are still being generated
+            default: None
+
+        Returns:
+        - The same values as send_text, once the response is complete
+        '''
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+        parser = DecisionParser(on_decision)
+
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            parser.feed(cached[0])
+            parser.finish()
+            return cached
+
+        started = time.perf_counter()
+        with self.claude_client.messages.stream(**self._request_args(messages, model, max_tokens, tools=False)) as stream:
+            # Text, or the JSON input of the forced verdict tool
+            for event in stream:
+                if event.type == 'content_block_delta':
+                    parser.feed(getattr(event.delta, 'text', None) or getattr(event.delta, 'partial_json', None))
+            response = stream.get_final_message()
+
+        return self._cache_store(key, self._log_result(self._stream_result(parser, response, started), user_id))
+
+    async def send_text_stream_async(self, messages, model='claude-3-5-sonnet-20240620', user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method is the async variant of send_text_stream, it takes the same parameters and returns the same values.
+        '''
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+        parser = DecisionParser(on_decision)
+
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            parser.feed(cached[0])
+            parser.finish()
+            return cached
+
+        started = time.perf_counter()
+        async with self.async_client.messages.stream(**self._request_args(messages, model, max_tokens, tools=False)) as stream:
+            async for event in stream:
+                if event.type == 'content_block_delta':
+                    parser.feed(getattr(event.delta, 'text', None) or getattr(event.delta, 'partial_json', None))
+            response = await stream.get_final_message()
+
+        return self._cache_store(key, self._log_result(self._stream_result(parser, response, started), user_id))
     
     def send_text_and_image(self, messages, model='claude-3-5-sonnet-20240620', user_id=None, max_tokens=1000):
         '''
@@ -153,11 +260,143 @@ class ClaudeLLMHandler:
         - role: The role of the message
         - model: The model used
         - completion_tokens: The number of tokens generated
-        - prompt_tokens: The number of tokens in the prompt
+        - prompt_tokens: The number of tokens in the prompt (cached and uncached)
+        The cached and uncached prompt tokens of the request are in usage.last, their totals in usage.metrics().
+        '''
+        self._prepare_image(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+
+        # Send the text to OpenAI LLM
+        started = time.perf_counter()
+        response = self.claude_client.messages.create(**self._request_args(messages, model, max_tokens))
+
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, self.call_function(tool_calls, result[3], messages))
+
+        return self._log_result(result, user_id)
+
+    async def send_text_and_image_async(self, messages, model='claude-3-5-sonnet-20240620', user_id=None, max_tokens=1000):
+        '''
+        This method is the async variant of send_text_and_image, it takes the same parameters and returns the same values.
+        '''
+        self._prepare_image(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+
+        # Send the text to OpenAI LLM
+        started = time.perf_counter()
+        response = await self.async_client.messages.create(**self._request_args(messages, model, max_tokens))
+
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, await self.call_function_async(tool_calls, result[3], messages))
+
+        return self._log_result(result, user_id)
+
+    def call_function(self, tool_calls, model, messages):
+        '''
+        This function calls the function specified in the tool_call object and returns the response to the model.
+
+        Args:
+            tool_call (list): List of tool_call objects
+            model (str): Model used for the API call
+            messages (list): List of messages
+
+        Returns:
+            str: Response from the model
+        '''
+        # Call all the functions at the same time, their results go back to the model in a single message
+        function_responses = self.tool_executor.run([self._resolve_tool_call(tool_call) for tool_call in tool_calls])
+        results = [self._tool_result(tool_call, function_response) for tool_call, function_response in zip(tool_calls, function_responses)]
+
+        # Append the response to the backend messages
+        messages.append({"role": "user", "content": results})
+
+        # Call the model again with the updated backend messages
+        started = time.perf_counter()
+        second_response = self.claude_client.messages.create(**self._request_args(messages, model, 1000))
+
+        return self._parse_tool_reply(second_response, started)
+
+    async def call_function_async(self, tool_calls, model, messages):
+        '''
+        This function is the async variant of call_function, the functions run in worker threads.
         '''
-        # add preprompt to the last message
+        # Call all the functions at the same time, their results go back to the model in a single message
+        function_responses = await self.tool_executor.run_async([self._resolve_tool_call(tool_call) for tool_call in tool_calls])
+        results = [self._tool_result(tool_call, function_response) for tool_call, function_response in zip(tool_calls, function_responses)]
+
+        # Append the response to the backend messages
+        messages.append({"role": "user", "content": results})
+
+        # Call the model again with the updated backend messages
+        started = time.perf_counter()
+        second_response = await self.async_client.messages.create(**self._request_args(messages, model, 1000))
+
+        return self._parse_tool_reply(second_response, started)
+
+    def _prepare_text(self, messages):
+        # add preprompt to a copy of the last message, the message may be shared with a hedged request
         if self.preprompt:
-            messages[-1]['content'][0]['text'] = self.preprompt + messages[-1]['content'][0]['text']
+            messages[-1] = {**messages[-1], 'content': self.preprompt + messages[-1]['content']}
+        
+        if self.optimize:
+            # iterate through the messages and check if the message has image and remove
+            for i in range(len(messages)):
+                try:
+                    if 'image_url' == messages[i]['content'][1]['type']:
+                        del messages[i]
+                except:
+                    pass
+
+    def _check_budget(self, messages, model, max_tokens, user_id):
+        # Trims the request, moves it to a cheaper model or raises BudgetExceededError before it is sent
+        if self.budget is None:
+            return messages, model
+
+        def price(model, prompt_tokens, completion_tokens):
+            return self.estimate_api_cost(model, prompt_tokens, completion_tokens) if model in self.openai_models else None
+
+        return self.budget.check(
+            messages, model, self._max_tokens(max_tokens), price=price, call_id=user_id, models=self.openai_models
+        )
+
+    def _request_messages(self, messages):
+        # The conversation keeps every message, the request only the compacted ones
+        if self.compactor is None:
+            return messages
+
+        return self.compactor.compact(messages)
+
+    def _cache_lookup(self, messages, model):
+        # A cached response costs nothing, so its cost and token counts are zero
+        if self.cache is None:
+            return None, None
+
+        key = self.cache.key(messages, model)
+        cached = self.cache.get(key)
+        if cached is None:
+            return key, None
+
+        response_message, total_cost, role, model, completion_tokens, prompt_tokens = cached
+        logging.info(f'Cached response: {response_message}')
+
+        return key, (response_message, 0.0, role, model, 0, 0)
+
+    def _cache_store(self, key, result):
+        if self.cache is not None:
+            self.cache.put(key, result)
+
+        return result
+
+    def _prepare_image(self, messages):
+        # add preprompt to a copy of the last message, the message may be shared with a hedged request
+        if self.preprompt:
+            content = messages[-1]['content']
+            text = {**content[0], 'text': self.preprompt + content[0]['text']}
+            messages[-1] = {**messages[-1], 'content': [text] + content[1:]}
 
         if self.optimize:
             # iterate through the messages and check if the message has image and remove
@@ -168,99 +407,148 @@ class ClaudeLLMHandler:
                 except:
                     pass
 
-        # Send the text to OpenAI LLM
-        response = self.claude_client.messages.create(
-            model=model,
-            messages=messages,
-            tools=self.tools,
-            tool_choice={"type": "auto"} if self.tools else None,
-            max_tokens=max_tokens,
-            )
-
-        if response.stop_reason == "end_turn":
-            response_message = response.content[0].text
-            role = response.role
-            model = response.model
-            completion_tokens = response.usage.input_tokens
-            prompt_tokens = response.usage.output_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
-
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
+    def _request_args(self, messages, model, max_tokens, tools=True):
+        system, conversation = self._split_system(messages)
+        args = {
+            'model': model,
+            'messages': conversation,
+            'max_tokens': self._max_tokens(max_tokens),
+        }
+        if system:
+            args['system'] = system
+
+        # The verdict tool is forced, its input is the structured verdict
+        if self.structured:
+            args['tools'] = [verdict_tool]
+            args['tool_choice'] = {"type": "tool", "name": verdict_tool['name']}
+
+        # The API rejects a null tool list, so the tool arguments are only sent when there are tools
+        elif tools and self.tools:
+            args['tools'] = self.tools
+            args['tool_choice'] = {"type": "auto"}
+
+        return args
+
+    def _max_tokens(self, max_tokens):
+        # A structured verdict is short, the tight limit also bounds the generation time
+        return min(max_tokens, self.verdict_max_tokens) if self.structured else max_tokens
+
+    def _split_system(self, messages):
+        # The API takes the system prompt as a parameter, not as a message
+        system, conversation = [], []
+        for message in messages:
+            if isinstance(message, dict) and message.get('role') == 'system':
+                content = message['content']
+                blocks = [{"type": "text", "text": content}] if isinstance(content, str) else [
+                    {"type": "text", "text": block['text']} for block in content
+                ]
+
+                # Everything up to the end of the first system message (the static prompt) is cached,
+                # later system messages such as the summary of older chunks change from chunk to chunk
+                if self.cache_prompt and not system and blocks:
+                    blocks[-1]['cache_control'] = {"type": "ephemeral"}
+
+                system.extend(blocks)
+            else:
+                conversation.append(message)
+
+        return system, conversation
+
+    def _record_usage(self, model, usage, started, ttft=None):
+        # Returns the token counts and the cost of a response, and records how many prompt tokens were cached
+        cache_read_tokens = getattr(usage, 'cache_read_input_tokens', None) or 0
+        cache_write_tokens = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        completion_tokens = usage.output_tokens
+        prompt_tokens = usage.input_tokens + cache_read_tokens + cache_write_tokens
+
+        total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens, cache_read_tokens, cache_write_tokens)
+        self.usage.record(
+            model, prompt_tokens, completion_tokens, total_cost,
+            full_cost=self.estimate_api_cost(model, prompt_tokens, completion_tokens),
+            cached_tokens=cache_read_tokens,
+            cache_write_tokens=cache_write_tokens,
+            latency=time.perf_counter() - started,
+            ttft=ttft
+        )
+
+        return completion_tokens, prompt_tokens, total_cost
+
+    def _stream_result(self, parser, response, started):
+        response_message = parser.finish()
+        if not response_message:
+            return None, None, None, None, None, None
+
+        ttft = parser.first_token_at - started if parser.first_token_at else None
+        completion_tokens, prompt_tokens, total_cost = self._record_usage(response.model, response.usage, started, ttft)
+
+        return response_message, total_cost, response.role, response.model, completion_tokens, prompt_tokens
+
+    def _parse_response(self, response, messages, started):
+        # Returns the result tuple and the tool calls that still have to run to complete it
+        verdict = next((c for c in response.content if c.type == "tool_use" and c.name == verdict_tool['name']), None)
+        if self.structured and verdict is not None:
+            response_message = json.dumps(verdict.input, separators=(',', ':'), ensure_ascii=False)
+            tool_calls = None
+        elif response.stop_reason == "end_turn":
+            response_message = self._reply_text(response)
+            tool_calls = None
         elif response.stop_reason == "tool_use" and self.tools and self.functions:
+            response_message = None
             tool_calls = [c for c in response.content if c.type == "tool_use"]
-            role = response.role
-            model = response.model
-            completion_tokens = response.usage.input_tokens
-            prompt_tokens = response.usage.output_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
-
             messages.append({"role": response.role, "content": response.content})
+        else:
+            return (None, None, None, None, None, None), None
 
-            response_message, new_cost, new_completion_tokens, new_prompt_tokens = self.call_function(tool_calls, model, messages)
+        model = response.model
+        completion_tokens, prompt_tokens, total_cost = self._record_usage(model, response.usage, started)
 
-            total_cost += new_cost
-            completion_tokens += new_completion_tokens
-            prompt_tokens += new_prompt_tokens
+        return (response_message, total_cost, response.role, model, completion_tokens, prompt_tokens), tool_calls
 
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
+    def _resolve_tool_call(self, tool_call):
+        # A bad tool call gives the model an error result instead of failing the request
+        function_name = tool_call.name
+        if function_name not in (self.functions or {}):
+            return failed_call(function_name, ValueError(f'unknown function {function_name}'))
+        function_args = tool_call.input or {}
 
-        else:
-            return None, None, None, None, None, None
-        
-        return response_message, total_cost, role, model, completion_tokens, prompt_tokens
+        logging.info(f'Calling function: {function_name} with arguments: {function_args}')
 
-        
-    def call_function(self, tool_calls, model, messages):
-        '''
-        This function calls the function specified in the tool_call object and returns the response to the model.
+        return function_name, self.functions[function_name], function_args
 
-        Args:
-            tool_call (list): List of tool_call objects
-            model (str): Model used for the API call
-            messages (list): List of messages
+    def _tool_result(self, tool_call, function_response):
+        return {
+            "type": "tool_result",
+            "tool_use_id": tool_call.id,
+            "content": [{"type": "text", "text": str(function_response)}],
+        }
 
-        Returns:
-            str: Response from the model
-        '''
-        # Call all the functions and get the response
-        for tool_call in tool_calls:
-            function_name = tool_call.name
-            function_to_call = self.functions[function_name]
-            function_args = tool_call.input
-
-            logging.info(f'Calling function: {function_name} with arguments: {function_args}')
-
-            function_response = function_to_call(**function_args)
-
-            # Append the response to the backend messages
-            messages.append(
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": tool_call.id,
-                            "content": [{"type": "text", "text": str(function_response)}],
-                        }
-                    ],
-                }
-            )
-
-            # Call the model again with the updated backend messages
-            second_response = self.claude_client.messages.create(
-                model=model,   
-                messages=messages,
-                max_tokens=1000,
-                tools=self.tools
-            )
-
-            # Update the cost for the recent model call
-            model_reply = second_response.model
-            new_completion_tokens = second_response.usage.input_tokens
-            new_prompt_tokens = second_response.usage.output_tokens
-
-            new_cost = self.estimate_api_cost(model_reply, new_prompt_tokens, new_completion_tokens)
-            
-            return second_response.content[0].text, new_cost, new_completion_tokens, new_prompt_tokens
+    def _parse_tool_reply(self, second_response, started):
+        # Update the cost for the recent model call
+        new_completion_tokens, new_prompt_tokens, new_cost = self._record_usage(second_response.model, second_response.usage, started)
+
+        return self._reply_text(second_response), new_cost, new_completion_tokens, new_prompt_tokens
+
+    def _reply_text(self, response):
+        # The reply may start with a thinking or tool_use block, a reply without text gives no response
+        text = next((c.text for c in response.content if c.type == "text"), None)
+        if text is None:
+            logging.error(f'No text in the reply of {response.model}, stop reason {response.stop_reason}')
+
+        return text
+
+    def _merge_tool_reply(self, result, tool_reply):
+        response_message, total_cost, role, model, completion_tokens, prompt_tokens = result
+        response_message, new_cost, new_completion_tokens, new_prompt_tokens = tool_reply
+
+        return response_message, total_cost + new_cost, role, model, completion_tokens + new_completion_tokens, prompt_tokens + new_prompt_tokens
+
+    def _log_result(self, result, user_id=None):
+        if result[0] is not None:
+            logging.info(f'Response: {result[0]}')
+            logging.info(f'Total Cost: {result[1]} INR')
+
+            # The cost counts towards the spend limit of the call
+            if self.budget is not None:
+                self.budget.spend(user_id, result[1])
+
+        return result
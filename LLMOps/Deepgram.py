@@ -1,9 +1,10 @@
-from deepgram import DeepgramClient, PrerecordedOptions
+from LLMOps.transport import get_http_client, provider_hosts
 import logging
 
 class DeepgramSpeechHandler:
     '''
     This class handles the interaction with the OpenAI Speech API.
+    The Deepgram SDK opens a new connection for every request, so the REST API is called through the shared pool.
     '''
 
     nova_2_price = 0.0043 # $0.0043 per minute
@@ -16,7 +17,7 @@ class DeepgramSpeechHandler:
         - api_key: The OpenAI API key
         '''
         self.api_key = api_key
-        self.deepgram_client = DeepgramClient(api_key)
+        self.http_client = get_http_client()
 
     def estimate_api_cost(self, model, amount):
         '''
@@ -51,13 +52,19 @@ class DeepgramSpeechHandler:
 
         if model=='nova-2':
             with open(audio_file, 'rb') as buffer_data:
-                payload = { 'buffer': buffer_data }
+                payload = buffer_data.read()
 
-                options = PrerecordedOptions(
-                    smart_format=True, model="nova-2", language="en-IN"
+                options = {'smart_format': 'true', 'model': 'nova-2', 'language': 'en-IN'}
+
+                response = self.http_client.post(
+                    f"{provider_hosts['deepgram']}/v1/listen",
+                    params=options,
+                    headers={'Authorization': f'Token {self.api_key}', 'Content-Type': 'audio/*'},
+                    content=payload
                 )
+                response.raise_for_status()
+                response = response.json()
 
-                response = self.deepgram_client.listen.prerecorded.v('1').transcribe_file(payload, options)
                 text = response['results']['channels'][0]['alternatives'][0]['transcript']
                 length = response['metadata']['duration']
 
@@ -1,23 +1,39 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from datetime import datetime
+from LLMOps.transport import get_http_client, get_async_http_client
+from LLMOps.verdict import DecisionParser, verdict_schema
+from LLMOps.usage import UsageTracker
+from LLMOps.tool_executor import ToolExecutor, failed_call
 import logging
 import json
+import time
 
 class OpenAILLMHandler:
     '''
     This class handles the interaction with the OpenAI Large Language Model API.
+    Every method has an async variant (send_text_async, ...) that shares the pooled HTTP client of the event loop.
+    OpenAI caches prompt prefixes automatically, so the messages are sent with the static system prompt first and
+    everything that changes per chunk after it. The cached and uncached prompt tokens of every request are in usage.
     '''
     openai_models = {'gpt-3.5-turbo-0125' : [0.50, 1.50],
           'gpt-4-0613' : [30.00, 60.00],
           'gpt-4-0125-preview' : [30.00, 60.00],
           'gpt-4-1106-vision-preview' : [10.00, 30.00],
           'gpt-4-turbo-2024-04-09': [10.00, 30.00],
-          'gpt-4o-2024-05-13': [5.00, 15.00]
+          'gpt-4o-2024-05-13': [5.00, 15.00],
+          'gpt-4o-2024-08-06': [2.50, 10.00],
+          'gpt-4o-mini-2024-07-18': [0.15, 0.60]
           }
     
     usd_to_inr = 85.00
+
+    # Cached prompt tokens are billed at half the input price
+    cached_input_discount = 0.50
+
+    # Models that follow a JSON schema, the older ones are only asked for a JSON object
+    json_schema_models = ('gpt-4o-2024-08-06', 'gpt-4o-mini-2024-07-18')
     
-    def __init__(self, api_key, preprompt=None, optimize=False, tools=None, functions=None):
+    def __init__(self, api_key, preprompt=None, optimize=False, tools=None, functions=None, compactor=None, cache=None, tool_executor=None, budget=None, structured=False, verdict_max_tokens=200):
         '''
         Parameters:
         - api_key: The OpenAI API key
@@ -31,29 +47,71 @@ class OpenAILLMHandler:
             default: None
         - functions: The functions available to the model
             default: None
+        - compactor: ConversationCompactor that bounds the messages sent for long conversations
+            default: None (the whole conversation is sent)
+        - cache: ResponseCache of the text responses, keyed by the transcripts sent
+            default: None (every request goes to the model)
+        - tool_executor: ToolExecutor that runs the functions requested by the model
+            default: None (a ToolExecutor with a 10 second timeout per function)
+        - budget: TokenBudget that checks the tokens and the cost of every request before it is sent,
+            the user_id of a request is the call its cost counts towards
+            default: None (requests are not checked)
+        - structured: Ask for the verdict as JSON (see verdict_schema), with at most verdict_max_tokens tokens
+            default: False
+        - verdict_max_tokens: The maximum number of tokens of a structured verdict
+            default: 200
         '''
         self.api_key = api_key
-        self.openai_client = OpenAI()
+        self.openai_client = OpenAI(api_key=api_key, http_client=get_http_client())
         self.preprompt = preprompt
         self.optimize = optimize
         self.tools = tools
         self.functions = functions
+        self.compactor = compactor
+        self.cache = cache
+        self.tool_executor = tool_executor or ToolExecutor()
+        self.budget = budget
+        self.structured = structured
+        self.verdict_max_tokens = verdict_max_tokens
+        self.usage = UsageTracker()
+
+        self._async_client = None
+        self._async_http_client = None
+
+    @property
+    def async_client(self):
+        '''
+        The AsyncOpenAI client of the running event loop, built on the pooled HTTP client of the loop.
+        '''
+        http_client = get_async_http_client()
+        if self._async_http_client is not http_client:
+            self._async_client = AsyncOpenAI(api_key=self.api_key, http_client=http_client)
+            self._async_http_client = http_client
+
+        return self._async_client
 
-    def estimate_api_cost(self, model, input_tokens, output_tokens):
+    def estimate_api_cost(self, model, input_tokens, output_tokens, cached_tokens=0):
         '''
         This function estimates the cost of the API call based on the model, input tokens and output tokens.
 
         Parameters:
         - model (str): Model used for the API call
-        - input_tokens (int): Number of input tokens
+        - input_tokens (int): Number of input tokens, cached or not
         - output_tokens (int): Number of output tokens
+        - cached_tokens (int): Number of input tokens read from the prompt cache
+            default: 0
         
         Returns:
         - float: Cost of the API call (in INR)
         '''
-        
+        if model not in self.openai_models:
+            logging.warning(f'No price for model {model}, its cost is not counted')
+            return 0.0
+
+        input_price, output_price = self.openai_models[model]
+
         # Estimate the cost
-        cost = ((input_tokens/1e6)*self.openai_models[model][0] + (output_tokens/1e6)*self.openai_models[model][1])*self.usd_to_inr
+        cost = (((input_tokens - cached_tokens)/1e6)*input_price + (cached_tokens/1e6)*input_price*self.cached_input_discount + (output_tokens/1e6)*output_price)*self.usd_to_inr
         
         return cost
     
@@ -75,66 +133,114 @@ class OpenAILLMHandler:
         - role: The role of the message
         - model: The model used
         - completion_tokens: The number of tokens generated
-        - prompt_tokens: The number of tokens in the prompt
+        - prompt_tokens: The number of tokens in the prompt (cached and uncached)
+        The cached and uncached prompt tokens of the request are in usage.last, their totals in usage.metrics().
         '''
-        # add preprompt to the last message
-        if self.preprompt:
-            messages[-1]['content'] = self.preprompt + messages[-1]['content']
-        
-        if self.optimize:
-            # iterate through the messages and check if the message has image and remove
-            for i in range(len(messages)):
-                try:
-                    if 'image_url' == messages[i]['content'][1]['type']:
-                        del messages[i]
-                except:
-                    pass
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            return cached
 
         # Send the text to OpenAI LLM
-        response = self.openai_client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    tools=self.tools,
-                    tool_choice="auto" if self.tools else None,
-                    user=user_id,
-                    max_tokens=max_tokens,
-                )
-        
-        if response.choices[0].message.content:
-            response_message = response.choices[0].message.content
-            role = response.choices[0].message.role
-            model = response.model
-            completion_tokens = response.usage.completion_tokens
-            prompt_tokens = response.usage.prompt_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
-
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
-        elif response.choices[0].message.tool_calls and self.tools and self.functions:
-            response_message = response.choices[0].message
-            tool_calls = response.choices[0].message.tool_calls
-            role = response.choices[0].message.role
-            model = response.model
-            completion_tokens = response.usage.completion_tokens
-            prompt_tokens = response.usage.prompt_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
-
-            messages.append(response_message)
-
-            response_message, new_cost, new_completion_tokens, new_prompt_tokens = self.call_function(tool_calls, model, messages)
-
-            total_cost += new_cost
-            completion_tokens += new_completion_tokens
-            prompt_tokens += new_prompt_tokens
-
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
+        started = time.perf_counter()
+        response = self.openai_client.chat.completions.create(**self._request_args(messages, model, user_id, max_tokens))
 
-        else:
-            return None, None, None, None, None, None
-        
-        return response_message, total_cost, role, model, completion_tokens, prompt_tokens
-            
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, self.call_function(tool_calls, result[3], messages))
+
+        return self._cache_store(key, self._log_result(result, user_id))
+
+    async def send_text_async(self, messages, model='gpt-3.5-turbo-0125', user_id=None, max_tokens=1000):
+        '''
+        This method is the async variant of send_text, it takes the same parameters and returns the same values.
+        '''
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            return cached
+
+        # Send the text to OpenAI LLM
+        started = time.perf_counter()
+        response = await self.async_client.chat.completions.create(**self._request_args(messages, model, user_id, max_tokens))
+
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, await self.call_function_async(tool_calls, result[3], messages))
+
+        return self._cache_store(key, self._log_result(result, user_id))
+    
+    def send_text_stream(self, messages, model='gpt-3.5-turbo-0125', user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method streams the response of the OpenAI model and calls on_decision as soon as the Decision line is complete.
+        Tools are not offered to the model in streaming mode.
+
+        Parameters:
+        - messages, model, user_id, max_tokens: See send_text
+        - on_decision: Function called with the decision (fraud, not_fraud or need_more_time) while the
+            reasoning and action are still being generated
+            default: None
+
+        Returns:
+        - The same values as send_text, once the response is complete
+        '''
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+        parser = DecisionParser(on_decision)
+
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            parser.feed(cached[0])
+            parser.finish()
+            return cached
+
+        started = time.perf_counter()
+        stream = self.openai_client.chat.completions.create(**self._stream_args(messages, model, user_id, max_tokens))
+
+        usage = None
+        for chunk in stream:
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices:
+                parser.feed(chunk.choices[0].delta.content)
+
+        return self._cache_store(key, self._log_result(self._stream_result(parser, model, usage, started), user_id))
+
+    async def send_text_stream_async(self, messages, model='gpt-3.5-turbo-0125', user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method is the async variant of send_text_stream, it takes the same parameters and returns the same values.
+        '''
+        self._prepare_text(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+        parser = DecisionParser(on_decision)
+
+        key, cached = self._cache_lookup(messages, model)
+        if cached:
+            parser.feed(cached[0])
+            parser.finish()
+            return cached
+
+        started = time.perf_counter()
+        stream = await self.async_client.chat.completions.create(**self._stream_args(messages, model, user_id, max_tokens))
+
+        usage = None
+        async for chunk in stream:
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices:
+                parser.feed(chunk.choices[0].delta.content)
+
+        return self._cache_store(key, self._log_result(self._stream_result(parser, model, usage, started), user_id))
     
     def send_text_and_image(self, messages, model='gpt-4o-2024-05-13', user_id=None, max_tokens=1000):
         '''
@@ -155,112 +261,286 @@ class OpenAILLMHandler:
         - role: The role of the message
         - model: The model used
         - completion_tokens: The number of tokens generated
-        - prompt_tokens: The number of tokens in the prompt
+        - prompt_tokens: The number of tokens in the prompt (cached and uncached)
+        The cached and uncached prompt tokens of the request are in usage.last, their totals in usage.metrics().
         '''
-        # add preprompt to the last message
-        if self.preprompt:
-            messages[-1]['content'][0]['text'] = self.preprompt + messages[-1]['content'][0]['text']
+        self._prepare_image(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+
+        # Send the text to OpenAI LLM
+        started = time.perf_counter()
+        response = self.openai_client.chat.completions.create(**self._request_args(messages, model, user_id, max_tokens))
+
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, self.call_function(tool_calls, result[3], messages))
+
+        return self._log_result(result, user_id)
+
+    async def send_text_and_image_async(self, messages, model='gpt-4o-2024-05-13', user_id=None, max_tokens=1000):
+        '''
+        This method is the async variant of send_text_and_image, it takes the same parameters and returns the same values.
+        '''
+        self._prepare_image(messages)
+        messages = self._request_messages(messages)
+        messages, model = self._check_budget(messages, model, max_tokens, user_id)
+
+        # Send the text to OpenAI LLM
+        started = time.perf_counter()
+        response = await self.async_client.chat.completions.create(**self._request_args(messages, model, user_id, max_tokens))
+
+        result, tool_calls = self._parse_response(response, messages, started)
+        if tool_calls:
+            result = self._merge_tool_reply(result, await self.call_function_async(tool_calls, result[3], messages))
+
+        return self._log_result(result, user_id)
+
+    def call_function(self, tool_calls, model, messages):
+        '''
+        This function calls the function specified in the tool_call object and returns the response to the model.
+
+        Args:
+            tool_call (list): List of tool_call objects
+
+        Returns:
+            str: Response from the model
+        '''
+        # Call all the functions at the same time and append all the responses to the backend messages
+        calls = [self._resolve_tool_call(tool_call) for tool_call in tool_calls]
+        function_responses = self.tool_executor.run(calls)
+
+        for tool_call, (function_name, _, _), function_response in zip(tool_calls, calls, function_responses):
+            messages.append(self._tool_message(tool_call, function_name, function_response))
+
+        # Call the model again with the updated backend messages
+        started = time.perf_counter()
+        second_response = self.openai_client.chat.completions.create(
+            model=model,   
+            messages=messages,
+        )
+
+        return self._parse_tool_reply(second_response, started)
+
+    async def call_function_async(self, tool_calls, model, messages):
+        '''
+        This function is the async variant of call_function, the functions run in worker threads.
+        '''
+        # Call all the functions at the same time and append all the responses to the backend messages
+        calls = [self._resolve_tool_call(tool_call) for tool_call in tool_calls]
+        function_responses = await self.tool_executor.run_async(calls)
+
+        for tool_call, (function_name, _, _), function_response in zip(tool_calls, calls, function_responses):
+            messages.append(self._tool_message(tool_call, function_name, function_response))
 
+        # Call the model again with the updated backend messages
+        started = time.perf_counter()
+        second_response = await self.async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+        )
+
+        return self._parse_tool_reply(second_response, started)
+
+    def _prepare_text(self, messages):
+        # add preprompt to a copy of the last message, the message may be shared with a hedged request
+        if self.preprompt:
+            messages[-1] = {**messages[-1], 'content': self.preprompt + messages[-1]['content']}
+        
         if self.optimize:
             # iterate through the messages and check if the message has image and remove
-            for i in range(len(messages)-1):
+            for i in range(len(messages)):
                 try:
                     if 'image_url' == messages[i]['content'][1]['type']:
                         del messages[i]
                 except:
                     pass
 
-        # Send the text to OpenAI LLM
-        response = self.openai_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=self.tools,
-            tool_choice="auto" if self.tools else None,
-            user=user_id,
-            max_tokens=max_tokens,
-            )
+    def _check_budget(self, messages, model, max_tokens, user_id):
+        # Trims the request, moves it to a cheaper model or raises BudgetExceededError before it is sent
+        if self.budget is None:
+            return messages, model
 
-        if response.choices[0].message.content:
-            response_message = response.choices[0].message.content
-            role = response.choices[0].message.role
-            model = response.model
-            completion_tokens = response.usage.completion_tokens
-            prompt_tokens = response.usage.prompt_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
+        def price(model, prompt_tokens, completion_tokens):
+            return self.estimate_api_cost(model, prompt_tokens, completion_tokens) if model in self.openai_models else None
 
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
-        
-        elif response.choices[0].message.tool_calls and self.tools and self.functions:
-            response_message = response.choices[0].message
-            tool_calls = response.choices[0].message.tool_calls
-            role = response.choices[0].message.role
-            model = response.model
-            completion_tokens = response.usage.completion_tokens
-            prompt_tokens = response.usage.prompt_tokens
-            total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens)
+        return self.budget.check(
+            messages, model, self._max_tokens(max_tokens), price=price, call_id=user_id, models=self.openai_models
+        )
 
-            messages.append(response_message)
+    def _request_messages(self, messages):
+        # The conversation keeps every message, the request only the compacted ones
+        if self.compactor is None:
+            return messages
 
-            response_message, new_cost, new_completion_tokens, new_prompt_tokens = self.call_function(tool_calls, model, messages)
+        return self.compactor.compact(messages)
 
-            total_cost += new_cost
-            completion_tokens += new_completion_tokens
-            prompt_tokens += new_prompt_tokens
+    def _cache_lookup(self, messages, model):
+        # A cached response costs nothing, so its cost and token counts are zero
+        if self.cache is None:
+            return None, None
 
-            logging.info(f'Response: {response_message}')
-            logging.info(f'Total Cost: {total_cost} INR')
+        key = self.cache.key(messages, model)
+        cached = self.cache.get(key)
+        if cached is None:
+            return key, None
 
-        else:
+        response_message, total_cost, role, model, completion_tokens, prompt_tokens = cached
+        logging.info(f'Cached response: {response_message}')
+
+        return key, (response_message, 0.0, role, model, 0, 0)
+
+    def _cache_store(self, key, result):
+        if self.cache is not None:
+            self.cache.put(key, result)
+
+        return result
+
+    def _prepare_image(self, messages):
+        # add preprompt to a copy of the last message, the message may be shared with a hedged request
+        if self.preprompt:
+            content = messages[-1]['content']
+            text = {**content[0], 'text': self.preprompt + content[0]['text']}
+            messages[-1] = {**messages[-1], 'content': [text] + content[1:]}
+
+        if self.optimize:
+            # iterate through the messages and check if the message has image and remove
+            for i in range(len(messages)-1):
+                try:
+                    if 'image_url' == messages[i]['content'][1]['type']:
+                        del messages[i]
+                except:
+                    pass
+
+    def _request_args(self, messages, model, user_id, max_tokens):
+        args = {
+            'model': model,
+            'messages': messages,
+            'tools': self.tools,
+            'tool_choice': "auto" if self.tools else None,
+            'user': user_id,
+            'max_tokens': self._max_tokens(max_tokens),
+        }
+        if self.structured:
+            args['response_format'] = self._response_format(model)
+
+        return args
+
+    def _stream_args(self, messages, model, user_id, max_tokens):
+        args = {
+            'model': model,
+            'messages': messages,
+            'user': user_id,
+            'max_tokens': self._max_tokens(max_tokens),
+            'stream': True,
+            'stream_options': {'include_usage': True},
+        }
+        if self.structured:
+            args['response_format'] = self._response_format(model)
+
+        return args
+
+    def _max_tokens(self, max_tokens):
+        # A structured verdict is short, the tight limit also bounds the generation time
+        return min(max_tokens, self.verdict_max_tokens) if self.structured else max_tokens
+
+    def _response_format(self, model):
+        if model in self.json_schema_models:
+            return {'type': 'json_schema', 'json_schema': {'name': 'verdict', 'strict': True, 'schema': verdict_schema}}
+
+        return {'type': 'json_object'}
+
+    def _stream_result(self, parser, model, usage, started):
+        response_message = parser.finish()
+        if not response_message:
             return None, None, None, None, None, None
-        
-        return response_message, total_cost, role, model, completion_tokens, prompt_tokens
 
-        
-    def call_function(self, tool_calls, model, messages):
-        '''
-        This function calls the function specified in the tool_call object and returns the response to the model.
+        ttft = parser.first_token_at - started if parser.first_token_at else None
+        completion_tokens, prompt_tokens, total_cost = self._record_usage(model, usage, started, ttft)
+
+        return response_message, total_cost, 'assistant', model, completion_tokens, prompt_tokens
+
+    def _record_usage(self, model, usage, started, ttft=None):
+        # Returns the token counts and the cost of a response, and records how many prompt tokens were cached
+        completion_tokens = usage.completion_tokens if usage else 0
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', None) or 0
+
+        total_cost = self.estimate_api_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        self.usage.record(
+            model, prompt_tokens, completion_tokens, total_cost,
+            full_cost=self.estimate_api_cost(model, prompt_tokens, completion_tokens),
+            cached_tokens=cached_tokens,
+            latency=time.perf_counter() - started,
+            ttft=ttft
+        )
+
+        return completion_tokens, prompt_tokens, total_cost
+
+    def _parse_response(self, response, messages, started):
+        # Returns the result tuple and the tool calls that still have to run to complete it
+        message = response.choices[0].message
+
+        if message.content:
+            response_message = message.content
+            tool_calls = None
+        elif message.tool_calls and self.tools and self.functions:
+            response_message = message
+            tool_calls = message.tool_calls
+            messages.append(message)
+        else:
+            return (None, None, None, None, None, None), None
 
-        Args:
-            tool_call (list): List of tool_call objects
+        model = response.model
+        completion_tokens, prompt_tokens, total_cost = self._record_usage(model, response.usage, started)
 
-        Returns:
-            str: Response from the model
-        '''
-        # Call all the functions and get the response
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_to_call = self.functions[function_name]
-            function_args = json.loads(tool_call.function.arguments)
+        return (response_message, total_cost, message.role, model, completion_tokens, prompt_tokens), tool_calls
 
-            logging.info(f'Calling function: {function_name} with arguments: {function_args}')
+    def _resolve_tool_call(self, tool_call):
+        # A bad tool call gives the model an error result instead of failing the request
+        function_name = tool_call.function.name
+        if function_name not in (self.functions or {}):
+            return failed_call(function_name, ValueError(f'unknown function {function_name}'))
+        try:
+            function_args = json.loads(tool_call.function.arguments or '{}')
+        except json.JSONDecodeError as e:
+            return failed_call(function_name, ValueError(f'arguments are not valid JSON: {str(e)}'))
 
-            function_response = function_to_call(**function_args)
+        logging.info(f'Calling function: {function_name} with arguments: {function_args}')
 
-            # Append the response to the backend messages
-            messages.append(
-                {
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": function_name,
-                    "content": function_response,
-                }
-            )
+        return function_name, self.functions[function_name], function_args
 
-            # Call the model again with the updated backend messages
-            second_response = self.openai_client.chat.completions.create(
-                model=model,   
-                messages=messages,
-            )
+    def _tool_message(self, tool_call, function_name, function_response):
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "name": function_name,
+            "content": function_response,
+        }
 
-            # Update the cost for the recent model call
-            model_reply = second_response.model
-            new_prompt_tokens = second_response.usage.completion_tokens
-            new_completion_tokens = second_response.usage.prompt_tokens
+    def _parse_tool_reply(self, second_response, started):
+        # Update the cost for the recent model call
+        new_completion_tokens, new_prompt_tokens, new_cost = self._record_usage(second_response.model, second_response.usage, started)
 
-            new_cost = self.estimate_api_cost(model_reply, new_prompt_tokens, new_completion_tokens)
-            
-            return second_response.choices[0].message.content, new_cost, new_completion_tokens, new_prompt_tokens
+        return second_response.choices[0].message.content, new_cost, new_completion_tokens, new_prompt_tokens
+
+    def _merge_tool_reply(self, result, tool_reply):
+        response_message, total_cost, role, model, completion_tokens, prompt_tokens = result
+        response_message, new_cost, new_completion_tokens, new_prompt_tokens = tool_reply
+
+        return response_message, total_cost + new_cost, role, model, completion_tokens + new_completion_tokens, prompt_tokens + new_prompt_tokens
+
+    def _log_result(self, result, user_id=None):
+        if result[0] is not None:
+            logging.info(f'Response: {result[0]}')
+            logging.info(f'Total Cost: {result[1]} INR')
+
+            # The cost counts towards the spend limit of the call
+            if self.budget is not None:
+                self.budget.spend(user_id, result[1])
+
+        return result
 
 
 class OpenAISpeechHandler:
@@ -279,7 +559,7 @@ class OpenAISpeechHandler:
         - api_key: The OpenAI API key
         '''
         self.api_key = api_key
-        self.openai_client = OpenAI()
+        self.openai_client = OpenAI(api_key=api_key, http_client=get_http_client())
 
     def estimate_api_cost(self, model, amount):
         '''
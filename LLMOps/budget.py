@@ -0,0 +1,321 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+from LLMOps.compaction import estimate_tokens, message_text, split_turns, message_role
+
+# tiktoken is optional (pip install tiktoken), without it the tokens are estimated from the length of the text
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Context windows (in tokens) of the models used by the handlers
+context_windows = {
+    'gpt-3.5-turbo-0125': 16385,
+    'gpt-4-0613': 8192,
+    'gpt-4-0125-preview': 128000,
+    'gpt-4-1106-vision-preview': 128000,
+    'gpt-4-turbo-2024-04-09': 128000,
+    'gpt-4o-2024-05-13': 128000,
+    'gpt-4o-2024-08-06': 128000,
+    'gpt-4o-mini-2024-07-18': 128000,
+    'claude-3-5-sonnet-20240620': 200000,
+    'claude-3-5-sonnet-20241022': 200000,
+    'claude-3-opus-20240229': 200000,
+    'claude-3-haiku-20240307': 200000,
+}
+
+policies = ('reject', 'trim', 'downgrade')
+
+class BudgetExceededError(Exception):
+    '''
+    This exception is raised when a request does not fit the context window or the spend limits.
+    '''
+    pass
+
+class TokenCounter:
+    '''
+    This class counts the prompt tokens of a request before it is sent.
+    The count of every message is cached, so counting a growing conversation only tokenizes the new messages.
+    '''
+
+    # Tokens added by the chat format to every message and to the whole request
+    message_overhead = 4
+    request_overhead = 3
+
+    # Tokens of an image (a high detail 512x512 tile)
+    image_tokens = 765
+
+    def __init__(self, max_entries=4096):
+        '''
+        Parameters:
+        - max_entries: The number of message counts kept
+            default: 4096
+        '''
+        self.max_entries = max_entries
+        self.exact = tiktoken is not None
+
+        self._counts = OrderedDict()
+        self._encodings = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, messages, model=None):
+        '''
+        This method counts the prompt tokens of the messages.
+
+        Parameters:
+        - messages: The messages to send
+        - model: The model, to pick its tokenizer
+            default: None
+
+        Returns:
+        - int: The number of prompt tokens
+        '''
+        return sum(self.count_message(message, model) for message in messages) + self.request_overhead
+
+    def count_message(self, message, model=None):
+        '''
+        This method counts the tokens of one message.
+
+        Parameters:
+        - message: The message (dict, or a message object returned by the SDK)
+        - model: The model, to pick its tokenizer
+            default: None
+
+        Returns:
+        - int: The number of tokens
+        '''
+        encoding = self._encoding(model)
+        text = message_text(message)
+        key = (encoding.name if encoding else None, message_role(message), text, self._images(message))
+
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self._counters['hits'] += 1
+                return count
+
+        tokens = len(encoding.encode(text, disallowed_special=())) if encoding else estimate_tokens(text)
+        count = tokens + key[3] * self.image_tokens + self.message_overhead
+
+        with self._lock:
+            self._counts[key] = count
+            self._counters['misses'] += 1
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+
+        return count
+
+    def metrics(self):
+        '''
+        This method returns the counters of the message cache.
+
+        Returns:
+        - dict: Hits, misses and whether the counts come from a tokenizer
+        '''
+        with self._lock:
+            metrics = dict(self._counters)
+
+        metrics['exact'] = self.exact
+        return metrics
+
+    def _encoding(self, model):
+        if tiktoken is None:
+            return None
+
+        if model not in self._encodings:
+            try:
+                self._encodings[model] = tiktoken.encoding_for_model(model)
+            except (KeyError, TypeError):
+                # Claude and unknown models are counted with the GPT-4 tokenizer, close enough for a budget
+                self._encodings[model] = tiktoken.get_encoding('cl100k_base')
+
+        return self._encodings[model]
+
+    @staticmethod
+    def _images(message):
+        content = message.get('content') if isinstance(message, dict) else getattr(message, 'content', None)
+        if not isinstance(content, list):
+            return 0
+
+        return sum(
+            1 for block in content
+            if (block.get('type') if isinstance(block, dict) else getattr(block, 'type', None)) in ('image_url', 'image')
+        )
+
+class TokenBudget:
+    '''
+    This class checks every request before it is sent: the prompt and the response must fit the context window
+    of the model, and the estimated cost must fit the per request and per call spend limits.
+    A request that does not fit is rejected, trimmed (the oldest chunks are dropped) or sent to a cheaper model,
+    so a marathon call cannot fail slowly at the provider or keep spending without bound.
+    '''
+
+    def __init__(self, policy='trim', max_prompt_tokens=None, max_request_cost=None, max_call_cost=None,
+                 fallback_model=None, windows=None, counter=None):
+        '''
+        Parameters:
+        - policy: What to do with a request that does not fit: reject, trim or downgrade
+            (downgrade sends it to fallback_model, and trims it if it still does not fit)
+            default: trim
+        - max_prompt_tokens: The number of prompt tokens a request may have, on top of the context window
+            default: None (only the context window)
+        - max_request_cost: The estimated cost a request may have (in INR), the response counted at max_tokens
+            default: None (no limit)
+        - max_call_cost: The cost all the requests of a call may add up to (in INR)
+            default: None (no limit)
+        - fallback_model: The cheaper model used by the downgrade policy
+            default: None
+        - windows: Context windows of models missing from context_windows
+            default: None
+        - counter: TokenCounter shared with other budgets
+            default: None (a new TokenCounter)
+        '''
+        if policy not in policies:
+            raise ValueError(f'Unknown budget policy {policy}, expected one of {policies}')
+
+        self.policy = policy
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_request_cost = max_request_cost
+        self.max_call_cost = max_call_cost
+        self.fallback_model = fallback_model
+        self.windows = {**context_windows, **(windows or {})}
+        self.counter = counter or TokenCounter()
+
+        self._spent = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def check(self, messages, model, max_tokens, price=None, call_id=None, models=None):
+        '''
+        This method checks a request and returns the version of it that fits the budget.
+
+        Parameters:
+        - messages: The messages to send (after compaction)
+        - model: The model
+        - max_tokens: The maximum number of tokens to generate
+        - price: Function (model, prompt_tokens, completion_tokens) returning the cost in INR
+            default: None (the cost limits are not checked)
+        - call_id: The call the request belongs to, for max_call_cost
+            default: None
+        - models: The models the handler can send the request to, a fallback_model outside them is not used
+            (a budget shared by the OpenAI and Claude handlers of a router trims the Claude requests instead)
+            default: None (any model)
+
+        Returns:
+        - list: The messages to send (the same list when nothing was trimmed)
+        - str: The model to use
+
+        Raises:
+        - BudgetExceededError: The request cannot be made to fit
+        '''
+        tokens = self.counter.count(messages, model)
+        problem = self._problem(tokens, model, max_tokens, price, call_id)
+        if problem is None:
+            self._count('allowed')
+            return messages, model
+
+        if self.policy == 'reject':
+            self._count('rejected')
+            raise BudgetExceededError(problem)
+
+        # A fallback model the handler cannot send to is ignored, the request is trimmed instead
+        fallback = self.fallback_model if models is None or self.fallback_model in models else None
+        if self.policy == 'downgrade' and fallback and fallback != model:
+            logging.warning(f'Request sent to {fallback} instead of {model}: {problem}')
+            self._count('downgraded')
+            model = fallback
+            problem = self._problem(tokens, model, max_tokens, price, call_id)
+            if problem is None:
+                return messages, model
+
+        # The oldest chunks are dropped until the request fits, the system prompt and the last chunk are always sent
+        head = 0
+        while head < len(messages) and message_role(messages[head]) == 'system':
+            head += 1
+        system, turns = messages[:head], split_turns(messages[head:])
+
+        counts = [sum(self.counter.count_message(message, model) for message in turn) for turn in turns]
+        tokens = self.counter.count(system, model) + sum(counts)
+        for start in range(1, len(turns)):
+            tokens -= counts[start - 1]
+            if self._problem(tokens, model, max_tokens, price, call_id) is None:
+                logging.warning(f'Request trimmed to its last {len(turns) - start} chunks: {problem}')
+                self._count('trimmed')
+                return system + [message for turn in turns[start:] for message in turn], model
+
+        self._count('rejected')
+        raise BudgetExceededError(problem)
+
+    def spend(self, call_id, cost):
+        '''
+        This method adds the cost of a response to the spend of its call.
+
+        Parameters:
+        - call_id: The call the request belongs to
+        - cost: The cost of the response (in INR)
+        '''
+        if call_id is None or not cost:
+            return
+
+        with self._lock:
+            self._spent[call_id] = self._spent.get(call_id, 0.0) + cost
+
+    def spent(self, call_id):
+        '''
+        This method returns the spend of a call so far (in INR).
+        '''
+        with self._lock:
+            return self._spent.get(call_id, 0.0)
+
+    def release(self, call_id):
+        '''
+        This method forgets the spend of a call once it has ended.
+        '''
+        with self._lock:
+            self._spent.pop(call_id, None)
+
+    def metrics(self):
+        '''
+        This method returns the budget counters.
+
+        Returns:
+        - dict: Requests allowed, trimmed, downgraded and rejected, and the token counter's cache counters
+        '''
+        with self._lock:
+            metrics = dict(self._counters)
+            metrics['calls'] = len(self._spent)
+
+        metrics['token_counter'] = self.counter.metrics()
+        return metrics
+
+    def _problem(self, tokens, model, max_tokens, price, call_id):
+        # Returns why the request does not fit, or None
+        window = self.windows.get(model)
+        if window is not None and tokens + max_tokens > window:
+            return f'{tokens} prompt tokens and {max_tokens} response tokens exceed the {window} token window of {model}'
+
+        if self.max_prompt_tokens is not None and tokens > self.max_prompt_tokens:
+            return f'{tokens} prompt tokens exceed the limit of {self.max_prompt_tokens}'
+
+        if price is None or (self.max_request_cost is None and self.max_call_cost is None):
+            return None
+
+        cost = price(model, tokens, max_tokens)
+        if cost is None:
+            return None
+
+        if self.max_request_cost is not None and cost > self.max_request_cost:
+            return f'the request may cost {cost:.2f} INR, over the limit of {self.max_request_cost} INR'
+
+        spent = self.spent(call_id) if call_id is not None else 0.0
+        if self.max_call_cost is not None and spent + cost > self.max_call_cost:
+            return f'the call has spent {spent:.2f} INR and the request may cost {cost:.2f} INR, over the limit of {self.max_call_cost} INR'
+
+        return None
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
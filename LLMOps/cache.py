@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from LLMOps.compaction import message_text
+
+_chunk_prefix = re.compile(r'^\s*chunk \d+:\s*')
+_punctuation = re.compile(r'[^\w\s]')
+_whitespace = re.compile(r'\s+')
+
+def normalize_transcript(text):
+    '''
+    This function normalizes a transcript so that the same words give the same cache key.
+
+    Parameters:
+    - text: The transcript (e.g. "Chunk 3: Hello, this is your bank.")
+
+    Returns:
+    - str: The normalized transcript (e.g. "hello this is your bank")
+    '''
+    text = _chunk_prefix.sub('', text.lower())
+    text = _punctuation.sub(' ', text)
+    return _whitespace.sub(' ', text).strip()
+
+class ResponseCache:
+    '''
+    This class caches LLM responses by the conversation they were given (transcripts, summaries and previous
+    responses), the model and the prompt version.
+    Entries are kept in memory (LRU with a TTL) and optionally in SQLite, so reprocessing the same recordings
+    or a replayed scam script skips the LLM round trip.
+    '''
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, path=None):
+        '''
+        Parameters:
+        - max_entries: The number of responses kept in memory
+            default: 1024
+        - ttl: Seconds a response stays valid
+            default: 86400 (one day)
+        - path: SQLite file of the on-disk tier
+            default: None (memory only)
+        '''
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+
+        self._entries = OrderedDict()
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)')
+            self._db.commit()
+
+    def key(self, messages, model):
+        '''
+        This method builds the cache key of a request.
+
+        Parameters:
+        - messages: The messages that will be sent (after compaction)
+        - model: The model
+
+        Returns:
+        - str: The key, or None if the request has no transcript to key on
+        '''
+        # The static system prompt is the prompt version, any change to it invalidates the cache
+        static = 1 if messages and self._role(messages[0]) == 'system' else 0
+        prompt_version = hashlib.sha256(message_text(messages[0]).encode()).hexdigest()[:16] if static else ''
+
+        # Everything sent after it is keyed: the transcripts, the compaction summary and the previous verdicts
+        conversation = []
+        for message in messages[static:]:
+            role = self._role(message)
+            text = message_text(message)
+            conversation.append([role, normalize_transcript(text) if role == 'user' else text])
+
+        if not any(text for role, text in conversation if role == 'user'):
+            return None
+
+        payload = json.dumps([model, prompt_version, conversation])
+
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        '''
+        This method looks a response up.
+
+        Parameters:
+        - key: The key returned by key
+
+        Returns:
+        - tuple: The cached result, or None
+        '''
+        if key is None:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return value
+
+                del self._entries[key]
+                self._counters['expired'] += 1
+
+            if self._db is not None:
+                row = self._db.execute('SELECT value, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row and row[1] > now:
+                    value = tuple(json.loads(row[0]))
+                    self._remember(key, row[1], value)
+                    self._counters['disk_hits'] += 1
+                    return value
+                if row:
+                    self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self._db.commit()
+                    if entry is None:
+                        self._counters['expired'] += 1
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        '''
+        This method stores a response.
+
+        Parameters:
+        - key: The key returned by key
+        - value: The result tuple of the request
+        '''
+        if key is None or value[0] is None:
+            return
+
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._counters['stores'] += 1
+
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)',
+                        (key, json.dumps(list(value)), expires_at)
+                    )
+                    self._db.commit()
+                except (sqlite3.Error, TypeError) as e:
+                    logging.error(f'Could not store the response on disk: {str(e)}')
+
+    def metrics(self):
+        '''
+        This method returns the cache counters.
+
+        Returns:
+        - dict: Hits (memory and disk), misses, stores, evictions, expired entries and the hit rate
+        '''
+        with self._lock:
+            metrics = dict(self._counters)
+            metrics['entries'] = len(self._entries)
+
+        hits = metrics.get('memory_hits', 0) + metrics.get('disk_hits', 0)
+        lookups = hits + metrics.get('misses', 0)
+        metrics['hit_rate'] = hits / lookups if lookups else 0.0
+
+        return metrics
+
+    def close(self):
+        '''
+        This method closes the on-disk tier.
+        '''
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    @staticmethod
+    def _role(message):
+        return message.get('role') if isinstance(message, dict) else getattr(message, 'role', None)
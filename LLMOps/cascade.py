@@ -0,0 +1,201 @@
+import logging
+import threading
+from collections import Counter
+from LLMOps.compaction import message_role, message_text
+from LLMOps.verdict import parse_response
+
+class ModelCascade:
+    '''
+    This class sends every chunk to a small, fast model first and only escalates the chunks that need it to a
+    larger model: ambiguous chunks (need_more_time or no decision) and chunks the fast model calls fraud,
+    which the larger model confirms. Most chunks of benign calls stop at the fast model, so the mean latency
+    and cost of a call drop while every fraud verdict still comes from the larger model.
+    '''
+
+    def __init__(self, client, fast_model='gpt-4o-mini-2024-07-18', strong_model='gpt-4o-2024-08-06',
+                 escalate_on=('fraud', 'need_more_time'), sticky=True):
+        '''
+        Parameters:
+        - client: The LLM handler or LLMRouter that sends the requests
+        - fast_model: The model every chunk is sent to first
+            default: gpt-4o-mini-2024-07-18
+        - strong_model: The model escalated chunks are sent to
+            default: gpt-4o-2024-08-06
+        - escalate_on: The decisions of the fast model that are sent to the strong model
+            default: ('fraud', 'need_more_time')
+        - sticky: Once the strong model has decided fraud, the next chunks of the call go straight to it
+            default: True
+        '''
+        self.client = client
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.escalate_on = tuple(escalate_on)
+        self.sticky = sticky
+
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def send_text(self, messages, model=None, user_id=None, max_tokens=1000):
+        '''
+        This method sends the messages like OpenAILLMHandler.send_text and returns the same values,
+        the costs and token counts of both models added up when the chunk was escalated.
+
+        Parameters:
+        - messages: The messages to send
+        - model: The fast model of this request
+            default: None (fast_model)
+        - user_id: The user id
+            default: None
+        - max_tokens: The maximum number of tokens to generate
+            default: 1000
+        '''
+        fast = None
+        reason = self._sticky_reason(messages)
+        if reason is None:
+            fast = self.client.send_text(list(messages), model=model or self.fast_model, user_id=user_id, max_tokens=max_tokens)
+            reason = self._escalation_reason(fast)
+            if reason is None:
+                return fast
+
+        strong = self.client.send_text(list(messages), model=self.strong_model, user_id=user_id, max_tokens=max_tokens)
+        return self._merge(fast, strong)
+
+    def send_text_stream(self, messages, model=None, user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method streams the response like OpenAILLMHandler.send_text_stream and returns the same values.
+        on_decision is called with the decision of the fast model only when it is final, the decisions that
+        are escalated are published by the strong model.
+
+        Parameters:
+        - messages, model, user_id, max_tokens: See send_text
+        - on_decision: Function called with the decision while the rest of the response is generated
+            default: None
+        '''
+        fast = None
+        reason = self._sticky_reason(messages)
+        if reason is None:
+            fast = self.client.send_text_stream(
+                list(messages), model=model or self.fast_model, user_id=user_id, max_tokens=max_tokens,
+                on_decision=self._final_only(on_decision)
+            )
+            reason = self._escalation_reason(fast)
+            if reason is None:
+                return fast
+
+        strong = self.client.send_text_stream(
+            list(messages), model=self.strong_model, user_id=user_id, max_tokens=max_tokens, on_decision=on_decision
+        )
+        return self._merge(fast, strong)
+
+    async def send_text_async(self, messages, model=None, user_id=None, max_tokens=1000):
+        '''
+        This method is the async variant of send_text, it takes the same parameters and returns the same values.
+        '''
+        fast = None
+        reason = self._sticky_reason(messages)
+        if reason is None:
+            fast = await self.client.send_text_async(list(messages), model=model or self.fast_model, user_id=user_id, max_tokens=max_tokens)
+            reason = self._escalation_reason(fast)
+            if reason is None:
+                return fast
+
+        strong = await self.client.send_text_async(list(messages), model=self.strong_model, user_id=user_id, max_tokens=max_tokens)
+        return self._merge(fast, strong)
+
+    async def send_text_stream_async(self, messages, model=None, user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method is the async variant of send_text_stream, it takes the same parameters and returns the same values.
+        '''
+        fast = None
+        reason = self._sticky_reason(messages)
+        if reason is None:
+            fast = await self.client.send_text_stream_async(
+                list(messages), model=model or self.fast_model, user_id=user_id, max_tokens=max_tokens,
+                on_decision=self._final_only(on_decision)
+            )
+            reason = self._escalation_reason(fast)
+            if reason is None:
+                return fast
+
+        strong = await self.client.send_text_stream_async(
+            list(messages), model=self.strong_model, user_id=user_id, max_tokens=max_tokens, on_decision=on_decision
+        )
+        return self._merge(fast, strong)
+
+    def metrics(self):
+        '''
+        This method returns the cascade counters.
+
+        Returns:
+        - dict: Chunks, escalations by reason and the share of chunks escalated to the strong model
+        '''
+        with self._lock:
+            metrics = dict(self._counters)
+
+        escalated = sum(value for key, value in metrics.items() if key.startswith('escalated_'))
+        metrics['escalation_rate'] = escalated / metrics['chunks'] if metrics.get('chunks') else 0.0
+
+        return metrics
+
+    def _sticky_reason(self, messages):
+        # Returns 'sticky' when the previous verdict of the call was fraud, the chunk then skips the fast model
+        self._count('chunks')
+        if not self.sticky:
+            return None
+
+        for message in reversed(messages):
+            if message_role(message) == 'assistant':
+                if parse_response(message_text(message))['decision'] == 'fraud':
+                    self._count('escalated_sticky')
+                    return 'sticky'
+                return None
+
+        return None
+
+    def _escalation_reason(self, result):
+        # Returns why the fast answer is sent to the strong model, or None when it is final
+        decision = parse_response(result[0])['decision'] if result[0] else None
+        if decision is None:
+            reason = 'unparsed'
+        elif decision in self.escalate_on:
+            reason = decision
+        else:
+            return None
+
+        logging.info(f'Escalating the chunk to {self.strong_model}: {reason}')
+        self._count(f'escalated_{reason}')
+        return reason
+
+    def _final_only(self, on_decision):
+        # The decisions that will be escalated are not published, the strong model publishes its own
+        if on_decision is None:
+            return None
+
+        def callback(decision):
+            if decision not in self.escalate_on:
+                on_decision(decision)
+
+        return callback
+
+    @staticmethod
+    def _merge(fast, strong):
+        # The strong answer is returned, with the cost and tokens of both requests
+        if fast is None:
+            return strong
+        if strong[0] is None:
+            # Without an answer from the strong model the fast one is kept
+            return fast
+
+        response_message, total_cost, role, model, completion_tokens, prompt_tokens = strong
+        return (
+            response_message,
+            (total_cost or 0) + (fast[1] or 0),
+            role,
+            model,
+            (completion_tokens or 0) + (fast[4] or 0),
+            (prompt_tokens or 0) + (fast[5] or 0),
+        )
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
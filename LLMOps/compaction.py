@@ -0,0 +1,202 @@
+import re
+from LLMOps.verdict import parse_response
+
+_chunk_number = re.compile(r'^\s*Chunk (\d+):')
+
+def message_text(message):
+    '''
+    This function returns the text of a message, whatever the format of its content.
+
+    Parameters:
+    - message: The message (dict, or a message object returned by the SDK)
+
+    Returns:
+    - str: The text of the message
+    '''
+    content = message.get('content') if isinstance(message, dict) else getattr(message, 'content', None)
+
+    if content is None:
+        return ''
+    if isinstance(content, str):
+        return content
+
+    return '\n'.join(
+        block.get('text', '') if isinstance(block, dict) else getattr(block, 'text', '') or ''
+        for block in content
+    )
+
+def message_role(message):
+    '''
+    This function returns the role of a message.
+
+    Parameters:
+    - message: The message (dict, or a message object returned by the SDK)
+
+    Returns:
+    - str: The role (system, user, assistant or tool)
+    '''
+    return message.get('role') if isinstance(message, dict) else getattr(message, 'role', None)
+
+def estimate_tokens(text):
+    '''
+    This function estimates the number of tokens of a text (about 4 characters per token).
+
+    Parameters:
+    - text: The text
+
+    Returns:
+    - int: The estimated number of tokens
+    '''
+    return len(text) // 4 + 1
+
+def split_turns(messages):
+    '''
+    This function splits a conversation into chunks. A chunk starts with a user message, the tool calls and
+    replies belong to the chunk before them.
+
+    Parameters:
+    - messages: The messages, without the system prompt
+
+    Returns:
+    - list: The chunks, each a list of messages
+    '''
+    turns = []
+    for message in messages:
+        if not turns or (message_role(message) == 'user' and not _is_tool_result(message)):
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+
+    return turns
+
+def _is_tool_result(message):
+    content = message.get('content') if isinstance(message, dict) else None
+    return isinstance(content, list) and any(
+        isinstance(block, dict) and block.get('type') == 'tool_result' for block in content
+    )
+
+class ConversationCompactor:
+    '''
+    This class bounds the prompt sent for every chunk of a long call.
+    The request keeps the system prompt, the last keep_chunks chunks verbatim and a summary of the older chunks
+    (their decisions and reasoning), so the prompt stops growing with the length of the call.
+    The conversation itself is not modified, only the messages sent to the model are compacted.
+    '''
+
+    def __init__(self, keep_chunks=6, token_budget=6000, summary_tokens=600):
+        '''
+        Parameters:
+        - keep_chunks: The number of most recent chunks sent verbatim
+            default: 6
+        - token_budget: The estimated number of prompt tokens the request should stay under,
+            fewer chunks are sent verbatim when they do not fit
+            default: 6000
+        - summary_tokens: The estimated number of tokens of the summary of older chunks
+            default: 600
+        '''
+        self.keep_chunks = keep_chunks
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.last_stats = None
+
+    def compact(self, messages):
+        '''
+        This method builds the messages to send for the next chunk.
+
+        Parameters:
+        - messages: The whole conversation, starting with the system prompt
+
+        Returns:
+        - list: The messages to send (the conversation itself when it does not need compacting)
+        '''
+        head = 0
+        while head < len(messages) and message_role(messages[head]) == 'system':
+            head += 1
+        system, turns = messages[:head], split_turns(messages[head:])
+
+        keep = min(self.keep_chunks, len(turns))
+        while True:
+            older, recent = turns[:len(turns) - keep], turns[len(turns) - keep:]
+            summary = self.summarize(older)
+
+            request = list(system)
+            if summary:
+                request.append({"role": "system", "content": summary})
+            for turn in recent:
+                request.extend(turn)
+
+            tokens = sum(estimate_tokens(message_text(message)) for message in request)
+            if keep <= 1 or tokens <= self.token_budget:
+                break
+            keep -= 1
+
+        self.last_stats = {'chunks': len(turns), 'verbatim': keep, 'summarized': len(older), 'tokens': tokens}
+
+        return request if older else messages
+
+    def summarize(self, turns):
+        '''
+        This method summarizes chunks that are no longer sent verbatim.
+
+        Parameters:
+        - turns: The older chunks, each a list of messages starting with the user message of the chunk
+
+        Returns:
+        - str: The summary, or None if there are no older chunks
+        '''
+        if not turns:
+            return None
+
+        verdicts = []
+        for index, turn in enumerate(turns, start=1):
+            match = _chunk_number.match(message_text(turn[0]))
+            chunk = int(match.group(1)) if match else index
+
+            reply = message_text(turn[-1]) if message_role(turn[-1]) == 'assistant' else ''
+            sections = parse_response(reply)
+            verdicts.append((chunk, sections['decision'] or 'none', sections['reasoning']))
+
+        lines = [
+            f'Summary of chunks {verdicts[0][0]}-{verdicts[-1][0]}, which are no longer repeated.',
+            'Decisions: ' + ', '.join(self._decision_runs(verdicts)),
+        ]
+
+        # The reasoning behind fraud decisions is kept first, then the most recent, as much as fits the summary budget
+        candidates = sorted(
+            (verdict for verdict in verdicts if verdict[2]),
+            key=lambda verdict: (verdict[1] != 'fraud', -verdict[0])
+        )
+        budget = self.summary_tokens - sum(estimate_tokens(line) for line in lines)
+        reasoning = []
+        for chunk, decision, reason in candidates:
+            line = f'- Chunk {chunk} ({decision}): {reason}'
+            budget -= estimate_tokens(line)
+            if budget < 0:
+                break
+            reasoning.append((chunk, line))
+
+        if reasoning:
+            lines.append('Reasoning:')
+            lines.extend(line for _, line in sorted(reasoning))
+
+        return '\n'.join(lines)
+
+    def _decision_runs(self, verdicts, max_runs=20):
+        # Consecutive chunks with the same decision are written as one range
+        runs = []
+        for chunk, decision, _ in verdicts:
+            if runs and runs[-1][2] == decision:
+                runs[-1][1] = chunk
+            else:
+                runs.append([chunk, chunk, decision])
+
+        # A call whose decision keeps changing would otherwise grow this line without bound
+        # The recent runs are kept, with earlier fraud decisions taking up to half of the line
+        if len(runs) > max_runs:
+            frauds = [run for run in runs[:-max_runs // 2] if run[2] == 'fraud'][-(max_runs // 2):]
+            runs = frauds + runs[len(frauds) - max_runs:]
+
+        return [
+            f'chunk {first} {decision}' if first == last else f'chunks {first}-{last} {decision}'
+            for first, last, decision in runs
+        ]
@@ -1,7 +1,7 @@
 from base64 import urlsafe_b64decode
 import json
 from tarfile import data_filter
-import requests
+from LLMOps.transport import get_requests_session
 from bs4 import BeautifulSoup as bs
 import logging
 import configparser
@@ -26,7 +26,7 @@ def get_geocode(city_name):
     '''
     
     api_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name}&appid={openweather_api_key}"
-    response = requests.get(api_url)
+    response = get_requests_session().get(api_url)
 
     if response.status_code == 200:
         data = response.json()[0]
@@ -57,7 +57,7 @@ def get_current_weather(city_name, unit='celsius'):
         return json.dumps({"forecast": "unknown"})
     else:
         api_url = f"https://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&appid={openweather_api_key}"
-        response = requests.get(api_url)
+        response = get_requests_session().get(api_url)
 
         # conversion factor to convert from kelvin to celsius or fahrenheit
         conversion_factor = 273.15 if unit == 'celsius' else 459.67
@@ -105,7 +105,7 @@ def get_latest_news_headlines(limit=10):
     url = 'https://news.google.com/topics/CAAqKggKIiRDQkFTRlFvSUwyMHZNRGx1YlY4U0JXVnVMVWRDR2dKSlRpZ0FQAQ?hl=en-IN&gl=IN&ceid=IN%3Aen'
 
     sub_url = 'https://news.google.com'
-    response = requests.get(url)
+    response = get_requests_session().get(url)
 
     if response.status_code == 200:
         soup = bs(response.text, 'html.parser')
@@ -154,7 +154,7 @@ def get_news(query):
     'Content-Type': 'application/json'
     }
 
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = get_requests_session().request("POST", url, headers=headers, data=payload)
 
     logging.info(f"News fetched for query: {query}")
 
@@ -183,7 +183,7 @@ def internet_search(query):
     'Content-Type': 'application/json'
     }
 
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = get_requests_session().request("POST", url, headers=headers, data=payload)
 
     logging.info(f"Internet Search results fetched for query: {query}")
 
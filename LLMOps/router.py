@@ -0,0 +1,384 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import anthropic
+import httpx
+import openai
+from LLMOps.budget import BudgetExceededError
+
+# Status codes worth retrying: timeouts, conflicts, rate limits, server errors and Claude's overloaded
+transient_statuses = (408, 409, 429, 500, 502, 503, 504, 529)
+
+def is_transient(error):
+    '''
+    This function tells whether a failed request is worth retrying.
+
+    Parameters:
+    - error: The exception raised by the handler
+
+    Returns:
+    - bool: True for connection errors, timeouts, rate limits and server errors
+    '''
+    if isinstance(error, (openai.APIConnectionError, anthropic.APIConnectionError, httpx.TransportError, TimeoutError)):
+        return True
+
+    return getattr(error, 'status_code', None) in transient_statuses
+
+class LLMRouter:
+    '''
+    This class sends the requests of the LLM handlers with retries, failover and hedging.
+    A request goes to the first provider, transient errors are retried with jittered exponential backoff, and
+    a provider that keeps failing is replaced by the next one. When the first provider takes longer than its
+    usual (p95) latency, the same request is also sent to the second provider and whichever answer arrives
+    first is returned, so a slow provider does not delay the verdict of a live call.
+    '''
+
+    def __init__(self, providers, retries=2, backoff=0.25, max_backoff=4.0, hedge=True, hedge_after=None,
+                 hedge_quantile=0.95, initial_hedge_after=3.0, min_samples=20, window=200):
+        '''
+        Parameters:
+        - providers: List of (handler, model) pairs in order of preference, e.g.
+            [(OpenAILLMHandler(...), 'gpt-4o-mini-2024-07-18'), (ClaudeLLMHandler(...), 'claude-3-haiku-20240307')]
+        - retries: The number of retries of a provider after a transient error
+            default: 2
+        - backoff: Seconds of the first backoff, doubled on every retry (the wait is random up to it)
+            default: 0.25
+        - max_backoff: Seconds the backoff is capped at
+            default: 4.0
+        - hedge: Send slow requests to the second provider as well
+            default: True
+        - hedge_after: Seconds after which the request is hedged
+            default: None (the hedge_quantile of the latencies of the first provider)
+        - hedge_quantile: The latency quantile after which the request is hedged
+            default: 0.95
+        - initial_hedge_after: Seconds after which the request is hedged until min_samples latencies are known
+            default: 3.0
+        - min_samples: The number of latencies needed before the quantile is used
+            default: 20
+        - window: The number of recent latencies kept per provider
+            default: 200
+        '''
+        if not providers:
+            raise ValueError('The router needs at least one provider')
+
+        self.providers = list(providers)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge and len(self.providers) > 1
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.initial_hedge_after = initial_hedge_after
+        self.min_samples = min_samples
+
+        self._latencies = [deque(maxlen=window) for _ in self.providers]
+        self._counters = [Counter() for _ in self.providers]
+        self._lock = threading.Lock()
+
+        # The requests run in threads so the first provider can be hedged while it is still answering
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='llm-router')
+
+    def send_text(self, messages, model=None, user_id=None, max_tokens=1000):
+        '''
+        This method sends the messages like OpenAILLMHandler.send_text and returns the same values.
+
+        Parameters:
+        - messages: The messages to send
+        - model: The model of the first provider
+            default: None (the model given with the provider)
+        - user_id: The user id
+            default: None
+        - max_tokens: The maximum number of tokens to generate
+            default: 1000
+        '''
+        return self._route('send_text', messages, model, {'user_id': user_id, 'max_tokens': max_tokens})
+
+    def send_text_stream(self, messages, model=None, user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method streams the response like OpenAILLMHandler.send_text_stream and returns the same values.
+        on_decision is called as soon as the first provider parses a decision. Once the request is hedged or
+        failed over, only the decision of the provider whose answer is returned is published.
+
+        Parameters:
+        - messages, model, user_id, max_tokens: See send_text
+        - on_decision: Function called with the decision while the rest of the response is generated
+            default: None
+        '''
+        kwargs = {'user_id': user_id, 'max_tokens': max_tokens}
+        return self._route('send_text_stream', messages, model, kwargs, _DecisionGate(on_decision) if on_decision else None)
+
+    async def send_text_async(self, messages, model=None, user_id=None, max_tokens=1000):
+        '''
+        This method is the async variant of send_text, the request that loses a hedge is cancelled.
+        '''
+        return await self._route_async('send_text_async', messages, model, {'user_id': user_id, 'max_tokens': max_tokens})
+
+    async def send_text_stream_async(self, messages, model=None, user_id=None, max_tokens=1000, on_decision=None):
+        '''
+        This method is the async variant of send_text_stream, the request that loses a hedge is cancelled.
+        '''
+        kwargs = {'user_id': user_id, 'max_tokens': max_tokens}
+        return await self._route_async('send_text_stream_async', messages, model, kwargs, _DecisionGate(on_decision) if on_decision else None)
+
+    def hedge_delay(self):
+        '''
+        This method returns the seconds after which a request to the first provider is hedged.
+
+        Returns:
+        - float: The delay
+        '''
+        if self.hedge_after is not None:
+            return self.hedge_after
+
+        with self._lock:
+            latencies = sorted(self._latencies[0])
+
+        if len(latencies) < self.min_samples:
+            return self.initial_hedge_after
+
+        return latencies[min(int(len(latencies) * self.hedge_quantile), len(latencies) - 1)]
+
+    def metrics(self):
+        '''
+        This method returns the counters and latencies of every provider.
+
+        Returns:
+        - dict: The current hedge delay, and per provider its model, requests, retries, failures, failovers,
+            hedges and wins, p50 and p95 latency and the usage of its handler
+        '''
+        metrics = []
+        with self._lock:
+            for (handler, model), counters, latencies in zip(self.providers, self._counters, self._latencies):
+                latencies = sorted(latencies)
+                provider = {'handler': type(handler).__name__, 'model': model, **counters}
+                if latencies:
+                    provider['p50_latency'] = latencies[len(latencies) // 2]
+                    provider['p95_latency'] = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+                metrics.append(provider)
+
+        for provider, (handler, _) in zip(metrics, self.providers):
+            provider['usage'] = handler.usage.metrics()
+
+        return {'hedge_after': self.hedge_delay(), 'providers': metrics}
+
+    def _route(self, method, messages, model, kwargs, decisions=None):
+        def submit(index, model):
+            if index and decisions:
+                decisions.contest()
+            return self._executor.submit(self._attempt, index, method, messages, model, self._kwargs(kwargs, decisions, index))
+
+        futures = {submit(0, model): 0}
+
+        # Wait for the first provider alone until its usual latency has passed
+        delay = self.hedge_delay() if self.hedge else None
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            logging.warning(f'Hedging the request after {delay:.2f} seconds')
+            self._count(1, 'hedges')
+            futures[submit(1, None)] = 1
+
+        # The first answer wins, a failed provider is replaced by the next one that was not tried yet
+        error = None
+        next_provider = len(futures)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures.pop(future)
+                try:
+                    result = future.result()
+                except BudgetExceededError:
+                    raise
+                except Exception as e:
+                    error = e
+                    continue
+
+                if futures:
+                    # The other request keeps running in its thread, its cost is still counted by its handler
+                    self._count(index, 'hedge_wins')
+                if decisions:
+                    decisions.settle(index)
+                return result
+
+            if not futures and next_provider < len(self.providers):
+                logging.warning(f'Failing over to provider {next_provider}: {str(error)}')
+                self._count(next_provider, 'failovers')
+                futures[submit(next_provider, None)] = next_provider
+                next_provider += 1
+
+        raise error
+
+    async def _route_async(self, method, messages, model, kwargs, decisions=None):
+        def submit(index, model):
+            if index and decisions:
+                decisions.contest()
+            return asyncio.ensure_future(self._attempt_async(index, method, messages, model, self._kwargs(kwargs, decisions, index)))
+
+        tasks = {submit(0, model): 0}
+
+        delay = self.hedge_delay() if self.hedge else None
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            logging.warning(f'Hedging the request after {delay:.2f} seconds')
+            self._count(1, 'hedges')
+            tasks[submit(1, None)] = 1
+
+        error = None
+        next_provider = len(tasks)
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except BudgetExceededError:
+                        raise
+                    except Exception as e:
+                        error = e
+                        continue
+
+                    if tasks:
+                        self._count(index, 'hedge_wins')
+                    if decisions:
+                        decisions.settle(index)
+                    return result
+
+                if not tasks and next_provider < len(self.providers):
+                    logging.warning(f'Failing over to provider {next_provider}: {str(error)}')
+                    self._count(next_provider, 'failovers')
+                    tasks[submit(next_provider, None)] = next_provider
+                    next_provider += 1
+        finally:
+            # The request that lost the hedge is cancelled
+            for task in tasks:
+                task.cancel()
+
+        raise error
+
+    def _attempt(self, index, method, messages, model, kwargs):
+        handler, default_model = self.providers[index]
+        for attempt in range(self.retries + 1):
+            self._count(index, 'requests')
+            started = time.perf_counter()
+            try:
+                # Every request gets its own list, the handlers append tool results to it
+                result = getattr(handler, method)(list(messages), model=model or default_model, **kwargs)
+            except Exception as e:
+                if not self._retry(index, attempt, e):
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            self._record(index, time.perf_counter() - started)
+            return result
+
+    async def _attempt_async(self, index, method, messages, model, kwargs):
+        handler, default_model = self.providers[index]
+        for attempt in range(self.retries + 1):
+            self._count(index, 'requests')
+            started = time.perf_counter()
+            try:
+                result = await getattr(handler, method)(list(messages), model=model or default_model, **kwargs)
+            except Exception as e:
+                if not self._retry(index, attempt, e):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            self._record(index, time.perf_counter() - started)
+            return result
+
+    def _retry(self, index, attempt, error):
+        # Returns True if the request should be sent again
+        if not is_transient(error) or attempt >= self.retries:
+            self._count(index, 'failures')
+            logging.error(f'Provider {index} failed: {str(error)}')
+            return False
+
+        self._count(index, 'retries')
+        logging.warning(f'Retrying provider {index} after a transient error: {str(error)}')
+        return True
+
+    def _backoff(self, attempt):
+        # Full jitter, so requests that failed together do not retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _record(self, index, latency):
+        with self._lock:
+            self._latencies[index].append(latency)
+
+    def _count(self, index, key):
+        with self._lock:
+            self._counters[index][key] += 1
+
+    @staticmethod
+    def _kwargs(kwargs, decisions, index):
+        # Every attempt of a streamed request reports its decisions under its own provider index
+        if decisions is None:
+            return kwargs
+
+        return {**kwargs, 'on_decision': decisions.callback(index)}
+
+class _DecisionGate:
+    '''
+    This class publishes the decisions streamed by the attempts of one routed request.
+    While a single provider is answering its decision is published right away. Once the request is hedged or
+    failed over, the decisions are held and only the one of the provider whose answer wins is published, so
+    a losing provider cannot publish a decision that contradicts the returned answer.
+    '''
+
+    def __init__(self, on_decision):
+        '''
+        Parameters:
+        - on_decision: Function called with the decision
+        '''
+        self.on_decision = on_decision
+        self.contested = False
+        self.published = None
+
+        self._held = {}
+        self._lock = threading.Lock()
+
+    def callback(self, index):
+        '''
+        This method returns the on_decision callback of the attempt of a provider.
+
+        Parameters:
+        - index: The index of the provider
+        '''
+        def callback(decision):
+            with self._lock:
+                if self.contested:
+                    self._held[index] = decision
+                    return
+                if decision == self.published:
+                    return
+                self.published = decision
+            self.on_decision(decision)
+
+        return callback
+
+    def contest(self):
+        '''
+        This method holds the decisions from now on, another provider has been asked too.
+        '''
+        with self._lock:
+            self.contested = True
+
+    def settle(self, index):
+        '''
+        This method publishes the decision of the provider whose answer is returned, if it changed.
+
+        Parameters:
+        - index: The index of the winning provider
+        '''
+        with self._lock:
+            decision = self._held.get(index)
+            if decision is None or decision == self.published:
+                return
+            self.published = decision
+        self.on_decision(decision)
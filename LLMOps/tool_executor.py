@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+def failed_call(function_name, error):
+    '''
+    This function builds the call of a tool call that could not be resolved (unknown function, arguments
+    that are not valid JSON), so the model gets an error result for it like for a function that failed.
+
+    Parameters:
+    - function_name: The name of the requested function
+    - error: The exception describing the problem
+
+    Returns:
+    - tuple: (function_name, function, arguments) for ToolExecutor.run
+    '''
+    def fail():
+        raise error
+
+    return function_name, fail, {}
+
+class ToolExecutor:
+    '''
+    This class runs the functions requested by the model in one turn concurrently, each with its own timeout.
+    A turn takes as long as its slowest function instead of the sum of all of them, and a function that fails
+    or times out gives an error result to the model instead of failing the request.
+    A thread cannot be stopped, so a function that times out keeps its worker until it returns and the workers
+    are shared by all requests: functions doing I/O should set their own timeouts (e.g. on their HTTP requests).
+    While all the workers are busy, new functions wait for one and time out like the others.
+    '''
+
+    def __init__(self, timeout=10.0, timeouts=None, max_workers=16):
+        '''
+        Parameters:
+        - timeout: Seconds a function may run before its result is replaced by a timeout error
+            default: 10.0
+        - timeouts: Timeouts of specific functions (e.g. {'internet_search': 5.0})
+            default: None
+        - max_workers: The number of functions that can run at the same time, across all requests
+            default: 16
+        '''
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.max_workers = max_workers
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def run(self, calls):
+        '''
+        This method runs the functions and waits for all of them.
+
+        Parameters:
+        - calls: List of (function_name, function, arguments) tuples
+
+        Returns:
+        - list: The response of every function (str), in the order of calls
+        '''
+        executor = self._get_executor()
+
+        started = time.perf_counter()
+        futures = [executor.submit(function, **arguments) for _, function, arguments in calls]
+
+        responses = []
+        for (function_name, _, _), future in zip(calls, futures):
+            # All the functions started together, so every timeout counts from the start of the turn
+            remaining = max(self._timeout(function_name) - (time.perf_counter() - started), 0)
+            try:
+                responses.append(self._response(future.result(timeout=remaining)))
+            except TimeoutError:
+                future.cancel()
+                responses.append(self._timeout_error(function_name))
+            except Exception as e:
+                responses.append(self._error(function_name, e))
+
+        return responses
+
+    async def run_async(self, calls):
+        '''
+        This method is the async variant of run, the functions run in the worker threads of the executor.
+
+        Parameters:
+        - calls: List of (function_name, function, arguments) tuples
+
+        Returns:
+        - list: The response of every function (str), in the order of calls
+        '''
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+
+        async def call(function_name, function, arguments):
+            try:
+                response = await asyncio.wait_for(
+                    loop.run_in_executor(executor, lambda: function(**arguments)),
+                    timeout=self._timeout(function_name)
+                )
+                return self._response(response)
+            except asyncio.TimeoutError:
+                return self._timeout_error(function_name)
+            except Exception as e:
+                return self._error(function_name, e)
+
+        return list(await asyncio.gather(*[call(*tool_call) for tool_call in calls]))
+
+    def shutdown(self):
+        '''
+        This method stops the worker threads, functions that are still running are not waited for.
+        '''
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self):
+        # The threads are created on the first tool call and reused by every request
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tool')
+
+            return self._executor
+
+    def _timeout(self, function_name):
+        return self.timeouts.get(function_name, self.timeout)
+
+    @staticmethod
+    def _response(response):
+        return response if isinstance(response, str) else json.dumps(response, default=str)
+
+    def _timeout_error(self, function_name):
+        logging.warning(f'Function {function_name} timed out after {self._timeout(function_name)} seconds')
+        return json.dumps({'error': f'{function_name} timed out after {self._timeout(function_name)} seconds'})
+
+    @staticmethod
+    def _error(function_name, error):
+        logging.error(f'Function {function_name} failed: {str(error)}')
+        return json.dumps({'error': f'{function_name} failed: {str(error)}'})
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2]), without it the pools use HTTP/1.1
+try:
+    import h2
+    http2 = True
+except ImportError:
+    http2 = False
+
+# Base URLs of the providers whose connections can be opened ahead of the first request
+provider_hosts = {
+    'openai': 'https://api.openai.com',
+    'anthropic': 'https://api.anthropic.com',
+    'deepgram': 'https://api.deepgram.com',
+}
+
+# Idle connections are kept for a minute, so the next chunk of a call reuses them
+default_limits = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60)
+default_timeout = httpx.Timeout(60.0, connect=5.0)
+
+_http_client = None
+_requests_session = None
+_lock = threading.Lock()
+
+# Connections of an httpx pool belong to the event loop that opened them, so every loop gets its own pool
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_http_client():
+    '''
+    This function returns the pooled HTTP client shared by every provider client of the process.
+    httpx keeps a keep-alive pool per host and the client can be used from any thread.
+
+    Returns:
+    - httpx.Client: The HTTP client
+    '''
+    global _http_client
+
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(limits=default_limits, timeout=default_timeout, http2=http2)
+
+        return _http_client
+
+def get_async_http_client():
+    '''
+    This function returns the pooled HTTP client shared by every async provider client of the running event loop.
+    It must be called from inside the event loop.
+
+    Returns:
+    - httpx.AsyncClient: The HTTP client
+    '''
+    loop = asyncio.get_running_loop()
+
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=default_limits, timeout=default_timeout, http2=http2)
+        _async_clients[loop] = client
+
+    return client
+
+def get_requests_session():
+    '''
+    This function returns the requests session shared by the tool functions, with a keep-alive pool per host.
+
+    Returns:
+    - requests.Session: The session
+    '''
+    global _requests_session
+
+    with _lock:
+        if _requests_session is None:
+            _requests_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            _requests_session.mount('https://', adapter)
+            _requests_session.mount('http://', adapter)
+
+        return _requests_session
+
+def prewarm(providers=None, connections=2, timeout=5.0):
+    '''
+    This function opens connections (TCP, TLS and HTTP/2 setup) to the providers, so the first request of a call
+    does not pay for the handshakes. It should run at startup, in the process that makes the requests.
+
+    Parameters:
+    - providers: The providers to connect to (keys of provider_hosts) or base URLs
+        default: None (every known provider)
+    - connections: The number of connections opened per host (only one is needed with HTTP/2)
+        default: 2
+    - timeout: Seconds to wait for a host
+        default: 5.0
+
+    Returns:
+    - dict: Seconds it took to connect to every host, None for hosts that could not be reached
+    '''
+    urls = [provider_hosts.get(provider, provider) for provider in (providers or provider_hosts)]
+    client = get_http_client()
+
+    def warm(url):
+        started = time.perf_counter()
+        try:
+            # Any response will do, the connection stays in the pool
+            client.head(url, timeout=timeout)
+            return time.perf_counter() - started
+        except httpx.HTTPError as e:
+            logging.warning(f'Could not prewarm {url}: {str(e)}')
+            return None
+
+    # With HTTP/2 one connection per host carries every request
+    targets = [url for url in urls for _ in range(1 if http2 else connections)]
+    with ThreadPoolExecutor(max_workers=len(targets) or 1) as executor:
+        timings = list(executor.map(warm, targets))
+
+    # The slowest connection of every host
+    results = {url: 0.0 for url in urls}
+    for url, seconds in zip(targets, timings):
+        results[url] = None if seconds is None or results[url] is None else max(results[url], seconds)
+
+    logging.info(f'Prewarmed provider connections: {results}')
+    return results
+
+async def prewarm_async(providers=None, timeout=5.0):
+    '''
+    This function is the async variant of prewarm, for the pool of the running event loop.
+
+    Parameters:
+    - providers: The providers to connect to (keys of provider_hosts) or base URLs
+        default: None (every known provider)
+    - timeout: Seconds to wait for a host
+        default: 5.0
+    '''
+    client = get_async_http_client()
+
+    async def warm(url):
+        try:
+            await client.head(url, timeout=timeout)
+        except httpx.HTTPError as e:
+            logging.warning(f'Could not prewarm {url}: {str(e)}')
+
+    await asyncio.gather(*[warm(provider_hosts.get(provider, provider)) for provider in (providers or provider_hosts)])
+
+def close_http_client():
+    '''
+    This function closes the shared HTTP client and requests session, e.g. when the server shuts down.
+    '''
+    global _http_client, _requests_session
+
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        if _requests_session is not None:
+            _requests_session.close()
+            _requests_session = None
+
+async def close_async_http_client():
+    '''
+    This function closes the pooled HTTP client of the running event loop, e.g. when the server shuts down.
+    '''
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
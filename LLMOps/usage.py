@@ -0,0 +1,89 @@
+import threading
+from collections import Counter
+from contextvars import ContextVar
+
+class UsageTracker:
+    '''
+    This class records the token usage of an LLM handler, split into cached and uncached prompt tokens.
+    The usage of the last request is kept per thread and per asyncio task, so handlers can be shared.
+    '''
+
+    def __init__(self):
+        self._totals = Counter()
+        self._lock = threading.Lock()
+        self._last = ContextVar(f'last_usage_{id(self)}', default=None)
+
+    @property
+    def last(self):
+        '''
+        The usage (dict) of the last request made by the current thread or task, or None.
+        '''
+        return self._last.get()
+
+    def record(self, model, prompt_tokens, completion_tokens, cost, full_cost, cached_tokens=0, cache_write_tokens=0,
+               latency=None, ttft=None):
+        '''
+        This method records the usage of one request.
+
+        Parameters:
+        - model: The model used
+        - prompt_tokens: All the prompt tokens, cached or not
+        - completion_tokens: The number of tokens generated
+        - cost: The cost of the request (in INR)
+        - full_cost: What the request would have cost without caching (in INR)
+        - cached_tokens: The prompt tokens read from the provider's cache
+            default: 0
+        - cache_write_tokens: The prompt tokens written to the provider's cache
+            default: 0
+        - latency: Seconds until the response was complete
+            default: None
+        - ttft: Seconds until the first token arrived (streamed requests)
+            default: None
+
+        Returns:
+        - dict: The usage of the request
+        '''
+        usage = {
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'cache_write_tokens': cache_write_tokens,
+            'uncached_tokens': prompt_tokens - cached_tokens - cache_write_tokens,
+            'completion_tokens': completion_tokens,
+            'cost': cost,
+            'saved': full_cost - cost,
+            'latency': latency,
+            'ttft': ttft,
+        }
+        self._last.set(usage)
+
+        hit = 'cached' if cached_tokens else 'uncached'
+        with self._lock:
+            self._totals['requests'] += 1
+            self._totals[f'{hit}_requests'] += 1
+            for key in ('prompt_tokens', 'cached_tokens', 'cache_write_tokens', 'uncached_tokens', 'completion_tokens', 'cost', 'saved'):
+                self._totals[key] += usage[key]
+            if ttft is not None:
+                self._totals[f'{hit}_ttft'] += ttft
+                self._totals[f'{hit}_ttft_requests'] += 1
+
+        return usage
+
+    def metrics(self):
+        '''
+        This method returns the usage of all the requests so far.
+
+        Returns:
+        - dict: Token and cost totals, the share of prompt tokens served from the cache and the
+            average time to first token of requests with and without a cache hit
+        '''
+        with self._lock:
+            totals = dict(self._totals)
+
+        metrics = {key: value for key, value in totals.items() if not key.endswith('ttft') and not key.endswith('ttft_requests')}
+        metrics['cached_ratio'] = totals.get('cached_tokens', 0) / totals['prompt_tokens'] if totals.get('prompt_tokens') else 0.0
+        for hit in ('cached', 'uncached'):
+            if totals.get(f'{hit}_ttft_requests'):
+                metrics[f'{hit}_avg_ttft'] = totals[f'{hit}_ttft'] / totals[f'{hit}_ttft_requests']
+
+        return metrics
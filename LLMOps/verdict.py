@@ -0,0 +1,253 @@
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+decisions = ('fraud', 'not_fraud', 'need_more_time')
+
+_section = re.compile(r'^[\s*#_>-]*(decision|reasoning|action)[\s*_]*:[\s*_]*(.*)$', re.IGNORECASE)
+_json_field = re.compile(r'"(decision|reasoning|action)"\s*:\s*"((?:[^"\\]|\\.)*)', re.IGNORECASE)
+_json_decision = re.compile(r'"decision"\s*:\s*"([^"]*)"', re.IGNORECASE)
+
+# JSON schema of the structured verdict, the decision comes first so it can be published while the rest is generated
+verdict_schema = {
+    'type': 'object',
+    'properties': {
+        'decision': {'type': 'string', 'enum': list(decisions)},
+        'reasoning': {'type': 'string', 'description': 'Why, in at most 20 words'},
+        'action': {'type': 'string', 'description': "One line for the user, starting with 'Fraud!' if it is fraud"},
+    },
+    'required': ['decision', 'reasoning', 'action'],
+    'additionalProperties': False,
+}
+
+# Claude tool whose forced use returns the verdict as JSON
+verdict_tool = {
+    'name': 'record_verdict',
+    'description': 'Record the verdict on the call so far.',
+    'input_schema': verdict_schema,
+}
+
+@dataclass
+class Verdict:
+    '''
+    This class is the verdict on a chunk of a call.
+    '''
+    decision: Optional[str] = None
+    reasoning: Optional[str] = None
+    action: Optional[str] = None
+
+    @property
+    def is_fraud(self):
+        return self.decision == 'fraud'
+
+    def to_dict(self):
+        '''
+        This method returns the verdict as a dict (e.g. to store it in Firebase).
+        '''
+        return asdict(self)
+
+    def to_json(self):
+        '''
+        This method returns the verdict as compact JSON.
+        '''
+        return json.dumps(self.to_dict(), separators=(',', ':'), ensure_ascii=False)
+
+    def to_text(self):
+        '''
+        This method returns the verdict in the Decision/Reasoning/Action format read by the app.
+        '''
+        return '\n\n'.join(
+            f'{name}: {value}'
+            for name, value in (('Decision', self.decision), ('Reasoning', self.reasoning), ('Action', self.action))
+            if value
+        )
+
+def normalize_decision(value):
+    '''
+    This function turns the value of a Decision line into one of the decisions of the prompt.
+
+    Parameters:
+    - value: The text after "Decision:" (e.g. "**Fraud**", "[not fraud]")
+
+    Returns:
+    - str: fraud, not_fraud or need_more_time, or None if the value is not a decision
+    '''
+    value = re.sub(r'[^a-z_ ]', '', value.lower()).strip().replace(' ', '_')
+
+    for decision in sorted(decisions, key=len, reverse=True):
+        if value.startswith(decision):
+            return decision
+
+    return None
+
+def parse_verdict(text):
+    '''
+    This function parses a complete LLM response, JSON or in the Decision/Reasoning/Action format.
+    Code fences, text around the JSON and JSON cut off by max_tokens are tolerated.
+
+    Parameters:
+    - text: The response
+
+    Returns:
+    - Verdict: The verdict (fields are None when they are missing)
+    '''
+    if not text:
+        return Verdict()
+
+    start = text.find('{')
+    if start != -1:
+        end = text.rfind('}')
+        try:
+            data = json.loads(text[start:end + 1]) if end > start else None
+        except ValueError:
+            data = None
+
+        # Malformed or truncated JSON keeps the fields that can be read
+        if not isinstance(data, dict):
+            data = {}
+            for name, value in _json_field.findall(text[start:]):
+                try:
+                    data.setdefault(name.lower(), json.loads(f'"{value}"'))
+                except ValueError:
+                    data.setdefault(name.lower(), value)
+
+        if data:
+            return Verdict(
+                decision=normalize_decision(str(data.get('decision') or '')),
+                reasoning=_field(data.get('reasoning')),
+                action=_field(data.get('action')),
+            )
+
+    parser = DecisionParser()
+    parser.feed(text)
+    parser.finish()
+
+    return Verdict(**parser.sections)
+
+def parse_response(text):
+    '''
+    This function splits a complete LLM response into its sections.
+
+    Parameters:
+    - text: The response, JSON or in the format asked for in prompt.py
+
+    Returns:
+    - dict: decision, reasoning and action (None when a section is missing)
+    '''
+    return parse_verdict(text).to_dict()
+
+def _field(value):
+    if value is None:
+        return None
+
+    return str(value).strip() or None
+
+class DecisionParser:
+    '''
+    This class parses a streamed LLM response as the tokens arrive.
+    The verdict callback fires as soon as the Decision line (or the decision of a JSON response) is complete,
+    long before the rest is generated.
+    '''
+
+    def __init__(self, on_decision=None):
+        '''
+        Parameters:
+        - on_decision: Function called once with the decision (fraud, not_fraud or need_more_time)
+            default: None
+        '''
+        self.on_decision = on_decision
+        self.text = ''
+        self.sections = {'decision': None, 'reasoning': None, 'action': None}
+        self.first_token_at = None
+
+        self._line_start = 0
+        self._current = None
+        self._json = None
+
+    def feed(self, delta):
+        '''
+        This method adds the next piece of the response.
+
+        Parameters:
+        - delta: The text received since the last call
+        '''
+        if not delta:
+            return
+
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.text += delta
+
+        # A JSON response is not split into lines, its decision is read as soon as its value is closed
+        if self._json is None and self.text.strip():
+            self._json = self.text.lstrip().startswith(('{', '```'))
+        if self._json:
+            if self.sections['decision'] is None:
+                match = _json_decision.search(self.text)
+                if match:
+                    self._set_decision(match.group(1))
+            return
+
+        # Only complete lines are parsed, the last line may still grow
+        end = self.text.find('\n', self._line_start)
+        while end != -1:
+            self._parse_line(self.text[self._line_start:end])
+            self._line_start = end + 1
+            end = self.text.find('\n', self._line_start)
+
+    def finish(self):
+        '''
+        This method parses the last line once the response is complete.
+
+        Returns:
+        - str: The full response
+        '''
+        if self._json:
+            verdict = parse_verdict(self.text)
+            self._set_decision(verdict.decision or '')
+            self.sections.update(reasoning=verdict.reasoning, action=verdict.action)
+            return self.text
+
+        if self._line_start < len(self.text):
+            self._parse_line(self.text[self._line_start:])
+            self._line_start = len(self.text)
+
+        return self.text
+
+    def _parse_line(self, line):
+        match = _section.match(line)
+        if match:
+            self._current = match.group(1).lower()
+            value = match.group(2).strip()
+
+            if self._current == 'decision':
+                self._set_decision(value)
+            else:
+                self.sections[self._current] = value or None
+
+        elif self._current == 'decision' and line.strip():
+            # "Decision:" alone on its line, the value follows on the next one
+            self._set_decision(line)
+
+        elif self._current in ('reasoning', 'action') and line.strip():
+            # Sections may continue over several lines
+            previous = self.sections[self._current]
+            self.sections[self._current] = f'{previous} {line.strip()}' if previous else line.strip()
+
+    def _set_decision(self, value):
+        if self.sections['decision'] is not None:
+            return
+
+        decision = normalize_decision(value)
+        if decision is None:
+            return
+
+        self.sections['decision'] = decision
+        if self.on_decision:
+            try:
+                self.on_decision(decision)
+            except Exception as e:
+                logging.error(f'Verdict callback failed: {str(e)}')
@@ -1,12 +1,27 @@
+import argparse
 import configparser
 import logging
 from datetime import datetime, timezone
 from LLMOps.OpenAI import OpenAILLMHandler, OpenAISpeechHandler
+from LLMOps.Anthropic import ClaudeLLMHandler
+from LLMOps.router import LLMRouter
+from LLMOps.cascade import ModelCascade
+from LLMOps.verdict import parse_verdict
+from LLMOps.compaction import ConversationCompactor
+from LLMOps.cache import ResponseCache
+from LLMOps.budget import TokenBudget, BudgetExceededError
+from LLMOps import transport
 from DBOps.firebase import FirebaseOps
-from prompt import system_prompt
+from AudioOps.codec import WavWriter
+from AudioOps.vad import VADSegmenter
+from AudioOps.gate import SpeechGate
+from AudioOps.reader import AudioReader
+from CallOps.pipeline import ChunkPipeline, Stage
+from CallOps.batch import BatchAnalyzer
+from prompt import new_messages
 import io
 import time
-from pydub import AudioSegment
+import threading
 
 # Set Log Level
 logger = logging.getLogger()
@@ -22,8 +37,100 @@ openai_api_key = config['OpenAI']['api_key']
 llm_model = config['Models']['llm']
 stt_model = config['Models']['stt']
 
+# Voice activity detection settings
+vad_settings = {
+    'energy_threshold': config.getfloat('VAD', 'energy_threshold', fallback=-40.0),
+    'min_segment_ms': config.getint('VAD', 'min_segment_ms', fallback=1000),
+    'max_segment_ms': config.getint('VAD', 'max_segment_ms', fallback=15 * 1000),
+    'silence_ms': config.getint('VAD', 'silence_ms', fallback=600),
+}
+
+# Pre-STT speech gate settings
+gate_settings = {
+    'enabled': config.getboolean('Gate', 'enabled', fallback=True),
+    'min_rms_db': config.getfloat('Gate', 'min_rms_db', fallback=-45.0),
+    'min_speech_ratio': config.getfloat('Gate', 'min_speech_ratio', fallback=0.3),
+}
+
+# Chunk pipeline settings
+stt_workers = config.getint('Pipeline', 'stt_workers', fallback=2)
+queue_size = config.getint('Pipeline', 'queue_size', fallback=4)
+
+# Stream the LLM responses, so the decision is published before the reasoning is generated
+stream_llm = config.getboolean('Pipeline', 'stream_llm', fallback=True)
+
+# Ask for the verdict as short JSON instead of the Decision/Reasoning/Action text
+structured_verdict = config.getboolean('Verdict', 'structured', fallback=False)
+verdict_max_tokens = config.getint('Verdict', 'max_tokens', fallback=200)
+
 # Create OpenAI Handlers
-llm_handler = OpenAILLMHandler(openai_api_key)
+# Long calls only send the latest chunks verbatim, older chunks are summarized
+compactor = None
+if config.getboolean('Compaction', 'enabled', fallback=True):
+    compactor = ConversationCompactor(
+        keep_chunks=config.getint('Compaction', 'keep_chunks', fallback=6),
+        token_budget=config.getint('Compaction', 'token_budget', fallback=6000),
+        summary_tokens=config.getint('Compaction', 'summary_tokens', fallback=600),
+    )
+
+# Responses to transcripts that were already analysed are reused
+response_cache = None
+if config.getboolean('Cache', 'enabled', fallback=False):
+    response_cache = ResponseCache(
+        max_entries=config.getint('Cache', 'max_entries', fallback=1024),
+        ttl=config.getfloat('Cache', 'ttl', fallback=24 * 3600),
+        path=config.get('Cache', 'path', fallback=None),
+    )
+
+# Requests are checked against the context window and the spend limits before they are sent
+budget = None
+if config.getboolean('Budget', 'enabled', fallback=True):
+    budget = TokenBudget(
+        policy=config.get('Budget', 'policy', fallback='trim'),
+        max_prompt_tokens=config.getint('Budget', 'max_prompt_tokens', fallback=None),
+        max_request_cost=config.getfloat('Budget', 'max_request_cost', fallback=None),
+        max_call_cost=config.getfloat('Budget', 'max_call_cost', fallback=None),
+        fallback_model=config.get('Budget', 'fallback_model', fallback=None),
+    )
+
+llm_handler = OpenAILLMHandler(
+    openai_api_key, compactor=compactor, cache=response_cache, budget=budget,
+    structured=structured_verdict, verdict_max_tokens=verdict_max_tokens
+)
+
+# With [Router] enabled, failed requests are retried and moved to Claude, and slow ones are also sent to Claude
+llm_router = None
+if config.getboolean('Router', 'enabled', fallback=False):
+    claude_handler = ClaudeLLMHandler(
+        config['Anthropic']['api_key'], compactor=compactor, cache=response_cache, budget=budget,
+        structured=structured_verdict, verdict_max_tokens=verdict_max_tokens
+    )
+    llm_router = LLMRouter(
+        [(llm_handler, llm_model), (claude_handler, config.get('Router', 'secondary_model', fallback='claude-3-haiku-20240307'))],
+        retries=config.getint('Router', 'retries', fallback=2),
+        backoff=config.getfloat('Router', 'backoff', fallback=0.25),
+        hedge=config.getboolean('Router', 'hedge', fallback=True),
+        hedge_after=config.getfloat('Router', 'hedge_after', fallback=None),
+        hedge_quantile=config.getfloat('Router', 'hedge_quantile', fallback=0.95),
+    )
+
+# The chunks are analysed through the router when there is one
+llm_client = llm_router or llm_handler
+
+# With [Cascade] enabled, chunks go to a fast model first and only the ambiguous or fraud ones to the strong model
+llm_cascade = None
+if config.getboolean('Cascade', 'enabled', fallback=False):
+    llm_cascade = ModelCascade(
+        llm_client,
+        fast_model=config.get('Cascade', 'fast_model', fallback='gpt-4o-mini-2024-07-18'),
+        strong_model=config.get('Cascade', 'strong_model', fallback=llm_model),
+        escalate_on=[decision.strip() for decision in config.get('Cascade', 'escalate_on', fallback='fraud,need_more_time').split(',') if decision.strip()],
+        sticky=config.getboolean('Cascade', 'sticky', fallback=True),
+    )
+    llm_client = llm_cascade
+
+# The model the chunks are sent to, the cascade picks its own
+chunk_model = None if llm_cascade else llm_model
 
 # Create Speech to text handler Handler
 speech_to_text_handler = OpenAISpeechHandler(openai_api_key)
@@ -31,67 +138,171 @@ speech_to_text_handler = OpenAISpeechHandler(openai_api_key)
 # Create Firebase Handler
 firebase_handler = FirebaseOps(config['Firebase']['credentials_path'], config['Firebase']['database_url'])
 
-# create messages and insert system prompt
-messages = [
-    {
-        "role": "system",
-        "content": [
-            {
-                "type": "text", 
-                "text": system_prompt
-            }
-        ]
-    }
-]
-
-def process_audio_file(audio_file_path):
-    # Load the audio file
-    audio = AudioSegment.from_mp3(audio_file_path)
+def process_audio_file(audio_file_path, publish=True):
+    '''
+    This function analyses a recorded call chunk by chunk.
+
+    Parameters:
+    - audio_file_path: The path of the recording
+    - publish: Update Firebase and print every chunk as it is analysed
+        default: True
+
+    Returns:
+    - list: (chunk_index, transcription, response_message) for every analysed chunk
+
+    Raises:
+    - PipelineError: A chunk could not be transcribed, analysed or persisted
+    '''
+    # Every call keeps its own conversation
+    messages = new_messages(structured_verdict)
+
+    # Open the audio file, it is decoded block by block while the chunks are analysed
+    reader = AudioReader(audio_file_path)
     
-    # Process the audio in 10-second chunks
-    chunk_length_ms = 10 * 1000  # 10 seconds in milliseconds
-    for i, chunk_start in enumerate(range(0, len(audio), chunk_length_ms)):
-        chunk = audio[chunk_start:chunk_start + chunk_length_ms]
-        
-        # Export the chunk to a temporary file
-        buffer = io.BytesIO()
-        buffer.name = f"chunk_{i+1}.wav"
-        chunk.export(buffer, format="wav")
-        buffer.seek(0)
-        
+    vad = VADSegmenter(sample_rate=reader.sample_rate, **vad_settings)
+    speech_gate = SpeechGate(sample_rate=reader.sample_rate, vad=vad, **gate_settings)
+
+    # Every STT worker reuses its own WAV buffer
+    thread_state = threading.local()
+
+    def transcribe_chunk(chunk):
+        i, segment = chunk
+
+        # Skip chunks without enough speech before paying for a transcription
+        if not speech_gate.check(segment):
+            return None
+
+        # Frame the segment as a WAV file in the reusable buffer
+        if not hasattr(thread_state, 'wav_writer'):
+            thread_state.wav_writer = WavWriter(reader.sample_rate)
+        buffer = thread_state.wav_writer.write(segment, name=f"chunk_{i}.wav")
+
         # Transcribe the chunk
         transcription, cost, language = speech_to_text_handler.transcribe_buffer(buffer)
 
         # if the length of the transcription is less than 10 words, then skip the chunk
         if len(transcription.split()) < 10:
-            continue
-        
+            return None
+
+        return i, transcription
+
+    def analyse_chunk(chunk):
+        i, transcription = chunk
+
         # Send transcription to LLM handler
-        messages.append({"role": "user", "content": f"Chunk {i+1}: {transcription}"})
-        response_message, cost, role, model, completion_tokens, prompt_tokens = llm_handler.send_text(
-            messages,
-            model=llm_model
-        )
+        messages.append({"role": "user", "content": f"Chunk {i}: {transcription}"})
+        try:
+            if stream_llm:
+                response_message, cost, role, model, completion_tokens, prompt_tokens = llm_client.send_text_stream(
+                    messages,
+                    model=chunk_model,
+                    user_id=audio_file_path,
+                    on_decision=publish_decision if publish else None
+                )
+            else:
+                response_message, cost, role, model, completion_tokens, prompt_tokens = llm_client.send_text(
+                    messages,
+                    model=chunk_model,
+                    user_id=audio_file_path
+                )
+        except BudgetExceededError as e:
+            logging.warning(f"Chunk {i} not analysed: {str(e)}")
+            return None
+
+        # Add LLM response to messages
+        messages.append({"role": role, "content": response_message})
+
+        return i, transcription, response_message
+
+    def publish_decision(decision):
+        # The app shows the decision while the reasoning and action are still being generated
+        firebase_handler.update_value(key='Response', value=f'Decision: {decision}\n')
+
+    def persist_chunk(chunk):
+        i, transcription, response_message = chunk
+        if not publish:
+            return chunk
 
         # Update Firebase with the LLM response
         # firebase_handler.add_data({
-        #     f"CallCop/chunks/{i+1}": {
+        #     f"CallCop/chunks/{i}": {
         #         "transcription": transcription,
         #         "response": response_message,
         #         "time": time.time()
         #     }
         # })
-        firebase_handler.update_value(key='Response', value=response_message)
+        # The app reads the Decision/Reasoning/Action text, code reads the structured verdict
+        verdict = parse_verdict(response_message)
+        firebase_handler.add_data({
+            'Response': verdict.to_text() if verdict.decision else response_message,
+            'Verdict': verdict.to_dict(),
+        })
         
-        # Add LLM response to messages
-        messages.append({"role": role, "content": response_message})
-        
-        print(f"Chunk {i+1} processed:")
+        print(f"Chunk {i} processed:")
         print(f"Transcription: {transcription}")
         print(f"LLM Response: {response_message}")
         print("----------------------------------")
         print()
 
-# Use the MP3 file
-audio_file_path = "/Users/sakshambhutani/PycharmProjects/MachineLearning/Projects/GHack/CallCop_py/debt_collection.wav"
-process_audio_file(audio_file_path)
\ No newline at end of file
+        return chunk
+
+    # Transcriptions of later chunks overlap the analysis of earlier ones,
+    # the LLM stage has a single worker so the conversation stays in order
+    pipeline = ChunkPipeline([
+        Stage('stt', transcribe_chunk, workers=stt_workers),
+        Stage('llm', analyse_chunk),
+        Stage('persist', persist_chunk),
+    ], queue_size=queue_size)
+
+    # Process the audio one utterance at a time, a chunk that failed fails the call
+    try:
+        with reader:
+            results = pipeline.run(enumerate(vad.stream(reader), start=1), raise_errors=True)
+    finally:
+        print(f"Speech gate: {speech_gate.metrics()}")
+        if budget:
+            print(f"Spent on {audio_file_path}: {budget.spent(audio_file_path)} INR")
+            budget.release(audio_file_path)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse recorded calls for fraud.')
+    parser.add_argument('audio_file', nargs='?', help='path of a single recording to analyse')
+    parser.add_argument('--batch', help='directory of recordings, or a manifest file with one path per line')
+    parser.add_argument('--output-dir', default='verdicts', help='directory for the per-call verdict files (batch mode)')
+    parser.add_argument('--workers', type=int, default=config.getint('Batch', 'workers', fallback=4),
+                        help='number of calls analysed at the same time (batch mode)')
+    parser.add_argument('--checkpoint', help='checkpoint file (batch mode, default: <output-dir>/checkpoint.jsonl)')
+    args = parser.parse_args()
+
+    # Open the provider connections while the first chunks are being decoded
+    prewarm_providers = [provider.strip() for provider in config.get('Transport', 'prewarm', fallback='openai').split(',') if provider.strip()]
+    if prewarm_providers:
+        threading.Thread(target=transport.prewarm, args=(prewarm_providers,), daemon=True).start()
+
+    if args.batch:
+        batch_analyzer = BatchAnalyzer(
+            lambda path: process_audio_file(path, publish=False),
+            args.output_dir,
+            workers=args.workers,
+            checkpoint_path=args.checkpoint
+        )
+        print(f"Batch finished: {batch_analyzer.run(args.batch)}")
+    elif args.audio_file:
+        process_audio_file(args.audio_file)
+    else:
+        parser.error('either an audio file or --batch is required')
+
+    print(f"LLM usage: {llm_handler.usage.metrics()}")
+    if response_cache:
+        print(f"Response cache: {response_cache.metrics()}")
+    if budget:
+        print(f"Token budget: {budget.metrics()}")
+    if llm_router:
+        print(f"LLM router: {llm_router.metrics()}")
+    if llm_cascade:
+        print(f"Model cascade: {llm_cascade.metrics()}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,7 +1,7 @@
-system_prompt = '''
+analysis_prompt = '''
 You are a call anlayst and you are looking if the call is a fraud call or not. You have a very important task to protect inocent people from getting scammed.
-You are listening to 10 seconds chunk of live calls between people. 
-After every 10 seconds chunk you have to decide if the you think call is a fraud, if it is not fraud, or if you need more time to decide. Do not rush your decision.
+You are listening to short chunks (one or more sentences each) of live calls between people. 
+After every chunk you have to decide if the you think call is a fraud, if it is not fraud, or if you need more time to decide. Do not rush your decision.
 You have to also give brief reasoning for your decision. You should also provide a one line action the user should take.
 
 Some examples:
@@ -61,7 +61,9 @@ Case Action to Detect and Prevent:
 Authentication: Banks will never ask for sensitive personal or financial details over the phone. Always hang up and call the bank directly using a number from their official website.
 Information Sharing: Avoid sharing OTPs, account details, or PAN information over calls.
 Reporting: Report any such suspicious calls to your bank immediately. Use the official channels provided by your financial institution.
+'''
 
+text_format = '''
 The format for your respoonse should be:
 
 Decision: [fraud/not_fraud/need_more_time]
@@ -70,3 +72,35 @@ Reasoning: [reason for your decision] (Keep it very short and concise)
 
 Action: [what should the user do.] (Should be strickly ONE line. First word should be 'Fraud!', if it is fraud.)
 '''
+
+# The structured verdict (LLMOps/verdict.py), short JSON with the decision first
+json_format = '''
+Respond with a JSON object only, without any other text:
+{"decision": "fraud" or "not_fraud" or "need_more_time", "reasoning": "reason for your decision, at most 20 words", "action": "ONE line for the user, the first word should be 'Fraud!' if it is fraud"}
+'''
+
+system_prompt = analysis_prompt + text_format
+structured_system_prompt = analysis_prompt + json_format
+
+def new_messages(structured=False):
+    '''
+    This function starts a new conversation with the fraud analysis system prompt.
+
+    Parameters:
+    - structured: Ask for the verdict as JSON instead of the Decision/Reasoning/Action format
+        default: False
+
+    Returns:
+    - list: The messages of the conversation
+    '''
+    return [
+        {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text", 
+                    "text": structured_system_prompt if structured else system_prompt
+                }
+            ]
+        }
+    ]
@@ -0,0 +1,47 @@
+from CallOps.admission import AdmissionController, keyword_verdict, FULL, DEGRADED, KEYWORD, REJECTED
+from LLMOps.verdict import parse_response
+
+keywords = ['otp', 'pin', 'account number', 'gift card']
+
+def test_new_calls_are_degraded_as_calls_add_up():
+    admission = AdmissionController(degrade_calls=2, keyword_calls=3, max_calls=4)
+
+    assert [admission.admit(f'call-{index}') for index in range(5)] == [FULL, FULL, DEGRADED, KEYWORD, REJECTED]
+
+    admission.release('call-0')
+    admission.release('call-1')
+    assert admission.admit('call-5') == DEGRADED
+    assert admission.metrics()['active_calls'] == {DEGRADED: 2, KEYWORD: 1}
+
+def test_inflight_requests_degrade_new_calls():
+    admission = AdmissionController(degrade_inflight=2, keyword_inflight=3)
+
+    with admission.provider_request('stt'), admission.provider_request('llm'):
+        assert admission.admit('call-1') == DEGRADED
+    assert admission.admit('call-2') == FULL
+    assert admission.metrics()['peak_inflight'] == 2
+
+def test_degraded_settings():
+    admission = AdmissionController(chunk_factor=2.0, degraded_model='small')
+    vad_settings = {'min_segment_ms': 1000, 'max_segment_ms': 15000, 'silence_ms': 600}
+
+    assert admission.settings(FULL, vad_settings, 'big') == (vad_settings, 'big')
+    assert admission.settings(DEGRADED, vad_settings, 'big') == (
+        {'min_segment_ms': 2000, 'max_segment_ms': 30000, 'silence_ms': 600}, 'small'
+    )
+
+def test_one_keyword_is_not_fraud():
+    verdict = keyword_verdict('Please read me the OTP.', keywords)
+
+    assert parse_response(verdict)['decision'] == 'need_more_time'
+
+def test_keywords_add_up_over_the_call():
+    heard = set()
+
+    assert parse_response(keyword_verdict('What is your PIN?', keywords, heard))['decision'] == 'need_more_time'
+    assert keyword_verdict('Your PIN please.', keywords, heard) is None
+    assert parse_response(keyword_verdict('And the account number.', keywords, heard))['decision'] == 'fraud'
+    assert heard == {'pin', 'account number'}
+
+def test_keywords_match_whole_words():
+    assert keyword_verdict('We will spin the wheel, happy shopping.', keywords) is None
@@ -0,0 +1,56 @@
+import json
+import os
+from CallOps.batch import BatchAnalyzer
+
+def _recordings(root, names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+
+def test_call_ids_are_unique(tmp_path):
+    _recordings(tmp_path / 'in', ['a/b.wav', 'a__b.wav', 'a/b.mp3', 'notes.txt'])
+    analyzer = BatchAnalyzer(lambda path: [], str(tmp_path / 'out'))
+
+    calls = analyzer.discover(str(tmp_path / 'in'))
+
+    assert len(calls) == 3
+    assert len({call_id for call_id, _ in calls}) == 3
+
+def test_manifest_paths_are_relative_to_the_manifest(tmp_path):
+    _recordings(tmp_path, ['calls/one.wav'])
+    (tmp_path / 'manifest.txt').write_text('# recordings\ncalls/one.wav\n\n')
+    analyzer = BatchAnalyzer(lambda path: [], str(tmp_path / 'out'))
+
+    [(call_id, path)] = analyzer.discover(str(tmp_path / 'manifest.txt'))
+
+    assert path == os.path.join(str(tmp_path), 'calls/one.wav')
+    assert call_id.startswith('calls__one.wav-')
+
+def test_interrupted_batch_resumes(tmp_path):
+    _recordings(tmp_path / 'in', ['one.wav', 'two.wav', 'three.wav'])
+    analysed = []
+    failures = ['two.wav']
+
+    def analyse(path):
+        name = os.path.basename(path)
+        analysed.append(name)
+        if name in failures:
+            failures.remove(name)
+            raise RuntimeError('STT failed')
+        return [(0, 'hello', 'Decision: not_fraud')]
+
+    analyzer = BatchAnalyzer(analyse, str(tmp_path / 'out'), workers=2)
+    assert analyzer.run(str(tmp_path / 'in')) == {'analysed': 2, 'failed': 1, 'skipped': 0}
+
+    # A torn last line from an interrupted run is ignored
+    with open(analyzer.checkpoint_path, 'a') as checkpoint:
+        checkpoint.write('{"call_id": "thr')
+
+    analysed.clear()
+    assert analyzer.run(str(tmp_path / 'in')) == {'analysed': 1, 'failed': 0, 'skipped': 2}
+    assert analysed == ['two.wav']
+
+    call_id = next(call_id for call_id, path in analyzer.discover(str(tmp_path / 'in')) if path.endswith('two.wav'))
+    with open(tmp_path / 'out' / f'{call_id}.json') as verdict_file:
+        assert json.load(verdict_file)['verdict'] == 'Decision: not_fraud'
@@ -0,0 +1,94 @@
+import pytest
+from LLMOps.budget import TokenBudget, TokenCounter, BudgetExceededError
+
+def _conversation(chunks, words=200):
+    messages = [{'role': 'system', 'content': 'You detect fraud in call transcripts.'}]
+    for index in range(chunks):
+        messages.append({'role': 'user', 'content': f'chunk {index} ' + 'word ' * words})
+        messages.append({'role': 'assistant', 'content': 'not_fraud'})
+    return messages
+
+def _price(model, prompt_tokens, completion_tokens):
+    # 1 INR per 1000 tokens
+    return (prompt_tokens + completion_tokens) / 1000
+
+def test_request_that_fits_is_sent_unchanged():
+    budget = TokenBudget(max_prompt_tokens=10000)
+    messages = _conversation(3)
+
+    checked, model = budget.check(messages, 'gpt-4o-2024-08-06', 100)
+
+    assert checked is messages
+    assert model == 'gpt-4o-2024-08-06'
+    assert budget.metrics()['allowed'] == 1
+
+def test_reject_policy_raises():
+    budget = TokenBudget(policy='reject', max_prompt_tokens=100)
+
+    with pytest.raises(BudgetExceededError):
+        budget.check(_conversation(3), 'gpt-4o-2024-08-06', 100)
+    assert budget.metrics()['rejected'] == 1
+
+def test_trim_keeps_the_system_prompt_and_the_last_chunks():
+    counter = TokenCounter()
+    messages = _conversation(5)
+    limit = counter.count(messages[:1] + messages[-4:], 'gpt-4o-2024-08-06')
+    budget = TokenBudget(policy='trim', max_prompt_tokens=limit, counter=counter)
+
+    checked, _ = budget.check(messages, 'gpt-4o-2024-08-06', 100)
+
+    assert checked == messages[:1] + messages[-4:]
+    assert budget.metrics()['trimmed'] == 1
+
+def test_trim_rejects_when_the_last_chunk_does_not_fit():
+    budget = TokenBudget(policy='trim', max_prompt_tokens=50)
+
+    with pytest.raises(BudgetExceededError):
+        budget.check(_conversation(2), 'gpt-4o-2024-08-06', 100)
+
+def test_downgrade_moves_the_request_to_the_fallback_model():
+    budget = TokenBudget(policy='downgrade', max_prompt_tokens=10000, fallback_model='small', windows={'big': 1000})
+    messages = _conversation(5)
+
+    checked, model = budget.check(messages, 'big', 100)
+
+    assert (checked, model) == (messages, 'small')
+    assert budget.metrics()['downgraded'] == 1
+
+def test_downgrade_ignores_a_fallback_the_handler_cannot_serve():
+    counter = TokenCounter()
+    messages = _conversation(5)
+    window = counter.count(messages[:1] + messages[-2:], 'big') + 100
+    budget = TokenBudget(policy='downgrade', fallback_model='small', windows={'big': window}, counter=counter)
+
+    checked, model = budget.check(messages, 'big', 100, models={'big': [1, 1]})
+
+    assert model == 'big'
+    assert checked == messages[:1] + messages[-2:]
+
+def test_call_spend_limit():
+    budget = TokenBudget(policy='reject', max_call_cost=5.0)
+    messages = _conversation(1)
+
+    budget.check(messages, 'gpt-4o-2024-08-06', 100, price=_price, call_id='call-1')
+    budget.spend('call-1', 4.99)
+    with pytest.raises(BudgetExceededError):
+        budget.check(messages, 'gpt-4o-2024-08-06', 100, price=_price, call_id='call-1')
+
+    # Other calls and released calls start from zero
+    budget.check(messages, 'gpt-4o-2024-08-06', 100, price=_price, call_id='call-2')
+    budget.release('call-1')
+    assert budget.spent('call-1') == 0.0
+
+def test_counter_caches_message_counts():
+    counter = TokenCounter()
+    messages = _conversation(3)
+
+    first = counter.count(messages)
+    misses = counter.metrics()['misses']
+    assert counter.count(messages + [{'role': 'user', 'content': 'new chunk'}]) > first
+    assert counter.metrics()['misses'] == misses + 1
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        TokenBudget(policy='ignore')
@@ -0,0 +1,70 @@
+import time
+from LLMOps.cache import ResponseCache, normalize_transcript
+
+system = {'role': 'system', 'content': 'You detect fraud in call transcripts.'}
+result = ('fraud', 0.12, 'assistant', 'gpt-4o-2024-08-06', 5, 100)
+
+def _messages(*texts):
+    return [system] + [{'role': 'user', 'content': text} for text in texts]
+
+def test_normalize_transcript():
+    assert normalize_transcript('Chunk 3: Hello,  this is YOUR bank!') == 'hello this is your bank'
+
+def test_same_words_give_the_same_key():
+    cache = ResponseCache()
+
+    assert cache.key(_messages('Chunk 1: Hello, this is your bank.'), 'm') == cache.key(_messages('hello this is your bank'), 'm')
+
+def test_key_changes_with_the_model_prompt_and_history():
+    cache = ResponseCache()
+    key = cache.key(_messages('hello this is your bank'), 'm')
+
+    assert cache.key(_messages('hello this is your bank'), 'other') != key
+    assert cache.key([{'role': 'system', 'content': 'New prompt.'}] + _messages('hello this is your bank')[1:], 'm') != key
+    assert cache.key(_messages('earlier chunk', 'hello this is your bank'), 'm') != key
+
+    # The previous verdict is part of the conversation
+    fraud = _messages('earlier chunk') + [{'role': 'assistant', 'content': 'fraud'}] + _messages('hello')[1:]
+    not_fraud = _messages('earlier chunk') + [{'role': 'assistant', 'content': 'not_fraud'}] + _messages('hello')[1:]
+    assert cache.key(fraud, 'm') != cache.key(not_fraud, 'm')
+
+def test_request_without_transcript_is_not_cached():
+    assert ResponseCache().key([system], 'm') is None
+
+def test_get_put_and_failed_responses():
+    cache = ResponseCache()
+    key = cache.key(_messages('hello'), 'm')
+
+    assert cache.get(key) is None
+    cache.put(key, (None, None, None, None, None, None))
+    assert cache.get(key) is None
+    cache.put(key, result)
+    assert cache.get(key) == result
+
+    metrics = cache.metrics()
+    assert (metrics['misses'], metrics['memory_hits'], metrics['stores']) == (2, 1, 1)
+
+def test_entries_expire_and_are_evicted():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    keys = [cache.key(_messages(text), 'm') for text in ('one', 'two', 'three')]
+    for key in keys:
+        cache.put(key, result)
+
+    assert cache.get(keys[0]) is None
+    assert cache.metrics()['evictions'] == 1
+
+    time.sleep(0.06)
+    assert cache.get(keys[2]) is None
+    assert cache.metrics()['expired'] == 1
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(path=path)
+    key = cache.key(_messages('hello'), 'm')
+    cache.put(key, result)
+    cache.close()
+
+    cache = ResponseCache(path=path)
+    assert cache.get(key) == result
+    assert cache.metrics()['disk_hits'] == 1
+    cache.close()
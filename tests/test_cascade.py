@@ -0,0 +1,78 @@
+import asyncio
+from LLMOps.cascade import ModelCascade
+
+class FakeClient:
+    '''
+    This class answers every model with a fixed response and records the models asked.
+    '''
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.models = []
+
+    def send_text(self, messages, model=None, user_id=None, max_tokens=1000):
+        self.models.append(model)
+        return self.answers[model], 1.0, 'assistant', model, 10, 100
+
+    def send_text_stream(self, messages, model=None, user_id=None, max_tokens=1000, on_decision=None):
+        result = self.send_text(messages, model, user_id, max_tokens)
+        if on_decision and result[0]:
+            on_decision(result[0].split(': ')[1])
+        return result
+
+    async def send_text_async(self, messages, model=None, user_id=None, max_tokens=1000):
+        return self.send_text(messages, model, user_id, max_tokens)
+
+def _chunk(*history):
+    return [{'role': 'system', 'content': 'prompt'}, *history, {'role': 'user', 'content': 'chunk'}]
+
+def test_final_fast_answer_is_not_escalated():
+    client = FakeClient({'fast': 'Decision: not_fraud', 'strong': 'Decision: fraud'})
+    cascade = ModelCascade(client, 'fast', 'strong')
+
+    assert cascade.send_text(_chunk()) == ('Decision: not_fraud', 1.0, 'assistant', 'fast', 10, 100)
+    assert client.models == ['fast']
+    assert cascade.metrics()['escalation_rate'] == 0.0
+
+def test_fraud_is_confirmed_by_the_strong_model_with_both_costs():
+    client = FakeClient({'fast': 'Decision: fraud', 'strong': 'Decision: not_fraud'})
+    cascade = ModelCascade(client, 'fast', 'strong')
+
+    assert cascade.send_text(_chunk()) == ('Decision: not_fraud', 2.0, 'assistant', 'strong', 20, 200)
+    assert client.models == ['fast', 'strong']
+    assert cascade.metrics()['escalated_fraud'] == 1
+
+def test_unparsed_answer_is_escalated():
+    client = FakeClient({'fast': 'I am not sure.', 'strong': 'Decision: need_more_time'})
+    cascade = ModelCascade(client, 'fast', 'strong')
+
+    assert asyncio.run(cascade.send_text_async(_chunk()))[0] == 'Decision: need_more_time'
+    assert cascade.metrics()['escalated_unparsed'] == 1
+
+def test_strong_failure_keeps_the_fast_answer():
+    client = FakeClient({'fast': 'Decision: need_more_time', 'strong': None})
+    cascade = ModelCascade(client, 'fast', 'strong')
+
+    assert cascade.send_text(_chunk())[:4] == ('Decision: need_more_time', 1.0, 'assistant', 'fast')
+
+def test_call_stays_on_the_strong_model_after_fraud():
+    client = FakeClient({'fast': 'Decision: not_fraud', 'strong': 'Decision: fraud'})
+    cascade = ModelCascade(client, 'fast', 'strong')
+
+    cascade.send_text(_chunk({'role': 'user', 'content': 'earlier'}, {'role': 'assistant', 'content': 'Decision: fraud'}))
+    assert client.models == ['strong']
+
+    cascade.sticky = False
+    cascade.send_text(_chunk({'role': 'user', 'content': 'earlier'}, {'role': 'assistant', 'content': 'Decision: fraud'}))
+    assert client.models == ['strong', 'fast']
+
+def test_only_final_decisions_of_the_fast_model_are_published():
+    published = []
+    cascade = ModelCascade(FakeClient({'fast': 'Decision: fraud', 'strong': 'Decision: not_fraud'}), 'fast', 'strong')
+    cascade.send_text_stream(_chunk(), on_decision=published.append)
+    assert published == ['not_fraud']
+
+    published.clear()
+    cascade = ModelCascade(FakeClient({'fast': 'Decision: not_fraud', 'strong': 'Decision: fraud'}), 'fast', 'strong')
+    cascade.send_text_stream(_chunk(), on_decision=published.append)
+    assert published == ['not_fraud']
@@ -0,0 +1,45 @@
+import wave
+import numpy as np
+import pytest
+from AudioOps.codec import MULAW_TABLE, WavWriter, decode_mulaw, resample
+
+# audioop was removed in Python 3.13, the table is checked against it where it is still available
+try:
+    import audioop
+except ImportError:
+    audioop = None
+
+needs_audioop = pytest.mark.skipif(audioop is None, reason='audioop is not available')
+
+@needs_audioop
+def test_mulaw_table_matches_audioop():
+    encoded = bytes(range(256))
+
+    assert audioop.ulaw2lin(encoded, 2) == MULAW_TABLE.astype('<i2').tobytes()
+
+@needs_audioop
+def test_decode_into_a_preallocated_array():
+    encoded = np.random.default_rng(0).integers(0, 256, 1000, dtype=np.uint8).tobytes()
+    out = np.zeros(1600, dtype=np.int16)
+
+    samples = decode_mulaw(encoded, out=out)
+
+    assert np.shares_memory(samples, out)
+    assert samples.astype('<i2').tobytes() == audioop.ulaw2lin(encoded, 2)
+
+def test_resample():
+    samples = np.arange(0, 800, dtype=np.int16)
+
+    assert resample(samples, 8000, 8000) is samples
+    assert len(resample(samples, 8000, 16000)) == 1600
+
+def test_wav_writer_reuses_its_buffer():
+    writer = WavWriter(sample_rate=8000)
+    samples = np.arange(-400, 400, dtype=np.int16)
+
+    buffer = writer.write(samples)
+    assert writer.write(samples[:100]) is buffer
+
+    with wave.open(buffer) as wav:
+        assert (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (8000, 1, 2)
+        assert wav.readframes(wav.getnframes()) == samples[:100].tobytes()
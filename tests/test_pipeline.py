@@ -0,0 +1,69 @@
+import random
+import threading
+import time
+import pytest
+from CallOps.pipeline import ChunkPipeline, Stage, PipelineError
+
+def _stage_threads(pipeline):
+    return [thread for thread in pipeline._threads if thread.is_alive()]
+
+def test_results_keep_submission_order():
+    def slow_double(item):
+        time.sleep(random.uniform(0, 0.005))
+        return item * 2
+
+    pipeline = ChunkPipeline([Stage('stt', slow_double, workers=4), Stage('llm', lambda item: item + 1)])
+
+    assert pipeline.run(range(50)) == [item * 2 + 1 for item in range(50)]
+
+def test_none_drops_the_chunk():
+    pipeline = ChunkPipeline([Stage('gate', lambda item: item if item % 2 else None), Stage('llm', lambda item: item)])
+
+    assert pipeline.run(range(10)) == [1, 3, 5, 7, 9]
+
+def test_stage_errors_are_kept_and_raised():
+    def fail_on_two(item):
+        if item == 2:
+            raise ValueError('boom')
+        return item
+
+    pipeline = ChunkPipeline([Stage('stt', fail_on_two, workers=2)])
+    with pytest.raises(PipelineError) as error:
+        pipeline.run(range(4), raise_errors=True)
+
+    assert [(name, sequence) for name, sequence, _ in error.value.errors] == [('stt', 2)]
+    assert pipeline.results == [0, 1, 3]
+
+def test_stage_errors_only_logged_by_default():
+    pipeline = ChunkPipeline([Stage('stt', lambda item: 1 / item)])
+
+    assert pipeline.run([1, 0, 2]) == [1.0, 0.5]
+    assert len(pipeline.errors) == 1
+
+def test_failing_input_stops_the_pipeline():
+    started = threading.Event()
+    release = threading.Event()
+    analysed = []
+
+    def transcribe(item):
+        started.set()
+        release.wait(timeout=5)
+        return item
+
+    def items():
+        yield 0
+        yield 1
+        started.wait(timeout=5)
+        raise RuntimeError('ffmpeg failed')
+
+    pipeline = ChunkPipeline([Stage('stt', transcribe), Stage('llm', analysed.append)], queue_size=4)
+
+    thread = threading.Thread(target=lambda: (time.sleep(0.1), release.set()))
+    thread.start()
+    with pytest.raises(RuntimeError, match='ffmpeg failed'):
+        pipeline.run(items())
+    thread.join()
+
+    # Every stage thread exited, and the chunks waiting behind the failure were not analysed
+    assert _stage_threads(pipeline) == []
+    assert analysed == []
@@ -0,0 +1,125 @@
+import asyncio
+import time
+import pytest
+from LLMOps.budget import BudgetExceededError
+from LLMOps.router import LLMRouter, is_transient
+from LLMOps.usage import UsageTracker
+
+class ServerError(Exception):
+    status_code = 503
+
+class FakeHandler:
+    '''
+    This class answers like an LLM handler after a delay, failing with the given errors first.
+    '''
+
+    def __init__(self, decision, decide_at=0.0, done_at=0.0, errors=()):
+        self.decision = decision
+        self.decide_at = decide_at
+        self.done_at = done_at
+        self.errors = list(errors)
+        self.calls = 0
+        self.usage = UsageTracker()
+
+    def send_text_stream(self, messages, model=None, user_id=None, max_tokens=1000, on_decision=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+        time.sleep(self.decide_at)
+        if on_decision:
+            on_decision(self.decision)
+        time.sleep(self.done_at - self.decide_at)
+
+        return f'Decision: {self.decision}', 0.0, 'assistant', model, 1, 1
+
+    def send_text(self, messages, model=None, user_id=None, max_tokens=1000):
+        return self.send_text_stream(messages, model, user_id, max_tokens)
+
+    async def send_text_stream_async(self, messages, model=None, user_id=None, max_tokens=1000, on_decision=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+        await asyncio.sleep(self.decide_at)
+        if on_decision:
+            on_decision(self.decision)
+        await asyncio.sleep(self.done_at - self.decide_at)
+
+        return f'Decision: {self.decision}', 0.0, 'assistant', model, 1, 1
+
+def _router(*handlers, **kwargs):
+    return LLMRouter([(handler, f'model-{index}') for index, handler in enumerate(handlers)], backoff=0, **kwargs)
+
+def test_is_transient():
+    assert is_transient(ServerError())
+    assert is_transient(TimeoutError())
+    assert not is_transient(ValueError())
+
+def test_transient_errors_are_retried():
+    handler = FakeHandler('fraud', errors=[ServerError(), ServerError()])
+    router = _router(handler, hedge=False)
+
+    assert router.send_text([])[0] == 'Decision: fraud'
+    assert handler.calls == 3
+    assert router.metrics()['providers'][0]['retries'] == 2
+
+def test_failing_provider_is_replaced_by_the_next():
+    first = FakeHandler('fraud', errors=[ValueError('bad request')])
+    second = FakeHandler('not_fraud')
+    router = _router(first, second, hedge=False)
+
+    assert router.send_text([]) == ('Decision: not_fraud', 0.0, 'assistant', 'model-1', 1, 1)
+    assert first.calls == 1
+    assert router.metrics()['providers'][1]['failovers'] == 1
+
+def test_last_error_is_raised_when_every_provider_fails():
+    router = _router(FakeHandler('fraud', errors=[ValueError('first')]), FakeHandler('fraud', errors=[ValueError('second')]))
+
+    with pytest.raises(ValueError, match='second'):
+        router.send_text([])
+
+def test_budget_errors_are_not_failed_over():
+    second = FakeHandler('not_fraud')
+    router = _router(FakeHandler('fraud', errors=[BudgetExceededError('too long')]), second)
+
+    with pytest.raises(BudgetExceededError):
+        router.send_text([])
+    assert second.calls == 0
+
+def test_slow_provider_is_hedged_and_only_the_winner_publishes():
+    published = []
+    router = _router(FakeHandler('fraud', 0.3, 0.5), FakeHandler('not_fraud', 0.0, 0.05), hedge_after=0.05)
+
+    assert router.send_text_stream([], on_decision=published.append)[0] == 'Decision: not_fraud'
+    time.sleep(0.5)
+
+    assert published == ['not_fraud']
+    assert router.metrics()['providers'][1]['hedge_wins'] == 1
+
+def test_decision_is_published_early_without_a_hedge():
+    published = []
+    router = _router(FakeHandler('fraud', 0.0, 0.1), FakeHandler('not_fraud'), hedge_after=1.0)
+
+    def on_decision(decision):
+        published.append((decision, time.perf_counter()))
+
+    started = time.perf_counter()
+    router.send_text_stream([], on_decision=on_decision)
+    finished = time.perf_counter()
+
+    assert [decision for decision, _ in published] == ['fraud']
+    assert published[0][1] - started < finished - started - 0.05
+
+def test_async_hedge_cancels_the_loser():
+    published = []
+    first = FakeHandler('fraud', 0.3, 0.5)
+    router = _router(first, FakeHandler('not_fraud', 0.0, 0.05), hedge_after=0.05)
+
+    async def main():
+        result = await router.send_text_stream_async([], on_decision=published.append)
+        await asyncio.sleep(0.4)
+        return result
+
+    assert asyncio.run(main())[0] == 'Decision: not_fraud'
+    assert published == ['not_fraud']
@@ -0,0 +1,47 @@
+import base64
+from AudioOps.stream import MulawRingBuffer
+
+def test_windows_are_handed_out_in_order():
+    ring = MulawRingBuffer(window_ms=10, sample_rate=1000, capacity_ms=30)
+    data = bytes(range(25))
+
+    ring.ingest(base64.b64encode(data[:7]))
+    assert list(ring.windows()) == []
+    ring.write(data[7:])
+
+    assert list(ring.windows()) == [data[:10], data[10:20]]
+    assert ring.flush() == data[20:]
+    assert len(ring) == 0
+
+def test_writes_wrap_around_the_ring():
+    ring = MulawRingBuffer(window_ms=10, sample_rate=1000, capacity_ms=17)
+    data = bytes(range(40))
+
+    windows = []
+    for start in range(0, 40, 8):
+        ring.write(data[start:start + 8])
+        windows.extend(ring.windows())
+
+    assert windows == [data[0:10], data[10:20], data[20:30], data[30:40]]
+    assert ring.dropped == 0
+
+def test_overflow_drops_the_oldest_audio():
+    ring = MulawRingBuffer(window_ms=10, sample_rate=1000, capacity_ms=10)
+    data = bytes(range(25))
+
+    ring.write(data[:8])
+    ring.write(data[8:14])
+    assert ring.dropped == 4
+    assert ring.pop(10) == data[4:14]
+
+    ring.write(data)
+    assert ring.dropped == 4 + 15
+    assert ring.flush() == data[15:]
+
+def test_flush_discards_a_short_remainder():
+    ring = MulawRingBuffer(window_ms=10, sample_rate=1000)
+    ring.write(bytes(4))
+
+    assert ring.flush(min_ms=5) is None
+    assert len(ring) == 0
+    assert ring.flush() is None
@@ -0,0 +1,60 @@
+import numpy as np
+from AudioOps.vad import VADSegmenter
+
+frame = 240
+
+def _speech(frames):
+    return (8000 * np.sin(2 * np.pi * 300 * np.arange(frames * frame) / 8000)).astype(np.int16)
+
+def _silence(frames):
+    return np.zeros(frames * frame, dtype=np.int16)
+
+def _segmenter(**kwargs):
+    settings = dict(min_segment_ms=300, silence_ms=300, padding_ms=0)
+    settings.update(kwargs)
+    return VADSegmenter(**settings)
+
+def _lengths(segments):
+    return [len(segment) // frame for segment in segments]
+
+def test_utterances_are_split_at_pauses():
+    audio = np.concatenate((_silence(5), _speech(12), _silence(15), _speech(20), _silence(3)))
+
+    assert _lengths(_segmenter().segment(audio)) == [12, 20]
+
+def test_padding_is_kept_around_utterances():
+    audio = np.concatenate((_silence(10), _speech(12), _silence(15)))
+
+    assert _lengths(_segmenter(padding_ms=90).segment(audio)) == [3 + 12 + 3]
+
+def test_short_utterance_is_carried_into_the_next_one():
+    audio = np.concatenate((_speech(3), _silence(13), _speech(12), _silence(10)))
+
+    # The pause after the first utterance is trimmed, the silence before the second is kept
+    assert _lengths(_segmenter().segment(audio)) == [3 + 3 + 12]
+
+def test_short_utterance_is_dropped_after_a_second_pause():
+    audio = np.concatenate((_speech(3), _silence(20), _speech(12), _silence(10)))
+
+    assert _lengths(_segmenter().segment(audio)) == [12]
+
+def test_long_speech_is_cut_at_max_segment():
+    audio = _speech(50)
+
+    assert _lengths(_segmenter(max_segment_ms=600).segment(audio)) == [20, 20, 10]
+
+def test_noise_cut_at_max_segment_is_dropped():
+    audio = np.concatenate((_speech(3), _silence(5)) * 4)
+
+    assert _segmenter(max_segment_ms=600, silence_ms=900).segment(audio) == []
+
+def test_streamed_blocks_match_the_whole_recording():
+    audio = np.concatenate((_silence(5), _speech(12), _silence(15), _speech(30), _silence(3), _speech(2)))
+    segmenter = _segmenter(max_segment_ms=600, padding_ms=60)
+
+    whole = segmenter.segment(audio)
+    blocks = np.array_split(audio, np.sort(np.random.default_rng(0).integers(0, len(audio), 40)))
+    streamed = list(segmenter.stream(blocks))
+
+    assert len(streamed) == len(whole)
+    assert all(np.array_equal(a, b) for a, b in zip(streamed, whole))
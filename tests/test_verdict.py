@@ -0,0 +1,92 @@
+import pytest
+from LLMOps.verdict import DecisionParser, Verdict, normalize_decision, parse_response, parse_verdict
+
+@pytest.mark.parametrize('value, decision', [
+    ('fraud', 'fraud'),
+    ('**Fraud**', 'fraud'),
+    ('[not fraud]', 'not_fraud'),
+    ('Not_Fraud.', 'not_fraud'),
+    ('need more time', 'need_more_time'),
+    ('maybe', None),
+])
+def test_normalize_decision(value, decision):
+    assert normalize_decision(value) == decision
+
+def test_parse_text_response():
+    text = '**Decision:** Fraud\n\nReasoning: The caller asked for the OTP\nof the account.\n\nAction: Fraud! Hang up.'
+
+    assert parse_response(text) == {
+        'decision': 'fraud',
+        'reasoning': 'The caller asked for the OTP of the account.',
+        'action': 'Fraud! Hang up.',
+    }
+
+def test_parse_json_response_in_a_code_fence():
+    text = '```json\n{"decision": "not_fraud", "reasoning": "A delivery update", "action": "Nothing to do."}\n```'
+
+    assert parse_verdict(text) == Verdict('not_fraud', 'A delivery update', 'Nothing to do.')
+
+def test_parse_truncated_json_response():
+    verdict = parse_verdict('{"decision": "fraud", "reasoning": "Asked for the \\"PIN\\"", "action": "Fraud! Ha')
+
+    assert verdict.decision == 'fraud'
+    assert verdict.reasoning == 'Asked for the "PIN"'
+    assert verdict.is_fraud
+
+def test_parse_empty_response():
+    assert parse_verdict('') == Verdict()
+    assert parse_verdict(None).to_dict() == {'decision': None, 'reasoning': None, 'action': None}
+
+def test_verdict_round_trips_through_text_and_json():
+    verdict = Verdict('fraud', 'Asked for the OTP', 'Fraud! Hang up.')
+
+    assert parse_verdict(verdict.to_text()) == verdict
+    assert parse_verdict(verdict.to_json()) == verdict
+
+def test_streamed_decision_fires_once_before_the_rest():
+    decisions = []
+    parser = DecisionParser(on_decision=decisions.append)
+
+    for delta in ['Deci', 'sion: fr', 'aud\n', 'Reasoning: OTP', '\nDecision: not_fraud\n']:
+        parser.feed(delta)
+        if delta == 'aud\n':
+            assert decisions == ['fraud']
+
+    parser.finish()
+    assert decisions == ['fraud']
+    assert parser.sections['decision'] == 'fraud'
+
+def test_streamed_decision_on_its_own_line():
+    decisions = []
+    parser = DecisionParser(on_decision=decisions.append)
+
+    parser.feed('Decision:\n')
+    assert decisions == []
+    parser.feed('Need more time\nReasoning: Too short')
+    parser.finish()
+
+    assert decisions == ['need_more_time']
+    assert parser.sections['reasoning'] == 'Too short'
+
+def test_streamed_json_decision():
+    decisions = []
+    parser = DecisionParser(on_decision=decisions.append)
+
+    parser.feed('{"decision": "not_fr')
+    assert decisions == []
+    parser.feed('aud", "reasoning": "A friend')
+    assert decisions == ['not_fraud']
+
+    parser.feed(' calling", "action": "Nothing to do."}')
+    parser.finish()
+    assert parser.sections == {'decision': 'not_fraud', 'reasoning': 'A friend calling', 'action': 'Nothing to do.'}
+
+def test_failing_callback_does_not_stop_the_parser():
+    def fail(decision):
+        raise RuntimeError('publish failed')
+
+    parser = DecisionParser(on_decision=fail)
+    parser.feed('Decision: fraud\nReasoning: OTP\n')
+
+    assert parser.finish()
+    assert parser.sections['decision'] == 'fraud'
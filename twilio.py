@@ -1,10 +1,16 @@
 import os
 import json
+import base64
 import asyncio
-import websockets
-from flask import Flask, request, send_from_directory
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
 from google.cloud import speech
 from google.oauth2 import service_account
+from CallOps.recognizer import StreamingRecognizer, mulaw_streaming_config
+from CallOps.broadcast import Broadcaster
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -14,28 +20,29 @@ load_dotenv()
 credentials = service_account.Credentials.from_service_account_file("path/to/your-service-account-file.json")
 client = speech.SpeechClient(credentials=credentials)
 
-# Flask application
-app = Flask(__name__)
-
 # Transcription Request Configuration
-request_config = {
-    "config": {
-        "encoding": speech.RecognitionConfig.AudioEncoding.MULAW,
-        "sample_rate_hertz": 8000,
-        "language_code": "en-GB",
-    },
-    "interim_results": True,
-}
+streaming_config = mulaw_streaming_config(language_code="en-GB", sample_rate=8000)
+
+# WebSocket server handling, transcripts are fanned out to subscribers
+broadcaster = Broadcaster()
 
-# WebSocket server handling
-connected_clients = set()
+async def broadcast_transcripts(recognizer, call_id):
+    async for transcript, is_final in recognizer.transcripts():
+        print(transcript)
+        
+        # Only the latest interim transcript matters to a subscriber that is behind
+        broadcaster.publish(call_id, {
+            'event': 'transcription' if is_final else 'interim-transcription',
+            'text': transcript
+        }, coalesce=not is_final)
 
-async def handle_connection(websocket, path):
+async def handle_connection(websocket):
     print("New Connection Initiated")
-    recognize_stream = None
+    recognizer = None
+    broadcast_task = None
     
     try:
-        async for message in websocket:
+        async for message in websocket.iter_text():
             msg = json.loads(message)
             
             if msg['event'] == "connected":
@@ -43,73 +50,72 @@ async def handle_connection(websocket, path):
                 
             elif msg['event'] == "start":
                 print(f"Starting Media Stream {msg['streamSid']}")
-                recognize_stream = client.streaming_recognize(request=request_config)
-                
-                for response in recognize_stream:
-                    transcript = response.results[0].alternatives[0].transcript
-                    print(transcript)
-                    
-                    # Broadcast the transcription to all connected clients
-                    for client_ws in connected_clients:
-                        if client_ws.open:
-                            await client_ws.send(json.dumps({
-                                'event': 'interim-transcription',
-                                'text': transcript
-                            }))
+                # Recognition runs in its own thread, transcripts come back as a task on this loop
+                recognizer = StreamingRecognizer(client, streaming_config)
+                recognizer.start()
+                broadcast_task = asyncio.create_task(broadcast_transcripts(recognizer, msg['streamSid']))
             
             elif msg['event'] == "media":
-                # Send media packets to recognize_stream
-                if recognize_stream:
-                    recognize_stream.write(msg['media']['payload'])
+                # Send media packets to the recognizer
+                if recognizer:
+                    recognizer.write(base64.b64decode(msg['media']['payload']))
                     
             elif msg['event'] == "stop":
                 print("Call Has Ended")
-                if recognize_stream:
-                    recognize_stream.close()
+                if recognizer:
+                    recognizer.close()
+                    await broadcast_task
+                    recognizer = None
                 
-    except websockets.ConnectionClosed:
+    except WebSocketDisconnect:
         print("Connection Closed")
         
     finally:
-        connected_clients.remove(websocket)
+        if recognizer:
+            recognizer.close()
+
+# Media stream route, Twilio connects here
+async def media_stream(websocket):
+    await websocket.accept()
+    await handle_connection(websocket)
 
-# Setup WebSocket route
-async def websocket_handler(websocket, path):
-    connected_clients.add(websocket)
-    await handle_connection(websocket, path)
+# Subscribers connect to /subscribe for every call or /subscribe/<streamSid> for a single call
+async def subscribe(websocket):
+    await websocket.accept()
+    subscriber = broadcaster.subscribe(websocket.send_text, call_id=websocket.path_params.get('call_id'))
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await broadcaster.unsubscribe(subscriber)
 
 # Serve static files for frontend
-@app.route('/')
-def index():
-    return send_from_directory('public', 'index.html')
+async def index(request):
+    return FileResponse('public/index.html')
 
-@app.route('/', methods=['POST'])
-def handle_post():
+async def handle_post(request):
     response = f"""
     <Response>
       <Start>
-        <Stream url="wss://{request.host}/"/>
+        <Stream url="wss://{request.headers['host']}/"/>
       </Start>
       <Say>I will stream the next 60 seconds of audio through your websocket</Say>
       <Pause length="60" />
     </Response>
     """
-    return response, 200, {'Content-Type': 'text/xml'}
+    return Response(response, media_type='text/xml')
+
+# One ASGI application serves the TwiML webhook, the frontend and the websockets on a single event loop
+app = Starlette(routes=[
+    Route('/', index, methods=['GET']),
+    Route('/', handle_post, methods=['POST']),
+    WebSocketRoute('/', media_stream),
+    WebSocketRoute('/subscribe', subscribe),
+    WebSocketRoute('/subscribe/{call_id}', subscribe),
+])
 
-# Start the Flask server
+# Start the server
 if __name__ == '__main__':
-    import threading
-    import websockets
-    
-    def start_websocket_server():
-        asyncio.get_event_loop().run_until_complete(
-            websockets.serve(websocket_handler, "localhost", 8080)
-        )
-        asyncio.get_event_loop().run_forever()
-    
-    # Run WebSocket server in a separate thread
-    ws_thread = threading.Thread(target=start_websocket_server)
-    ws_thread.start()
-    
-    # Run Flask server
-    app.run(port=8080)
\ No newline at end of file
+    uvicorn.run(app, host="localhost", port=8080)
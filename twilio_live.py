@@ -1,17 +1,42 @@
 import threading
 import os
-import json
+import sys
 import asyncio
-import websockets
-from flask import Flask, request, send_from_directory
+import uvicorn
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
 from pydub import AudioSegment
+from AudioOps.codec import WavWriter, decode_mulaw
+from AudioOps.vad import VADSegmenter
+from AudioOps.gate import SpeechGate
+from CallOps.pipeline import ChunkPipeline, Stage
+from CallOps.recognizer import StreamingRecognizer, mulaw_streaming_config
+from CallOps.session import CallSession, SessionRegistry
+from CallOps.broadcast import Broadcaster
+from CallOps.admission import AdmissionController, keyword_verdict, KEYWORD, REJECTED
+from CallOps.frames import TwilioFrameDecoder
+from CallOps import supervisor
 from LLMOps.OpenAI import OpenAILLMHandler, OpenAISpeechHandler
+from LLMOps.Anthropic import ClaudeLLMHandler
+from LLMOps.router import LLMRouter
+from LLMOps.cascade import ModelCascade
+from LLMOps.verdict import parse_verdict
+from LLMOps.compaction import ConversationCompactor
+from LLMOps.cache import ResponseCache
+from LLMOps.budget import TokenBudget, BudgetExceededError
+from LLMOps import transport
 from DBOps.firebase import FirebaseOps
-from prompt import system_prompt
+from prompt import new_messages
 import io
+import numpy as np
 import configparser
 import logging
 from twilio.rest import Client
+from google.cloud import speech
+from google.oauth2 import service_account
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -25,14 +50,144 @@ logger.setLevel(logging.WARNING)
 config = configparser.ConfigParser()
 config.read('config.ini')
 
+# Start the server before any client is created. The workers import twilio_live:app themselves (under the
+# supervisor after the fork), so every worker builds its own gRPC, Firebase and HTTP clients
+if __name__ == '__main__':
+    host = config.get('Server', 'host', fallback='0.0.0.0')
+    port = config.getint('Server', 'port', fallback=8080)
+    worker_count = config.getint('Server', 'workers', fallback=1)
+
+    # Several workers share the port, every call stays on the worker that accepted it
+    if worker_count > 1:
+        supervisor.Supervisor(
+            "twilio_live:app",
+            host=host,
+            port=port,
+            workers=worker_count,
+            report_interval=config.getint('Server', 'report_interval', fallback=30)
+        ).run()
+    else:
+        uvicorn.run("twilio_live:app", host=host, port=port)
+    sys.exit()
+
 # Read OpenAI API key from config
 openai_api_key = config['OpenAI']['api_key']
 
 llm_model = config['Models']['llm']
 stt_model = config['Models']['stt']
 
+# Voice activity detection settings
+vad_settings = {
+    'energy_threshold': config.getfloat('VAD', 'energy_threshold', fallback=-40.0),
+    'min_segment_ms': config.getint('VAD', 'min_segment_ms', fallback=1000),
+    'max_segment_ms': config.getint('VAD', 'max_segment_ms', fallback=15 * 1000),
+    'silence_ms': config.getint('VAD', 'silence_ms', fallback=600),
+}
+
+# Pre-STT speech gate settings
+gate_settings = {
+    'enabled': config.getboolean('Gate', 'enabled', fallback=True),
+    'min_rms_db': config.getfloat('Gate', 'min_rms_db', fallback=-45.0),
+    'min_speech_ratio': config.getfloat('Gate', 'min_speech_ratio', fallback=0.3),
+}
+
+# Chunk pipeline settings
+stt_workers = config.getint('Pipeline', 'stt_workers', fallback=2)
+queue_size = config.getint('Pipeline', 'queue_size', fallback=4)
+
+# Stream the LLM responses, so the decision is published before the reasoning is generated
+stream_llm = config.getboolean('Pipeline', 'stream_llm', fallback=True)
+
+# Ask for the verdict as short JSON instead of the Decision/Reasoning/Action text
+structured_verdict = config.getboolean('Verdict', 'structured', fallback=False)
+verdict_max_tokens = config.getint('Verdict', 'max_tokens', fallback=200)
+
+# Admission control, new calls get less analysis once the STT/LLM providers are saturated
+admission = AdmissionController(
+    degrade_calls=config.getint('Admission', 'degrade_calls', fallback=10),
+    keyword_calls=config.getint('Admission', 'keyword_calls', fallback=25),
+    max_calls=config.getint('Admission', 'max_calls', fallback=0),
+    degrade_inflight=config.getint('Admission', 'degrade_inflight', fallback=8),
+    keyword_inflight=config.getint('Admission', 'keyword_inflight', fallback=16),
+    chunk_factor=config.getfloat('Admission', 'chunk_factor', fallback=2.0),
+    degraded_model=config.get('Admission', 'degraded_model', fallback=None),
+)
+fraud_keywords = [
+    keyword.strip().lower()
+    for keyword in config.get('Admission', 'keywords', fallback='otp,kyc,aadhaar,pin,cvv,gift card,account will be blocked,transfer the money').split(',')
+    if keyword.strip()
+]
+# A call is only flagged as fraud once this many different keywords were heard
+keyword_min_hits = config.getint('Admission', 'keyword_min_hits', fallback=2)
+
 # Create OpenAI Handlers
-llm_handler = OpenAILLMHandler(openai_api_key)
+# Long calls only send the latest chunks verbatim, older chunks are summarized
+compactor = None
+if config.getboolean('Compaction', 'enabled', fallback=True):
+    compactor = ConversationCompactor(
+        keep_chunks=config.getint('Compaction', 'keep_chunks', fallback=6),
+        token_budget=config.getint('Compaction', 'token_budget', fallback=6000),
+        summary_tokens=config.getint('Compaction', 'summary_tokens', fallback=600),
+    )
+
+# Responses to transcripts that were already analysed are reused
+response_cache = None
+if config.getboolean('Cache', 'enabled', fallback=False):
+    response_cache = ResponseCache(
+        max_entries=config.getint('Cache', 'max_entries', fallback=1024),
+        ttl=config.getfloat('Cache', 'ttl', fallback=24 * 3600),
+        path=config.get('Cache', 'path', fallback=None),
+    )
+
+# Requests are checked against the context window and the spend limits before they are sent
+budget = None
+if config.getboolean('Budget', 'enabled', fallback=True):
+    budget = TokenBudget(
+        policy=config.get('Budget', 'policy', fallback='trim'),
+        max_prompt_tokens=config.getint('Budget', 'max_prompt_tokens', fallback=None),
+        max_request_cost=config.getfloat('Budget', 'max_request_cost', fallback=None),
+        max_call_cost=config.getfloat('Budget', 'max_call_cost', fallback=None),
+        fallback_model=config.get('Budget', 'fallback_model', fallback=None),
+    )
+
+llm_handler = OpenAILLMHandler(
+    openai_api_key, compactor=compactor, cache=response_cache, budget=budget,
+    structured=structured_verdict, verdict_max_tokens=verdict_max_tokens
+)
+
+# With [Router] enabled, failed requests are retried and moved to Claude, and slow ones are also sent to Claude
+llm_router = None
+if config.getboolean('Router', 'enabled', fallback=False):
+    claude_handler = ClaudeLLMHandler(
+        config['Anthropic']['api_key'], compactor=compactor, cache=response_cache, budget=budget,
+        structured=structured_verdict, verdict_max_tokens=verdict_max_tokens
+    )
+    llm_router = LLMRouter(
+        [(llm_handler, llm_model), (claude_handler, config.get('Router', 'secondary_model', fallback='claude-3-haiku-20240307'))],
+        retries=config.getint('Router', 'retries', fallback=2),
+        backoff=config.getfloat('Router', 'backoff', fallback=0.25),
+        hedge=config.getboolean('Router', 'hedge', fallback=True),
+        hedge_after=config.getfloat('Router', 'hedge_after', fallback=None),
+        hedge_quantile=config.getfloat('Router', 'hedge_quantile', fallback=0.95),
+    )
+
+# The chunks are analysed through the router when there is one
+llm_client = llm_router or llm_handler
+
+# With [Cascade] enabled, chunks go to a fast model first and only the ambiguous or fraud ones to the strong model
+llm_cascade = None
+if config.getboolean('Cascade', 'enabled', fallback=False):
+    llm_cascade = ModelCascade(
+        llm_client,
+        fast_model=config.get('Cascade', 'fast_model', fallback='gpt-4o-mini-2024-07-18'),
+        strong_model=config.get('Cascade', 'strong_model', fallback=llm_model),
+        escalate_on=[decision.strip() for decision in config.get('Cascade', 'escalate_on', fallback='fraud,need_more_time').split(',') if decision.strip()],
+        sticky=config.getboolean('Cascade', 'sticky', fallback=True),
+    )
+    llm_client = llm_cascade
+
+# The model the chunks are sent to, the cascade picks its own
+chunk_model = None if llm_cascade else llm_model
 
 # Create Speech to text handler Handler
 speech_to_text_handler = OpenAISpeechHandler(openai_api_key)
@@ -40,138 +195,343 @@ speech_to_text_handler = OpenAISpeechHandler(openai_api_key)
 # Create Firebase Handler
 firebase_handler = FirebaseOps(config['Firebase']['credentials_path'], config['Firebase']['database_url'])
 
-# create messages and insert system prompt
-messages = [
-    {
-        "role": "system",
-        "content": [
-            {
-                "type": "text", 
-                "text": system_prompt
-            }
-        ]
-    }
-]
+# Active calls, keyed by stream id
+sessions = SessionRegistry()
 
 # Twilio credentials
 account_sid = config['Twilio']['account_sid']
 auth_token = config['Twilio']['auth_token']
 twilio_client = Client(account_sid, auth_token)
 
-# Flask application
-app = Flask(__name__)
+# Google Speech-to-Text client for the interim transcripts
+credentials = service_account.Credentials.from_service_account_file(config['Google']['credentials_path'])
+client = speech.SpeechClient(credentials=credentials)
+streaming_config = mulaw_streaming_config(language_code="en-GB", sample_rate=8000)
+
+# WebSocket server handling, transcripts and verdicts are fanned out to subscribers
+broadcaster = Broadcaster(max_queue=config.getint('Broadcast', 'max_queue', fallback=32))
 
-# WebSocket server handling
-connected_clients = set()
+# Length of the audio windows handed from the ring buffer to the VAD
+ingest_window_ms = 500
 
-async def handle_connection(websocket, path):
+# Number of 20 ms media frames base64 decoded together
+frame_batch = config.getint('Server', 'frame_batch', fallback=5)
+
+# Speech gate shared by all calls, so its counters cover the whole server
+speech_gate = SpeechGate(sample_rate=8000, vad=VADSegmenter(sample_rate=8000, **vad_settings), **gate_settings)
+
+async def broadcast_transcripts(session):
+    async for transcript, is_final in session.recognizer.transcripts():
+        print(transcript)
+
+        # Calls in keyword mode get no LLM analysis, their final transcripts are screened instead
+        if is_final and session.mode == KEYWORD:
+            verdict = keyword_verdict(transcript, fraud_keywords, heard=session.keywords_heard, min_hits=keyword_min_hits)
+            if verdict:
+                await asyncio.to_thread(publish_verdict, session, session.next_chunk_index(), verdict)
+        
+        # Only the latest interim transcript matters to a subscriber that is behind
+        broadcaster.publish(session.call_id, {
+            'event': 'transcription' if is_final else 'interim-transcription',
+            'text': transcript
+        }, coalesce=not is_final)
+
+async def handle_connection(websocket):
     print("New Connection Initiated")
-    recognize_stream = None
+    session = None
+    broadcast_task = None
+    decoder = TwilioFrameDecoder(batch_frames=frame_batch)
     
     try:
-        async for message in websocket:
-            msg = json.loads(message)
+        async for message in websocket.iter_text():
+            event, data = decoder.feed(message)
+
+            if event == "media":
+                # Media frames arrive 50 times a second, their audio is handled in batches
+                if session is not None and data is not None:
+                    await ingest_audio(session, data)
             
-            if msg['event'] == "connected":
+            elif event == "connected":
                 print(f"A new call has connected.")
                 
-            elif msg['event'] == "start":
-                print(f"Starting Media Stream {msg['streamSid']}")
-                recognize_stream = client.streaming_recognize(request=request_config)
-                
-                for response in recognize_stream:
-                    transcript = response.results[0].alternatives[0].transcript
-                    print(transcript)
-                    
-                    # Broadcast the transcription to all connected clients
-                    for client_ws in connected_clients:
-                        if client_ws.open:
-                            await client_ws.send(json.dumps({
-                                'event': 'interim-transcription',
-                                'text': transcript
-                            }))
-            
-            elif msg['event'] == "media":
-                # Send media packets to recognize_stream
-                if recognize_stream:
-                    recognize_stream.write(msg['media']['payload'])
+            elif event == "start":
+                print(f"Starting Media Stream {data['streamSid']}")
+                call_sid = data['start'].get('callSid')
+                mode = admission.admit(call_sid or data['streamSid'])
+                if mode == REJECTED:
+                    print(f"Rejecting Media Stream {data['streamSid']}: {admission.metrics()}")
+                    await websocket.close()
+                    return
+
+                call_vad_settings, call_model = admission.settings(mode, vad_settings, chunk_model)
+                session = sessions.create(
+                    data['streamSid'],
+                    new_messages(structured_verdict),
+                    call_sid=call_sid,
+                    window_ms=ingest_window_ms,
+                    vad_settings=call_vad_settings,
+                    mode=mode,
+                    model=call_model
+                )
+                if mode != KEYWORD:
+                    session.pipeline = create_pipeline(session, speech_gate)
+
+                # Recognition runs in its own thread, transcripts come back as a task on this loop
+                # Audio is written in batches of frame_batch frames, the queue holds 10 seconds of them
+                session.recognizer = StreamingRecognizer(client, streaming_config, max_queue=max(1, 500 // frame_batch))
+                session.recognizer.start()
+                broadcast_task = asyncio.create_task(broadcast_transcripts(session))
+
+                await asyncio.to_thread(supervisor.report_call_started, session.call_id)
                     
-            elif msg['event'] == "stop":
+            elif event == "stop":
                 print("Call Has Ended")
-                if recognize_stream:
-                    recognize_stream.close()
+                print(f"Speech gate: {speech_gate.metrics()}")
+                print(f"Broadcaster: {broadcaster.metrics()}")
+                print(f"Admission: {admission.metrics()}")
+                print(f"LLM usage: {llm_handler.usage.metrics()}")
+                if response_cache:
+                    print(f"Response cache: {response_cache.metrics()}")
+                if budget:
+                    print(f"Token budget: {budget.metrics()}")
+                if llm_router:
+                    print(f"LLM router: {llm_router.metrics()}")
+                if llm_cascade:
+                    print(f"Model cascade: {llm_cascade.metrics()}")
+                print(f"Frames: {decoder.frames} media, {decoder.parsed} parsed")
+                if session is not None:
+                    await ingest_audio(session, decoder.flush())
+                    await end_session(session, broadcast_task)
+                    session = None
                 
-    except websockets.ConnectionClosed:
+    except WebSocketDisconnect:
         print("Connection Closed")
         
     finally:
-        connected_clients.remove(websocket)
+        if session is not None:
+            await ingest_audio(session, decoder.flush())
+            await end_session(session, broadcast_task)
+
+# Function to hand a batch of decoded media to the recognizer and the analysis pipeline
+async def ingest_audio(session, audio):
+    if not audio:
+        return
+
+    # Send media packets to the recognizer, queued as a copy since the decoder reuses its buffer
+    session.recognizer.write(bytes(audio))
+
+    # Calls in keyword mode are only screened from the streaming transcripts
+    if session.pipeline is None:
+        return
+
+    # Buffer the audio and analyse every utterance as soon as it is complete
+    session.audio_buffer.write(audio)
+    for window in session.audio_buffer.windows():
+        for segment in session.vad.push(decode_mulaw(window)):
+            await asyncio.to_thread(session.pipeline.submit, (session.next_chunk_index(), segment))
+
+# Function to finish the analysis of a call and forget its session
+async def end_session(session, broadcast_task):
+    # The session may have failed before its recognizer was started
+    if session.recognizer is not None:
+        session.recognizer.close()
+
+    if session.pipeline is not None:
+        # Analyse the tail of the call
+        window = session.audio_buffer.flush()
+        segments = session.vad.push(decode_mulaw(window)) if window else []
+        for segment in segments + session.vad.flush():
+            await asyncio.to_thread(session.pipeline.submit, (session.next_chunk_index(), segment))
+
+        # Wait for the chunks still in flight
+        await asyncio.to_thread(session.pipeline.close)
 
-# Setup WebSocket route
-async def websocket_handler(websocket, path):
-    connected_clients.add(websocket)
-    await handle_connection(websocket, path)
+    # Wait for the transcripts still in flight
+    if broadcast_task is not None:
+        await broadcast_task
+
+    sessions.remove(session.stream_sid)
+    admission.release(session.call_id)
+    if budget:
+        budget.release(session.call_id)
+    await asyncio.to_thread(supervisor.report_call_finished, session.call_id)
+    print(f"Call {session.call_id} verdict: {session.verdict}")
+
+# Media stream route, Twilio connects here
+async def media_stream(websocket):
+    await websocket.accept()
+    await handle_connection(websocket)
+
+# Subscribers connect to /subscribe for every call or /subscribe/<callSid> for a single call
+async def subscribe(websocket):
+    await websocket.accept()
+    call_id = websocket.path_params.get('call_id')
+
+    # With several workers a call's events are only published by the worker it is pinned to
+    # The pins live in the supervisor's manager process, the lookup is a round trip to it
+    owner = await asyncio.to_thread(supervisor.call_owner, call_id)
+    if owner is not None and owner != supervisor.worker_index():
+        await websocket.send_json({'event': 'error', 'callId': call_id, 'text': f'call is served by worker {owner}'})
+        await websocket.close()
+        return
+
+    subscriber = broadcaster.subscribe(websocket.send_text, call_id=call_id)
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await broadcaster.unsubscribe(subscriber)
+
+# Load of this worker and, under the supervisor, of every worker
+async def workers(request):
+    return JSONResponse({
+        'worker': supervisor.worker_index(),
+        'active_calls': len(sessions),
+        'workers': supervisor.worker_load(),
+        'admission': admission.metrics(),
+        'llm_usage': llm_handler.usage.metrics(),
+        'response_cache': response_cache.metrics() if response_cache else None,
+        'token_budget': budget.metrics() if budget else None,
+        'llm_router': llm_router.metrics() if llm_router else None,
+        'model_cascade': llm_cascade.metrics() if llm_cascade else None,
+    })
 
 # Serve static files for frontend
-@app.route('/')
-def index():
-    return send_from_directory('public', 'index.html')
+async def index(request):
+    return FileResponse('public/index.html')
 
-@app.route('/', methods=['POST'])
-def handle_post():
+async def handle_post(request):
     response = f"""
     <Response>
       <Start>
-        <Stream url="wss://{request.host}/"/>
+        <Stream url="wss://{request.headers['host']}/"/>
       </Start>
       <Say>I will stream the next 60 seconds of audio through your websocket</Say>
       <Pause length="60" />
     </Response>
     """
-    return response, 200, {'Content-Type': 'text/xml'}
+    return Response(response, media_type='text/xml')
 
-# Function to process audio stream
-def process_audio_stream(audio_stream):
-    audio = AudioSegment.from_file(io.BytesIO(audio_stream), format="wav")
-    chunk_length_ms = 10 * 1000  # 10 seconds in milliseconds
-    for i, chunk_start in enumerate(range(0, len(audio), chunk_length_ms)):
-        chunk = audio[chunk_start:chunk_start + chunk_length_ms]
-        
-        buffer = io.BytesIO()
-        buffer.name = f"chunk_{i+1}.wav"
-        chunk.export(buffer, format="wav")
-        buffer.seek(0)
-        
-        transcription, cost, language = speech_to_text_handler.transcribe_buffer(buffer)
+# Every STT worker reuses its own WAV buffer
+thread_state = threading.local()
+
+# Function to store a verdict in Firebase and send it to the subscribers of the call
+def publish_verdict(session, i, response_message):
+    session.verdict = response_message
+
+    # The app reads the Decision/Reasoning/Action text, code reads the structured verdict
+    verdict = parse_verdict(response_message)
+    text = verdict.to_text() if verdict.decision else response_message
+
+    # Every call has its own keys, the top level keys keep the latest verdict for the app, all in one update
+    firebase_handler.add_data({
+        session.firebase_key('Response'): text,
+        'Response': text,
+        session.firebase_key('Verdict'): verdict.to_dict(),
+        'Verdict': verdict.to_dict(),
+    })
+    broadcaster.publish_threadsafe(session.call_id, {'event': 'verdict', 'chunk': i, 'text': text, 'verdict': verdict.to_dict()})
+
+# Function to publish the decision of a chunk while its reasoning and action are still being generated
+def publish_decision(session, i, decision):
+    # The app reads the decision from the first line of the response
+    firebase_handler.update_value(key=session.firebase_key('Response'), value=f'Decision: {decision}\n')
+    firebase_handler.update_value(key='Response', value=f'Decision: {decision}\n')
+    broadcaster.publish_threadsafe(session.call_id, {'event': 'decision', 'chunk': i, 'decision': decision})
+
+# Function to create the STT -> LLM -> Firebase pipeline for one call
+def create_pipeline(session, gate):
+    def transcribe_chunk(chunk):
+        i, segment = chunk
+        if not gate.check(segment):
+            return None
+
+        if not hasattr(thread_state, 'wav_writer'):
+            thread_state.wav_writer = WavWriter()
+        buffer = thread_state.wav_writer.write(segment, session.sample_rate, name=f"chunk_{i}.wav")
+
+        with admission.provider_request('stt'):
+            transcription, cost, language = speech_to_text_handler.transcribe_buffer(buffer)
         if len(transcription.split()) < 10:
-            continue
-        
-        messages.append({"role": "user", "content": f"Chunk {i+1}: {transcription}"})
-        response_message, cost, role, model, completion_tokens, prompt_tokens = llm_handler.send_text(
-            messages,
-            model=llm_model
-        )
-        
-        firebase_handler.update_value(key='Response', value=response_message)
-        messages.append({"role": role, "content": response_message})
-        
-        print(f"Chunk {i+1} processed:")
+            return None
+
+        return i, transcription
+
+    def analyse_chunk(chunk):
+        i, transcription = chunk
+
+        session.messages.append({"role": "user", "content": f"Chunk {i}: {transcription}"})
+        try:
+            with admission.provider_request('llm'):
+                if stream_llm:
+                    response_message, cost, role, model, completion_tokens, prompt_tokens = llm_client.send_text_stream(
+                        session.messages,
+                        model=session.model or chunk_model,
+                        user_id=session.call_id,
+                        on_decision=lambda decision: publish_decision(session, i, decision)
+                    )
+                else:
+                    response_message, cost, role, model, completion_tokens, prompt_tokens = llm_client.send_text(
+                        session.messages,
+                        model=session.model or chunk_model,
+                        user_id=session.call_id
+                    )
+        except BudgetExceededError as e:
+            logging.warning(f"Call {session.call_id} chunk {i} not analysed: {str(e)}")
+            return None
+        session.messages.append({"role": role, "content": response_message})
+        session.verdict = response_message
+
+        return i, transcription, response_message
+
+    def persist_chunk(chunk):
+        i, transcription, response_message = chunk
+
+        publish_verdict(session, i, response_message)
+
+        print(f"Call {session.call_id} chunk {i} processed:")
         print(f"Transcription: {transcription}")
         print(f"LLM Response: {response_message}")
         print("----------------------------------")
         print()
 
-# Start the Flask server
-if __name__ == '__main__':
-    def start_websocket_server():
-        asyncio.get_event_loop().run_until_complete(
-            websockets.serve(websocket_handler, "localhost", 8080)
-        )
-        asyncio.get_event_loop().run_forever()
-    
-    # Run WebSocket server in a separate thread
-    ws_thread = threading.Thread(target=start_websocket_server)
-    ws_thread.start()
-    
-    # Run Flask server
-    app.run(port=8080)
+        return chunk
+
+    return ChunkPipeline([
+        Stage('stt', transcribe_chunk, workers=stt_workers),
+        Stage('llm', analyse_chunk),
+        Stage('persist', persist_chunk),
+    ], queue_size=queue_size)
+
+# Function to process audio stream
+def process_audio_stream(audio_stream, call_id='upload'):
+    audio = AudioSegment.from_file(io.BytesIO(audio_stream), format="wav").set_channels(1).set_sample_width(2)
+    samples = np.frombuffer(audio.raw_data, dtype=np.int16)
+    session = CallSession(call_id, new_messages(structured_verdict), sample_rate=audio.frame_rate, vad_settings=vad_settings)
+    gate = SpeechGate(sample_rate=audio.frame_rate, vad=session.vad, **gate_settings)
+    pipeline = create_pipeline(session, gate)
+    pipeline.run(enumerate(session.vad.segment(samples), start=1))
+    return session.verdict
+
+# Providers whose connections are opened when a worker starts
+prewarm_providers = [provider.strip() for provider in config.get('Transport', 'prewarm', fallback='openai').split(',') if provider.strip()]
+
+# Every worker opens its own provider connections before the first call, and closes them on shutdown
+@asynccontextmanager
+async def lifespan(app):
+    if prewarm_providers:
+        await asyncio.to_thread(transport.prewarm, prewarm_providers)
+    yield
+    transport.close_http_client()
+
+# One ASGI application serves the TwiML webhook, the frontend and the websockets on a single event loop
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/', index, methods=['GET']),
+    Route('/', handle_post, methods=['POST']),
+    WebSocketRoute('/', media_stream),
+    WebSocketRoute('/subscribe', subscribe),
+    WebSocketRoute('/subscribe/{call_id}', subscribe),
+    Route('/workers', workers, methods=['GET']),
+])